@@ -44,7 +44,8 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
-    list_display = ['image_tag', 'description']
+    list_display = ['image_tag', 'description', 'processing_status']
+    list_filter = ['processing_status']
     readonly_fields = ['image_tag']
 
     def image_tag(self, obj):
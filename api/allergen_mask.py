@@ -0,0 +1,79 @@
+from django.db.models import Exists, F, OuterRef, Value
+from django.db.models.lookups import Exact
+
+from api.models.ingredients import Ingredient
+from api.models.pizza import Pizza
+
+# Allergen n (by id) is bit n - 1 of Pizza.allergen_mask, a signed 64 bit integer.
+# Allergens past MAX_MASKED_ID are filtered with an EXISTS subquery instead.
+MAX_MASKED_ID = 63
+
+
+def allergen_bit(allergen_id):
+    return 1 << (allergen_id - 1) if allergen_id is not None and 0 < allergen_id <= MAX_MASKED_ID else 0
+
+
+def compute_masks(pizza_ids):
+    """
+    Returns ``{pizza id: mask}`` from the allergens of the pizza ingredients, with one query.
+    """
+    masks = dict.fromkeys(pizza_ids, 0)
+    links = Pizza.ingredients.through.objects.filter(
+        pizza_id__in=masks, ingredient__allergens__isnull=False,
+    ).values_list('pizza_id', 'ingredient__allergens')
+    for pizza_id, allergen_id in links:
+        masks[pizza_id] |= allergen_bit(allergen_id)
+    return masks
+
+
+def refresh_allergen_masks(pizza_ids):
+    """
+    Recomputes the mask of the given pizzas, in the current transaction: a "safe for me"
+    query must never see a pizza whose new allergens are not in its mask yet.
+    """
+    pizza_ids = list(set(pizza_ids))
+    for start in range(0, len(pizza_ids), 500):
+        masks = compute_masks(pizza_ids[start:start + 500])
+        current = dict(Pizza.objects.filter(id__in=masks).values_list('id', 'allergen_mask'))
+        Pizza.objects.bulk_update([Pizza(id=pizza_id, allergen_mask=mask) for pizza_id, mask in masks.items()
+                                   if pizza_id in current and current[pizza_id] != mask], ['allergen_mask'])
+    return pizza_ids
+
+
+def pizza_ids_with_ingredients(ingredient_ids):
+    return list(Pizza.ingredients.through.objects.filter(ingredient_id__in=ingredient_ids)
+                .values_list('pizza_id', flat=True).distinct())
+
+
+def m2m_masked_pizza_ids(sender, instance, reverse, pk_set):
+    if sender is Pizza.ingredients.through:
+        return list(pk_set or ()) if reverse else [instance.pk]
+    # Ingredient.allergens.through
+    return pizza_ids_with_ingredients(pk_set or () if reverse else [instance.pk])
+
+
+def linked_pizza_ids(sender, instance, reverse):
+    """
+    Pizzas whose mask depends on the links of ``instance`` through ``sender``, read
+    before the links are cleared or deleted.
+    """
+    if sender is Pizza.ingredients.through:
+        return pizza_ids_with_ingredients([instance.pk]) if reverse else [instance.pk]
+    return pizza_ids_with_ingredients(instance.ingredients.values('id') if reverse else [instance.pk])
+
+
+def allergen_free(allergen_ids):
+    """
+    Condition on Pizza keeping the pizzas without any of the allergens: a bitwise test
+    on the pizza row, plus an EXISTS subquery for the allergens past MAX_MASKED_ID.
+    """
+    mask = 0
+    for allergen_id in allergen_ids:
+        mask |= allergen_bit(allergen_id)
+    conditions = [Exact(F('allergen_mask').bitand(mask), Value(0))] if mask else []
+    unmasked = [allergen_id for allergen_id in allergen_ids if not allergen_bit(allergen_id)]
+    if unmasked:
+        allergic = Ingredient.allergens.through.objects.filter(allergen_id__in=unmasked).values('ingredient_id')
+        conditions.append(~Exists(Pizza.ingredients.through.objects.filter(
+            pizza_id=OuterRef('pk'), ingredient_id__in=allergic)))
+    return conditions
@@ -1,13 +1,22 @@
+from django.conf import settings
 from ninja import NinjaAPI
+from ninja.constants import NOT_SET
 
-from user_auth.security import JWTAuth
+from user_auth.security import APIKeyAuth, AsyncAPIKeyAuth, AsyncJWTAuth, JWTAuth
+from .instrumentation import TimedJSONRenderer
 from .views.pizza import router as pizza_router
 from .views.ingredients import router as ingredient_router
 from .views.image import router as image_router
 from .views.category import router as category_router
+from .views.search import router as search_router
+from .views.catalog_async import router as async_catalog_router
+from .views.export import router as export_router
+from .views.catalog_import import router as import_router
 
 api = NinjaAPI(
     # auth=JWTAuth(),
+    auth=[APIKeyAuth(), JWTAuth()] if settings.CATALOG_AUTH_REQUIRED else NOT_SET,
+    renderer=TimedJSONRenderer(),
     title="Pizza API",
     version="1.0.0",
     description="API to manage pizza and ingredients",
@@ -26,6 +35,13 @@ api.add_router("/pizzas/", pizza_router, tags=["Pizzas"])
 api.add_router("/ingredients/", ingredient_router, tags=["Ingrédients"])
 api.add_router("/categories/", category_router, tags=["Catégories"])
 api.add_router("/images/", image_router, tags=["Images"])
+api.add_router("/search/", search_router, tags=["Recherche"])
+api.add_router("/export/", export_router, tags=["Export"])
+api.add_router("/import/", import_router, tags=["Import"])
+
+if settings.ASYNC_CATALOG_VIEWS:
+    api.add_router("/async/", async_catalog_router, tags=["Async"],
+                   auth=[AsyncAPIKeyAuth(), AsyncJWTAuth()] if settings.CATALOG_AUTH_REQUIRED else NOT_SET)
 
 
 # Gestionnaire global d'exceptions
@@ -6,6 +6,8 @@ class PizzaAppConfig(AppConfig):
 
     def ready(self):
         from django.conf import settings
+        from . import signals  # noqa: F401
+
         if settings.DEBUG:
             print("The application is in development mode.")
         else:
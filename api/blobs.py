@@ -0,0 +1,147 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+
+from api.models.image import Image, ImageBlob
+
+BLOB_DIR = 'blobs'
+BATCH_SIZE = 500
+
+
+def blob_name(sha256, extension):
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension.lower()}'
+
+
+def temporary_path(extension=''):
+    """
+    New empty file in the store's temporary directory, on the same file system as the blobs
+    so that interning it is a rename.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, BLOB_DIR, 'tmp')
+    os.makedirs(directory, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(suffix=extension, dir=directory)
+    os.close(descriptor)
+    return path
+
+
+def store(file, name):
+    """
+    Copies an uploaded file into the store, hashing it on the way, and returns its blob.
+    """
+    extension = os.path.splitext(name)[1]
+    path = temporary_path(extension)
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as output:
+        for chunk in file.chunks():
+            sha256.update(chunk)
+            size += len(chunk)
+            output.write(chunk)
+    return intern(path, sha256.hexdigest(), size, extension)
+
+
+def intern(path, sha256, size, extension):
+    """
+    Moves the file at ``path`` under its digest, or drops it when the same bytes are
+    already stored, and returns the blob.
+    """
+    blob = ImageBlob.objects.filter(sha256=sha256).first()
+    if blob is not None and os.path.exists(os.path.join(settings.MEDIA_ROOT, blob.path)):
+        os.remove(path)
+        return blob
+
+    name = blob.path if blob is not None else blob_name(sha256, extension)
+    destination = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(path, destination)
+    if blob is None:
+        try:
+            blob, _ = ImageBlob.objects.get_or_create(sha256=sha256, defaults={'path': name, 'size': size})
+        except IntegrityError:
+            blob = ImageBlob.objects.get(sha256=sha256)
+    return blob
+
+
+def attach(image):
+    """
+    Points ``image`` at the blob of its file. New uploads are stored first; paths outside
+    the store (images saved before it existed) are left as they are, without a blob.
+    """
+    if not image.image._committed:
+        blob = store(image.image, image.image.name)
+        image.image = blob.path
+    else:
+        blob = ImageBlob.objects.filter(path=image.image.name).first()
+    image.blob = blob
+
+
+def processed_derivatives(sha256, exclude=None):
+    """
+    Derivatives already rendered for the same bytes by another image, if any.
+    """
+    if sha256 is None:
+        return None
+    images = Image.objects.filter(blob_id=sha256, processing_status='ready').exclude(pk=exclude)
+    for derivatives in images.values_list('derivatives', flat=True)[:5]:
+        if derivatives:
+            return derivatives
+    return None
+
+
+def acquire(sha256):
+    if sha256 is not None:
+        ImageBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+
+
+def release(sha256):
+    if sha256 is not None:
+        ImageBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') - 1)
+
+
+def unlink(paths):
+    """
+    Removes media files, ignoring the ones already gone. Returns the number removed.
+    """
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(os.path.join(settings.MEDIA_ROOT, path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def blob_files(sha256, path):
+    """
+    The blob file and the derivatives rendered from it, which are named after it.
+    """
+    basename = os.path.basename(path)
+    derivatives = settings.IMAGE_PROCESSING['DERIVATIVES']
+    return [path, *(os.path.join('derivatives', derivative, basename) for derivative in derivatives)]
+
+
+def collect_blobs(batch_size=BATCH_SIZE, remove=unlink):
+    """
+    Deletes the blobs no image references anymore, in batches, and passes their files
+    to ``remove``. Returns the number of blobs removed.
+    """
+    referenced = Image.objects.filter(blob__isnull=False).values('blob')
+    orphans = ImageBlob.objects.filter(ref_count__lte=0).exclude(sha256__in=referenced)
+    removed = 0
+    while True:
+        batch = list(orphans.values_list('sha256', 'path')[:batch_size])
+        if not batch:
+            return removed
+        digests = {sha256 for sha256, _ in batch}
+        # Re-checked in the delete so that a blob attached in the meantime is kept.
+        ImageBlob.objects.filter(sha256__in=digests, ref_count__lte=0).exclude(sha256__in=referenced).delete()
+        deleted = digests - set(ImageBlob.objects.filter(sha256__in=digests).values_list('sha256', flat=True))
+        remove([file for sha256, path in batch if sha256 in deleted for file in blob_files(sha256, path)])
+        removed += len(deleted)
+        if len(batch) < batch_size:
+            return removed
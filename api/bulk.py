@@ -0,0 +1,227 @@
+from django.db import transaction
+from django.utils import timezone
+from pydantic import ValidationError
+
+from api.allergen_mask import refresh_allergen_masks
+from api.cache import invalidate_catalog
+from api.pricing import refresh_ingredient_costs
+from api.models.category import Category
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza, PizzaHistory
+from api.read_model import schedule_rebuild
+from api.schemas.ingredients import IngredientCreateSchema, IngredientUpdateSchema
+from api.schemas.pizza import PizzaCreateSchema, PizzaUpdateSchema
+from api.search import schedule_reindex
+
+PIZZA_FIELDS = ('name', 'description', 'price', 'vegetarian', 'available')
+INGREDIENT_FIELDS = ('name', 'description', 'type')
+
+
+class BulkResult:
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.errors = []
+
+    def error(self, index, detail, field=None):
+        self.errors.append({'index': index, 'field': field, 'detail': detail})
+
+
+def validate_items(items, create_schema, update_schema, result):
+    """
+    Validates every item, those with an ``id`` as updates. Returns ``[(index, id, data)]``
+    of the valid ones, ``data`` holding the fields that were sent.
+    """
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            result.error(index, "Expected an object")
+            continue
+        item_id = item.get('id')
+        if item_id is not None and not isinstance(item_id, int):
+            result.error(index, "Must be an integer", 'id')
+            continue
+        schema = update_schema if item_id is not None else create_schema
+        try:
+            data = schema.model_validate({key: value for key, value in item.items() if key != 'id'})
+        except ValidationError as exc:
+            for error in exc.errors():
+                result.error(index, error['msg'], '.'.join(str(part) for part in error['loc']) or None)
+            continue
+        valid.append((index, item_id, data.model_dump(mode='json', exclude_unset=item_id is not None)))
+    return valid
+
+
+def existing_ids(model, ids, **filters):
+    if not ids:
+        return set()
+    return set(model.objects.filter(id__in=set(ids), **filters).values_list('id', flat=True))
+
+
+def check_references(valid, field, known, result):
+    for index, _, data in valid:
+        missing = sorted(set(data.get(field) or ()) - known)
+        if missing:
+            result.error(index, f"Unknown ids: {missing}", field)
+
+
+def allergen_ids(names):
+    """
+    Returns ``{name: id}`` of the allergens, creating the missing ones.
+    """
+    allergens = dict(Allergen.objects.filter(name__in=names).values_list('name', 'id'))
+    created = Allergen.objects.bulk_create([Allergen(name=name) for name in sorted(set(names) - set(allergens))])
+    allergens.update((allergen.name, allergen.id) for allergen in created)
+    return allergens
+
+
+def replace_links(through, owner_field, target_field, links, replaced_owner_ids):
+    """
+    Replaces the m2m rows of the owners in ``replaced_owner_ids`` and adds ``links``,
+    an iterable of ``(owner id, target id)``.
+    """
+    if replaced_owner_ids:
+        through.objects.filter(**{f'{owner_field}__in': replaced_owner_ids}).delete()
+    through.objects.bulk_create([
+        through(**{owner_field: owner_id, target_field: target_id})
+        for owner_id, target_id in dict.fromkeys(links)
+    ])
+
+
+def bulk_save_pizzas(items):
+    """
+    Creates (items without ``id``) and updates (items with one) pizzas in one
+    transaction, with one query per referenced model. Nothing is written when an
+    item is invalid: the result then only holds the errors.
+    """
+    result = BulkResult()
+    valid = validate_items(items, PizzaCreateSchema, PizzaUpdateSchema, result)
+
+    pizzas = Pizza.objects.filter(is_deleted=False).in_bulk({item_id for _, item_id, _ in valid if item_id})
+    ingredient_types = dict(Ingredient.objects.filter(
+        id__in={ingredient_id for _, _, data in valid for ingredient_id in data.get('ingredients') or ()}
+    ).values_list('id', 'type'))
+    for index, item_id, data in valid:
+        if item_id is not None and item_id not in pizzas:
+            result.error(index, f"Pizza {item_id} not found", 'id')
+    check_references(valid, 'ingredients', set(ingredient_types), result)
+    check_references(valid, 'categories', existing_ids(
+        Category, [category_id for _, _, data in valid for category_id in data.get('categories') or ()],
+        is_deleted=False), result)
+    check_references(valid, 'custom_images', existing_ids(
+        Image, [image_id for _, _, data in valid for image_id in data.get('custom_images') or ()]), result)
+    for index, item_id, data in valid:
+        vegetarian = data.get('vegetarian', pizzas[item_id].vegetarian if item_id in pizzas else False)
+        if vegetarian and any(ingredient_types.get(ingredient_id) == 'meat'
+                              for ingredient_id in data.get('ingredients') or ()):
+            result.error(index, "Vegetarian pizza cannot contain meat ingredients.", 'ingredients')
+    if result.errors:
+        return result
+
+    now = timezone.now()
+    with transaction.atomic():
+        created = Pizza.objects.bulk_create([
+            Pizza(**{field: data[field] for field in PIZZA_FIELDS}) for _, item_id, data in valid if item_id is None
+        ])
+        created_ids = iter(pizza.id for pizza in created)
+        owner_ids = [item_id if item_id is not None else next(created_ids) for _, item_id, _ in valid]
+
+        updates = [(pizzas[item_id], data) for _, item_id, data in valid if item_id is not None]
+        PizzaHistory.objects.bulk_create([
+            PizzaHistory(pizza=pizza, **{field: getattr(pizza, field) for field in PIZZA_FIELDS})
+            for pizza, _ in updates
+        ])
+        fields = {field for _, data in updates for field in PIZZA_FIELDS if data.get(field) is not None}
+        for pizza, data in updates:
+            for field in fields:
+                if data.get(field) is not None:
+                    setattr(pizza, field, data[field])
+            pizza.last_modified = now
+        if updates:
+            Pizza.objects.bulk_update([pizza for pizza, _ in updates], [*fields, 'last_modified'])
+
+        for field, through, target_field in (('ingredients', Pizza.ingredients.through, 'ingredient_id'),
+                                             ('categories', Pizza.category.through, 'category_id'),
+                                             ('custom_images', Pizza.custom_images.through, 'image_id')):
+            replace_links(
+                through, 'pizza_id', target_field,
+                [(owner_id, target_id) for owner_id, (_, _, data) in zip(owner_ids, valid)
+                 for target_id in data.get(field) or ()],
+                [item_id for _, item_id, data in valid if item_id is not None and data.get(field) is not None],
+            )
+
+        # Links written in bulk send no m2m_changed.
+        refresh_allergen_masks(owner_ids)
+        refresh_ingredient_costs(owner_ids)
+        schedule_rebuild(owner_ids)
+        schedule_reindex([('pizza', pizza_id) for pizza_id in owner_ids])
+        transaction.on_commit(invalidate_catalog)
+
+    result.created = [pizza.id for pizza in created]
+    result.updated = [pizza.id for pizza, _ in updates]
+    return result
+
+
+def bulk_save_ingredients(items):
+    """
+    Same as ``bulk_save_pizzas`` for ingredients. Allergens are given by name and
+    created when they do not exist yet.
+    """
+    result = BulkResult()
+    valid = validate_items(items, IngredientCreateSchema, IngredientUpdateSchema, result)
+
+    ingredients = Ingredient.objects.in_bulk({item_id for _, item_id, _ in valid if item_id})
+    for index, item_id, data in valid:
+        if item_id is not None and item_id not in ingredients:
+            result.error(index, f"Ingredient {item_id} not found", 'id')
+    check_references(valid, 'images', existing_ids(
+        Image, [image_id for _, _, data in valid for image_id in data.get('images') or ()]), result)
+    if result.errors:
+        return result
+
+    with transaction.atomic():
+        allergens = allergen_ids({name for _, _, data in valid for name in data.get('allergens') or ()})
+
+        created = Ingredient.objects.bulk_create([
+            Ingredient(**{field: data[field] for field in INGREDIENT_FIELDS})
+            for _, item_id, data in valid if item_id is None
+        ])
+        created_ids = iter(ingredient.id for ingredient in created)
+        owner_ids = [item_id if item_id is not None else next(created_ids) for _, item_id, _ in valid]
+
+        updates = [(ingredients[item_id], data) for _, item_id, data in valid if item_id is not None]
+        fields = {field for _, data in updates for field in INGREDIENT_FIELDS if data.get(field) is not None}
+        for ingredient, data in updates:
+            for field in fields:
+                if data.get(field) is not None:
+                    setattr(ingredient, field, data[field])
+        if updates and fields:
+            Ingredient.objects.bulk_update([ingredient for ingredient, _ in updates], list(fields))
+
+        replace_links(
+            Ingredient.allergens.through, 'ingredient_id', 'allergen_id',
+            [(owner_id, allergens[name]) for owner_id, (_, _, data) in zip(owner_ids, valid)
+             for name in data.get('allergens') or ()],
+            [item_id for _, item_id, data in valid if item_id is not None and data.get('allergens') is not None],
+        )
+        replace_links(
+            Ingredient.images.through, 'ingredient_id', 'image_id',
+            [(owner_id, image_id) for owner_id, (_, _, data) in zip(owner_ids, valid)
+             for image_id in data.get('images') or ()],
+            [item_id for _, item_id, data in valid if item_id is not None and data.get('images') is not None],
+        )
+
+        # New ingredients are not on any pizza yet, updated ones are embedded in their pizzas.
+        updated_ids = [ingredient.id for ingredient, _ in updates]
+        pizza_ids = list(Pizza.ingredients.through.objects.filter(ingredient_id__in=updated_ids)
+                         .values_list('pizza_id', flat=True).distinct()) if updated_ids else []
+        refresh_allergen_masks(pizza_ids)
+        schedule_rebuild(pizza_ids)
+        schedule_reindex([('ingredient', ingredient_id) for ingredient_id in owner_ids]
+                         + [('pizza', pizza_id) for pizza_id in pizza_ids])
+        transaction.on_commit(invalidate_catalog)
+
+    result.created = [ingredient.id for ingredient in created]
+    result.updated = updated_ids
+    return result
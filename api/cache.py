@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.metrics import CACHE_REQUESTS
+
+VERSION_KEY = 'catalog:version'
+# Lost timestamps are taken again, later: only clients' If-Modified-Since get fewer 304s.
+MODIFIED_TIMEOUT = 24 * 60 * 60
+
+
+class SharedVersion:
+    """
+    Catalog version kept in a Django cache alias, so that a write made by one worker
+    invalidates the entries of all the workers that use the same cache.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def get(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # Seeded from the clock so that an evicted version never reuses old keys.
+            self.cache.add(VERSION_KEY, int(time.time()), None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    def bump(self):
+        try:
+            return self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.get()
+            return self.cache.incr(VERSION_KEY)
+
+    def modified(self):
+        """
+        When the current version was first seen, an upper bound of the time of the
+        catalog writes it covers: the Last-Modified of every catalog response.
+        """
+        version = self.get()
+        key = f'{VERSION_KEY}:{version}:modified'
+        modified = self.cache.get(key)
+        if modified is None:
+            # Whole seconds, as in HTTP dates, and always after the previous versions'.
+            modified = timezone.now().replace(microsecond=0) + timedelta(seconds=1)
+            latest = self.cache.get(f'{VERSION_KEY}:modified')
+            if latest is not None and latest >= modified:
+                modified = latest + timedelta(seconds=1)
+            if self.cache.add(key, modified, MODIFIED_TIMEOUT):
+                self.cache.set(f'{VERSION_KEY}:modified', modified, MODIFIED_TIMEOUT)
+            modified = self.cache.get(key)
+        return modified
+
+
+class LRUBackend:
+    """
+    In-process backend: every worker keeps its own entries, for at most ``timeout``
+    seconds. The version is shared through the ``alias`` cache, so writes made by
+    other workers invalidate them as long as that cache is shared too.
+    """
+
+    def __init__(self, max_entries=512, alias='default', timeout=300, **kwargs):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.version = SharedVersion(alias)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self):
+        return self.version.get()
+
+    def bump_version(self):
+        version = self.version.bump()
+        with self._lock:
+            # Entries of older versions can no longer be reached.
+            self._entries.clear()
+        return version
+
+
+class DjangoCacheBackend:
+    """
+    Backend built on a Django cache alias, shared by every worker that uses the same cache.
+    """
+
+    def __init__(self, alias='default', timeout=300, **kwargs):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.version = SharedVersion(alias)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def get_version(self):
+        return self.version.get()
+
+    def bump_version(self):
+        return self.version.bump()
+
+
+class CatalogCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, namespace, request, path_params=None):
+        params = [(key, value) for key, values in request.GET.lists() for value in values if value != '']
+        params += [(key, str(value)) for key, value in (path_params or {}).items()]
+        digest = hashlib.sha1(urlencode(sorted(params)).encode()).hexdigest()
+        return f'catalog:{self.backend.get_version()}:{namespace}:{digest}'
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_REQUESTS.inc(cache='catalog', result='miss' if value is None else 'hit')
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def invalidate(self):
+        return self.backend.bump_version()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'version': self.backend.get_version(),
+        }
+
+
+_catalog_cache = None
+
+
+def get_catalog_cache():
+    global _catalog_cache
+    if _catalog_cache is None:
+        options = dict(settings.CATALOG_CACHE)
+        backend_class = import_string(options.pop('BACKEND'))
+        _catalog_cache = CatalogCache(backend_class(**{key.lower(): value for key, value in options.items()}))
+    return _catalog_cache
+
+
+def invalidate_catalog():
+    get_catalog_cache().invalidate()
+
+
+def authenticate(run, request):
+    """
+    Runs the auth callbacks of the Ninja operation behind ``run`` and returns the error
+    response, or None. Ninja authenticates inside ``Operation.run``, so the wrappers that
+    answer without calling it (cache hits, 304) must call this first. Returns a coroutine
+    for async operations.
+    """
+    operation = inspect.unwrap(run).__self__
+    if not operation.auth_callbacks or getattr(request, '_catalog_authenticated', False):
+        return None
+    request._catalog_authenticated = True
+    return operation._run_authentication(request)
+
+
+async def aauthenticate(run, request):
+    error = authenticate(run, request)
+    return await error if error is not None else None
+
+
+def cached_response(namespace):
+    """
+    Caches the rendered response of a Ninja operation, to be used with ``decorate_view``.
+    Keys are built from the query string and path parameters plus the catalog version.
+    """
+
+    def lookup(request, kwargs):
+        cache = get_catalog_cache()
+        key = cache.make_key(namespace, request, kwargs)
+        entry = cache.get(key)
+        if entry is None:
+            return key, None
+        content, content_type = entry
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Cache'] = 'HIT'
+        return key, response
+
+    def store(key, response):
+        if response.status_code == 200 and not response.streaming:
+            get_catalog_cache().set(key, (response.content, response['Content-Type']))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def decorator(run):
+        if asyncio.iscoroutinefunction(run):
+            # The catalog version and the Django cache backends may do network I/O: kept off the event loop.
+            @wraps(run)
+            async def async_wrapper(request, **kwargs):
+                if request.method != 'GET':
+                    return await run(request, **kwargs)
+                error = await aauthenticate(run, request)
+                if error is not None:
+                    return error
+                key, response = await sync_to_async(lookup)(request, kwargs)
+                if response is not None:
+                    return response
+                return await sync_to_async(store)(key, await run(request, **kwargs))
+
+            return async_wrapper
+
+        @wraps(run)
+        def wrapper(request, **kwargs):
+            if request.method != 'GET':
+                return run(request, **kwargs)
+            error = authenticate(run, request)
+            if error is not None:
+                return error
+            key, response = lookup(request, kwargs)
+            if response is not None:
+                return response
+            return store(key, run(request, **kwargs))
+
+        return wrapper
+
+    return decorator
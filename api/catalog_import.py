@@ -0,0 +1,331 @@
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from pydantic import ValidationError
+
+from api.allergen_mask import refresh_allergen_masks
+from api.bulk import allergen_ids, replace_links
+from api.cache import invalidate_catalog
+from api.export import FORMATS, LIST_SEPARATOR, _batches
+from api.models.category import Category, rebuild_paths
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+from api.pricing import refresh_ingredient_costs
+from api.read_model import schedule_rebuild
+from api.schemas.category import CategoryCreateSchema
+from api.schemas.ingredients import AllergenCreateSchema, IngredientCreateSchema
+from api.schemas.pizza import PizzaCreateSchema
+from api.search import schedule_reindex
+
+BATCH_SIZE = 1000
+# Errors kept in the result, the others are only counted.
+MAX_ERRORS = 100
+# Columns holding lists, split on LIST_SEPARATOR in CSV files.
+LIST_COLUMNS = {'ingredients', 'categories', 'custom_images', 'allergens', 'images'}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, detail, field=None):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'field': field, 'detail': detail})
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'failed': self.failed, 'errors': self.errors}
+
+
+def open_source(fileobj, name, fmt=None):
+    """
+    Returns ``(stream, format)`` for an uploaded or local file, the format being
+    guessed from ``name`` when not given and ``.gz`` files decompressed on the fly.
+    """
+    base = name[:-3] if name.endswith('.gz') else name
+    fmt = fmt or base.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of: {', '.join(FORMATS)}")
+    return (gzip.GzipFile(fileobj=fileobj) if name.endswith('.gz') else fileobj), fmt
+
+
+def read_rows(stream, fmt):
+    """
+    Yields ``(line, row, error)`` for each record of a binary NDJSON or CSV stream,
+    read line by line.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    if fmt == 'ndjson':
+        for line, raw in enumerate(text, 1):
+            if not raw.strip():
+                continue
+            try:
+                row = json.loads(raw)
+            except ValueError as exc:
+                yield line, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield line, None, "Expected an object"
+                continue
+            yield line, row, None
+        return
+
+    reader = csv.DictReader(text)
+    for row in reader:
+        # Empty cells are left to the schema defaults.
+        row = {key: value for key, value in row.items() if key and value not in ('', None)}
+        for column in LIST_COLUMNS & row.keys():
+            row[column] = [item.strip() for item in row[column].split(LIST_SEPARATOR) if item.strip()]
+        yield reader.line_num, row, None
+
+
+def validate(batch, schema, result):
+    valid = []
+    for line, row in batch:
+        try:
+            valid.append((line, schema.model_validate(row).model_dump(mode='json')))
+        except ValidationError as exc:
+            for error in exc.errors():
+                result.error(line, error['msg'], '.'.join(str(part) for part in error['loc']) or None)
+    return valid
+
+
+def resolve_references(batch, field, model, result, **filters):
+    """
+    Replaces the names in ``row[field]`` lists by ids, digits being ids already,
+    with one query for the whole batch. Rows with an unknown name are dropped.
+    """
+    names = {ref for _, row in batch for ref in row.get(field) or () if isinstance(ref, str) and not ref.isdigit()}
+    ids = {}
+    if names:
+        for name, pk in model.objects.filter(name__in=names, **filters).order_by('-id').values_list('name', 'id'):
+            ids[name] = pk  # The oldest row wins when names are duplicated.
+    resolved = []
+    for line, row in batch:
+        refs = row.get(field)
+        if refs is not None:
+            if not isinstance(refs, list):
+                refs = [refs]
+            unknown = [ref for ref in refs if isinstance(ref, str) and not ref.isdigit() and ref not in ids]
+            if unknown:
+                result.error(line, f"Unknown names: {unknown}", field)
+                continue
+            row[field] = [ids[ref] if isinstance(ref, str) and not ref.isdigit() else ref for ref in refs]
+        resolved.append((line, row))
+    return resolved
+
+
+def check_ids(valid, field, model, result, **filters):
+    ids = {pk for _, data in valid for pk in data.get(field) or ()}
+    known = set(model.objects.filter(id__in=ids, **filters).values_list('id', flat=True)) if ids else set()
+    checked = []
+    for line, data in valid:
+        missing = sorted(set(data.get(field) or ()) - known)
+        if missing:
+            result.error(line, f"Unknown ids: {missing}", field)
+        else:
+            checked.append((line, data))
+    return checked
+
+
+def upsert_by_name(model, rows, fields, result, **filters):
+    """
+    Inserts or updates ``rows`` (dicts of ``fields``, last one wins for a name) matched
+    on ``name``. Returns ``{name: id}``.
+    """
+    rows = {row['name']: row for row in rows}
+    if model._meta.get_field('name').unique:
+        existing = set(model.objects.filter(name__in=rows).values_list('name', flat=True))
+        model.objects.bulk_create([model(**row) for row in rows.values()], update_conflicts=True,
+                                  unique_fields=['name'], update_fields=[field for field in fields if field != 'name'])
+        result.updated += len(existing)
+        result.created += len(rows) - len(existing)
+        return dict(model.objects.filter(name__in=rows).values_list('name', 'id'))
+
+    # Names are not unique on these tables: match the oldest row, then split inserts and updates.
+    ids = {}
+    for name, pk in model.objects.filter(name__in=rows, **filters).order_by('-id').values_list('name', 'id'):
+        ids[name] = pk
+    updates = [model(id=ids[name], **row) for name, row in rows.items() if name in ids]
+    if updates:
+        model.objects.bulk_update(updates, [field for field in fields if field != 'name'])
+    created = model.objects.bulk_create([model(**row) for name, row in rows.items() if name not in ids])
+    ids.update((obj.name, obj.id) for obj in created)
+    result.updated += len(updates)
+    result.created += len(created)
+    return ids
+
+
+def import_allergens(batch, result, state):
+    valid = validate(batch, AllergenCreateSchema, result)
+    upsert_by_name(Allergen, [data for _, data in valid], ('name', 'description'), result)
+    return []
+
+
+def ancestors(parents, pk):
+    while parents.get(pk) is not None:
+        pk = parents[pk]
+        yield pk
+
+
+def import_categories(batch, result, state):
+    # The parent is given by name (parent) or by id (parent_id), and linked once the batch is saved.
+    parent_names = {line: row.pop('parent') for line, row in batch if 'parent' in row}
+    valid = validate(batch, CategoryCreateSchema, result)
+    fields = ('name', 'description', 'is_active', 'updated_at')
+    ids = upsert_by_name(Category, [{field: data[field] for field in fields[:-1]} for _, data in valid],
+                         fields, result)
+
+    by_name = dict(Category.objects.filter(name__in=set(parent_names.values())).values_list('name', 'id'))
+    by_id = set(Category.objects.filter(id__in={data['parent_id'] for _, data in valid if data['parent_id']})
+                .values_list('id', flat=True))
+    # Loaded by the first batch, then kept up to date with the links and rows of the next ones.
+    if 'parents' not in state:
+        state['parents'] = dict(Category.objects.values_list('id', 'parent_id'))
+    parents = state['parents']
+    for pk in ids.values():
+        parents.setdefault(pk, None)
+    # Categories are embedded with their children: the pizzas of their old and new ancestors change too.
+    touched = set(ids.values())
+    touched.update(ancestor_id for pk in ids.values() for ancestor_id in ancestors(parents, pk))
+    links = []
+    for line, data in valid:
+        if line in parent_names:
+            parent_id = by_name.get(parent_names[line])
+        else:
+            parent_id = data['parent_id'] if data['parent_id'] in by_id else None
+        if parent_id is None and (line in parent_names or data['parent_id'] is not None):
+            result.error(line, f"Unknown parent category {parent_names.get(line, data['parent_id'])}", 'parent')
+            continue
+        category_id = ids[data['name']]
+        ancestor_id = parent_id
+        while ancestor_id is not None and ancestor_id != category_id:
+            ancestor_id = parents[ancestor_id]
+        if ancestor_id is not None:
+            result.error(line, "A category cannot be moved under itself or one of its descendants.", 'parent')
+            continue
+        parents[category_id] = parent_id
+        links.append(Category(id=category_id, parent_id=parent_id))
+    Category.objects.bulk_update(links, ['parent_id'])
+    # bulk_create and bulk_update skip Category.save(), which maintains the paths.
+    rebuild_paths()
+
+    touched.update(ancestor_id for pk in ids.values() for ancestor_id in ancestors(parents, pk))
+    pizza_ids = list(Pizza.category.through.objects.filter(category_id__in=touched)
+                     .values_list('pizza_id', flat=True).distinct())
+    schedule_rebuild(pizza_ids)
+    return [('category', pk) for pk in ids.values()]
+
+
+def import_ingredients(batch, result, state):
+    # cost is not part of IngredientCreateSchema.
+    costs = {}
+    for line, row in batch:
+        if 'cost' in row:
+            try:
+                costs[line] = Decimal(str(row.pop('cost')))
+            except InvalidOperation:
+                costs[line] = None
+                result.error(line, "Invalid cost", 'cost')
+    batch = [(line, row) for line, row in batch if costs.get(line, 0) is not None]
+    valid = check_ids(validate(batch, IngredientCreateSchema, result), 'images', Image, result)
+
+    fields = ('name', 'description', 'type')
+    rows = [{**{field: data[field] for field in fields}, **({'cost': costs[line]} if line in costs else {})}
+            for line, data in valid]
+    has_cost = any('cost' in row for row in rows)
+    ids = upsert_by_name(Ingredient, rows, fields + ('cost',) if has_cost else fields, result)
+
+    allergens = allergen_ids({name for _, data in valid for name in data['allergens']})
+    owners = [(ids[data['name']], data) for _, data in valid]
+    replace_links(Ingredient.allergens.through, 'ingredient_id', 'allergen_id',
+                  [(owner, allergens[name]) for owner, data in owners for name in data['allergens']],
+                  [owner for owner, _ in owners])
+    replace_links(Ingredient.images.through, 'ingredient_id', 'image_id',
+                  [(owner, image_id) for owner, data in owners for image_id in data['images']],
+                  [owner for owner, _ in owners])
+
+    owner_ids = [owner for owner, _ in owners]
+    pizza_ids = list(Pizza.ingredients.through.objects.filter(ingredient_id__in=owner_ids)
+                     .values_list('pizza_id', flat=True).distinct())
+    refresh_allergen_masks(pizza_ids)
+    refresh_ingredient_costs(pizza_ids)
+    schedule_rebuild(pizza_ids)
+    return [('ingredient', pk) for pk in owner_ids] + [('pizza', pk) for pk in pizza_ids]
+
+
+def import_pizzas(batch, result, state):
+    batch = resolve_references(batch, 'ingredients', Ingredient, result)
+    batch = resolve_references(batch, 'categories', Category, result, is_deleted=False)
+    valid = validate(batch, PizzaCreateSchema, result)
+    valid = check_ids(valid, 'ingredients', Ingredient, result)
+    valid = check_ids(valid, 'categories', Category, result, is_deleted=False)
+    valid = check_ids(valid, 'custom_images', Image, result)
+
+    meat = set(Ingredient.objects.filter(
+        id__in={pk for _, data in valid if data['vegetarian'] for pk in data['ingredients']}, type='meat',
+    ).values_list('id', flat=True))
+    checked = []
+    for line, data in valid:
+        if data['vegetarian'] and meat.intersection(data['ingredients']):
+            result.error(line, "Vegetarian pizza cannot contain meat ingredients.", 'ingredients')
+        else:
+            checked.append(data)
+
+    fields = ('name', 'description', 'price', 'vegetarian', 'available')
+    now = timezone.now()
+    ids = upsert_by_name(Pizza, [{**{field: data[field] for field in fields}, 'last_modified': now}
+                                 for data in checked], fields + ('last_modified',), result, is_deleted=False)
+    owners = [(ids[data['name']], data) for data in checked]
+    for field, through, target_field in (('ingredients', Pizza.ingredients.through, 'ingredient_id'),
+                                         ('categories', Pizza.category.through, 'category_id'),
+                                         ('custom_images', Pizza.custom_images.through, 'image_id')):
+        replace_links(through, 'pizza_id', target_field,
+                      [(owner, target) for owner, data in owners for target in data[field]],
+                      [owner for owner, _ in owners])
+
+    owner_ids = [owner for owner, _ in owners]
+    refresh_allergen_masks(owner_ids)
+    refresh_ingredient_costs(owner_ids)
+    schedule_rebuild(owner_ids)
+    return [('pizza', pk) for pk in owner_ids]
+
+
+IMPORTERS = {
+    'allergens': import_allergens,
+    'categories': import_categories,
+    'ingredients': import_ingredients,
+    'pizzas': import_pizzas,
+}
+
+
+def import_catalog(stream, entity, fmt, batch_size=BATCH_SIZE):
+    """
+    Upserts the records of a NDJSON or CSV stream into ``entity``, matched by name,
+    ``batch_size`` records per transaction. Invalid records are skipped and reported
+    with their line number; the stream is read as it goes, never as a whole.
+    """
+    result = ImportResult()
+    importer = IMPORTERS[entity]
+    # Shared by the batches of this import, for what an importer keeps from one batch to the next.
+    state = {}
+    for batch in _batches(read_rows(stream, fmt), batch_size):
+        rows = []
+        for line, row, error in batch:
+            if error is not None:
+                result.error(line, error)
+            else:
+                rows.append((line, row))
+        with transaction.atomic():
+            schedule_reindex(importer(rows, result, state))
+            transaction.on_commit(invalidate_catalog)
+    return result
@@ -0,0 +1,32 @@
+import threading
+
+from django.db import transaction
+
+
+class CommitQueue:
+    """
+    Collects keys while a transaction runs and hands them to ``flush`` once it commits.
+    Keys queued by several writes of the same transaction are flushed once.
+    Outside of a transaction, keys are flushed right away.
+    """
+
+    def __init__(self, flush):
+        self.flush = flush
+        self._local = threading.local()
+
+    def add(self, keys):
+        if not keys:
+            return
+        if not hasattr(self._local, 'keys'):
+            self._local.keys = set()
+        self._local.keys.update(keys)
+        transaction.on_commit(self._flush_pending)
+
+    def _flush_pending(self):
+        keys = getattr(self._local, 'keys', None)
+        if not keys:
+            return
+        # Keys left over by a rolled back transaction are flushed here as well,
+        # which only costs a redundant refresh from committed data.
+        self._local.keys = set()
+        self.flush(keys)
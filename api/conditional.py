@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from api.cache import aauthenticate, authenticate, get_catalog_cache
+from api.models.category import Category
+from api.models.pizza import Pizza
+
+
+# State functions: ``(last_modified, token)`` of what an operation renders, read with
+# one aggregate query and never by rendering the body, or None when it does not
+# exist. Both go into the ETag along with the catalog version, which covers the
+# embedded relations without a timestamp (ingredients, allergens, images).
+
+def pizzas_state(request, **kwargs):
+    state = Pizza.objects.aggregate(last_modified=Max('last_modified'), count=Count('id', filter=Q(is_deleted=False)))
+    return state['last_modified'], state['count']
+
+
+def pizza_state(request, pizza_id, **kwargs):
+    pizza = Pizza.objects.filter(id=pizza_id, is_deleted=False).values_list('last_modified', flat=True)
+    last_modified = pizza.first()
+    return (last_modified, pizza_id) if last_modified is not None else None
+
+
+def categories_state(request, **kwargs):
+    # Soft deletes and restores are saves, so they move updated_at too.
+    state = Category.objects.aggregate(last_modified=Max('updated_at'),
+                                       count=Count('id', filter=Q(is_deleted=False)))
+    return state['last_modified'], state['count']
+
+
+def category_state(request, category_id, **kwargs):
+    # Children are rendered too: any category of the table may be part of the payload.
+    if not Category.objects.filter(id=category_id, is_deleted=False).exists():
+        return None
+    last_modified, _ = categories_state(request)
+    return last_modified, category_id
+
+
+def ingredients_state(request, **kwargs):
+    # No timestamp on ingredients, and all their writes (deletes included) move the
+    # catalog version: the ETag is the version alone, read without a query.
+    return None, ''
+
+
+def conditional_response(namespace, state):
+    """
+    Answers ``If-None-Match`` / ``If-Modified-Since`` with a 304 before the operation
+    runs, to be used with ``decorate_view`` above ``cached_response``. The ETag is
+    built from the cache key of the request (query string, path parameters and catalog
+    version) and from ``state``; the operation runs as usual when ``state`` returns None.
+    Last-Modified is the time the current catalog version was first seen (see
+    SharedVersion.modified), since any catalog write, to a relation included, can change
+    what the operation renders. Validators are kept in the catalog cache under the same
+    key as the responses, which holds the version shared by the workers, so ``state``
+    runs once per catalog version and request, and a cache hit costs no query.
+    """
+
+    def validators(request, kwargs):
+        cache = get_catalog_cache()
+        key = cache.make_key(namespace, request, kwargs)
+        # Straight from the backend: these lookups are not counted as response cache hits.
+        memo = cache.backend.get(f'{key}:validators')
+        if memo is not None:
+            return memo
+        current = state(request, **kwargs)
+        if current is None:
+            return None, None
+        last_modified, token = current
+        stamp = last_modified.isoformat() if last_modified is not None else ''
+        etag = quote_etag(hashlib.sha1(f'{key}:{stamp}:{token}'.encode()).hexdigest())
+        modified = cache.backend.version.modified()
+        last_modified = max(last_modified, modified) if last_modified is not None else modified
+        cache.backend.set(f'{key}:validators', (etag, last_modified))
+        return etag, last_modified
+
+    def finish(etag, last_modified, response):
+        if response.status_code in (200, 304):
+            if etag is not None:
+                response.headers.setdefault('ETag', etag)
+            if last_modified is not None and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+            # Stored by the clients, but revalidated on each use.
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def not_modified(request, etag, last_modified):
+        if etag is None:
+            return None
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+    def decorator(run):
+        if asyncio.iscoroutinefunction(run):
+            @wraps(run)
+            async def async_wrapper(request, **kwargs):
+                if request.method != 'GET' or not settings.CONDITIONAL_REQUESTS:
+                    return await run(request, **kwargs)
+                error = await aauthenticate(run, request)
+                if error is not None:
+                    return error
+                etag, last_modified = await sync_to_async(validators)(request, kwargs)
+                response = not_modified(request, etag, last_modified)
+                if response is None:
+                    response = await run(request, **kwargs)
+                return finish(etag, last_modified, response)
+
+            return async_wrapper
+
+        @wraps(run)
+        def wrapper(request, **kwargs):
+            if request.method != 'GET' or not settings.CONDITIONAL_REQUESTS:
+                return run(request, **kwargs)
+            error = authenticate(run, request)
+            if error is not None:
+                return error
+            etag, last_modified = validators(request, kwargs)
+            response = not_modified(request, etag, last_modified)
+            if response is None:
+                response = run(request, **kwargs)
+            return finish(etag, last_modified, response)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Prefetch
+
+from api.models.category import Category
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+
+CHUNK_SIZE = 500
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+# Separator of the id and name lists in CSV cells.
+LIST_SEPARATOR = '|'
+
+
+def _ids(related):
+    return sorted(obj.id for obj in related.all())
+
+
+def pizza_rows(chunk_size):
+    pizzas = (Pizza.objects.filter(is_deleted=False).order_by('id')
+              .prefetch_related(Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+                                Prefetch('category', queryset=Category.objects.only('id')),
+                                Prefetch('custom_images', queryset=Image.objects.only('id'))))
+    for pizza in pizzas.iterator(chunk_size=chunk_size):
+        yield {
+            'id': pizza.id,
+            'name': pizza.name,
+            'description': pizza.description,
+            'price': str(pizza.price),
+            'vegetarian': pizza.vegetarian,
+            'available': pizza.available,
+            'ingredients': _ids(pizza.ingredients),
+            'categories': _ids(pizza.category),
+            'custom_images': _ids(pizza.custom_images),
+        }
+
+
+def ingredient_rows(chunk_size):
+    ingredients = (Ingredient.objects.order_by('id')
+                   .prefetch_related(Prefetch('allergens', queryset=Allergen.objects.only('id', 'name')),
+                                     Prefetch('images', queryset=Image.objects.only('id'))))
+    for ingredient in ingredients.iterator(chunk_size=chunk_size):
+        yield {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'description': ingredient.description,
+            'type': ingredient.type,
+            'cost': str(ingredient.cost),
+            'allergens': sorted(allergen.name for allergen in ingredient.allergens.all()),
+            'images': _ids(ingredient.images),
+        }
+
+
+def category_rows(chunk_size):
+    fields = ('id', 'name', 'description', 'parent_id', 'is_active')
+    yield from Category.objects.filter(is_deleted=False).order_by('id').values(*fields).iterator(chunk_size=chunk_size)
+
+
+def image_rows(chunk_size):
+    fields = ('id', 'image', 'description', 'is_default', 'processing_status')
+    yield from Image.objects.filter(is_deleted=False).order_by('id').values(*fields).iterator(chunk_size=chunk_size)
+
+
+# Entity -> (row generator, CSV columns)
+ENTITIES = {
+    'pizzas': (pizza_rows, ('id', 'name', 'description', 'price', 'vegetarian', 'available',
+                            'ingredients', 'categories', 'custom_images')),
+    'ingredients': (ingredient_rows, ('id', 'name', 'description', 'type', 'cost', 'allergens', 'images')),
+    'categories': (category_rows, ('id', 'name', 'description', 'parent_id', 'is_active')),
+    'images': (image_rows, ('id', 'image', 'description', 'is_default', 'processing_status')),
+}
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_chunks(entity, fmt, chunk_size=CHUNK_SIZE):
+    """
+    Yields the ``entity`` table as NDJSON or CSV, one bytes chunk per ``chunk_size``
+    rows. Rows are read with server-side iteration, so memory does not grow with the
+    table.
+    """
+    row_generator, columns = ENTITIES[entity]
+    rows = row_generator(chunk_size)
+    if fmt == 'ndjson':
+        for batch in _batches(rows, chunk_size):
+            yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in batch).encode()
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for batch in _batches(rows, chunk_size):
+        for row in batch:
+            writer.writerow({key: LIST_SEPARATOR.join(map(str, value)) if isinstance(value, list) else value
+                             for key, value in row.items()})
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compresses a stream of bytes chunks into a gzip stream, chunk by chunk.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
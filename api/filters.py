@@ -0,0 +1,48 @@
+from django.db.models import Exists, OuterRef, Q
+
+from api.allergen_mask import allergen_free
+from api.models.ingredients import Allergen
+from api.models.pizza import Pizza
+
+PizzaIngredient = Pizza.ingredients.through
+PizzaCategory = Pizza.category.through
+
+
+def _pizza_ingredients(**lookups):
+    return PizzaIngredient.objects.filter(pizza_id=OuterRef('pk'), **lookups)
+
+
+def pizza_conditions(filters):
+    """
+    Compiles a PizzaFilterSchema into the conditions of a single ``Pizza`` query.
+    Relations are tested with correlated ``EXISTS`` subqueries on the m2m indexes
+    rather than joins, so no ``DISTINCT`` is needed and each pizza is read once.
+    """
+    conditions = []
+    if filters.min_price is not None:
+        conditions.append(Q(price__gte=filters.min_price))
+    if filters.max_price is not None:
+        conditions.append(Q(price__lte=filters.max_price))
+    if filters.vegetarian is not None:
+        conditions.append(Q(vegetarian=filters.vegetarian))
+    if filters.available is not None:
+        conditions.append(Q(available=filters.available))
+    if filters.ingredient_type is not None:
+        conditions.append(Exists(_pizza_ingredients(ingredient__type=filters.ingredient_type)))
+    for ingredient_id in dict.fromkeys(filters.ingredients):
+        conditions.append(Exists(_pizza_ingredients(ingredient_id=ingredient_id)))
+    if filters.exclude_ingredients:
+        conditions.append(~Exists(_pizza_ingredients(ingredient_id__in=filters.exclude_ingredients)))
+    if filters.allergen_free:
+        allergen_ids = Allergen.objects.filter(name__in=filters.allergen_free).values_list('id', flat=True)
+        conditions += allergen_free(list(allergen_ids))
+    if filters.category is not None:
+        # The category or any category whose materialized path goes through it.
+        subtree = Q(category_id=filters.category) | Q(category__path__contains=f'/{filters.category}/')
+        conditions.append(Exists(PizzaCategory.objects.filter(
+            subtree, pizza_id=OuterRef('pk'), category__is_deleted=False)))
+    return conditions
+
+
+def filtered_pizzas(filters):
+    return Pizza.objects.filter(*pizza_conditions(filters), is_deleted=False)
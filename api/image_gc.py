@@ -0,0 +1,98 @@
+import os
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from api import blobs
+from api.models.image import Image, ImageBlob
+from api.models.ingredients import Ingredient
+from api.models.pizza import Pizza
+
+CHUNK_SIZE = 500
+# Directories of MEDIA_ROOT holding files that belong to Image rows. Renditions are a
+# cache with its own eviction and are left alone.
+MANAGED_DIRS = ('images', blobs.BLOB_DIR, 'derivatives')
+# The default pizza image, shipped with the repository. Shipped files are never
+# collected, whether or not a row references them.
+DEFAULT_IMAGE = 'images/pizza_by_default.jpg'
+SHIPPED_FILES = frozenset({DEFAULT_IMAGE})
+# Files younger than this (seconds) may belong to an upload still in flight.
+GRACE_PERIOD = 3600
+
+
+def orphaned_images():
+    """
+    Images linked to no pizza and no ingredient, found with a single anti-join.
+    The default images are never orphans.
+    """
+    pizza_links = Pizza.custom_images.through.objects.filter(image_id=OuterRef('pk'))
+    ingredient_links = Ingredient.images.through.objects.filter(image_id=OuterRef('pk'))
+    return (Image.objects
+            .filter(~Exists(pizza_links), ~Exists(ingredient_links), is_default=False)
+            .exclude(id=1))
+
+
+def delete_images(images, chunk_size=CHUNK_SIZE):
+    """
+    Deletes ``images`` by chunks of primary keys. Yields, for every chunk, the number of
+    rows deleted and the files that only belonged to them (images stored before the
+    blob store). Blob files are left to ``collect_blobs``.
+    """
+    last_id = 0
+    while True:
+        candidates = list(images.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not candidates:
+            return
+        last_id = candidates[-1]
+        with transaction.atomic():
+            # Filtered again under lock: an image linked since the select above is kept.
+            rows = list(images.filter(id__in=candidates).select_for_update()
+                        .values_list('id', 'blob_id', 'image', 'derivatives'))
+            files = [path for _, blob_id, name, derivatives in rows if blob_id is None
+                     for path in [name, *derivatives.values()]]
+            _, deleted = Image.objects.filter(id__in=[row[0] for row in rows]).delete()
+        yield deleted.get(Image._meta.label, 0), files
+
+
+def referenced_files():
+    """
+    Media-relative paths of every file an Image or ImageBlob row points to.
+    """
+    referenced = set()
+    for name, derivatives in Image.objects.values_list('image', 'derivatives').iterator(chunk_size=2000):
+        referenced.add(name)
+        referenced.update(derivatives.values())
+    for sha256, path in ImageBlob.objects.values_list('sha256', 'path').iterator(chunk_size=2000):
+        referenced.update(blobs.blob_files(sha256, path))
+    return referenced
+
+
+def untracked_files():
+    """
+    Files of the managed media directories that no row references, as ``(path, size)``
+    pairs. Recent files are skipped, their row may not be committed yet, and so are the
+    SHIPPED_FILES.
+    """
+    referenced = referenced_files()
+    cutoff = time.time() - GRACE_PERIOD
+    for directory in MANAGED_DIRS:
+        for root, _, names in os.walk(os.path.join(settings.MEDIA_ROOT, directory)):
+            relative_root = os.path.relpath(root, settings.MEDIA_ROOT)
+            for name in names:
+                path = os.path.join(relative_root, name)
+                stat = os.stat(os.path.join(root, name))
+                if path not in referenced and path not in SHIPPED_FILES and stat.st_mtime < cutoff:
+                    yield path, stat.st_size
+
+
+def remove_file(path):
+    """
+    Unlinks a media file, safe to run from a thread pool. Returns whether it existed.
+    """
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, path))
+        return True
+    except FileNotFoundError:
+        return False
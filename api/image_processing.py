@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from api import blobs
+from api.blobs import BLOB_DIR
+from api.models.image import Image, ImageJob
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def render_derivatives(name, media_root, max_size, derivatives):
+    """
+    Bounds the original to ``max_size`` and writes one resized copy per derivative
+    under ``derivatives/<derivative>/``. Only touches files, so it can run in a worker
+    process. Stored files are never rewritten: a bounded original is written to a
+    temporary file for the blob store, with its SHA-256.
+    """
+    path = os.path.join(media_root, name)
+    basename = os.path.basename(name)
+    extension = os.path.splitext(name)[1]
+    result = {'derivatives': {}, 'bounded': None}
+    with PILImage.open(path) as img:
+        img.load()
+        if img.height > max_size or img.width > max_size:
+            img.thumbnail((max_size, max_size))
+            directory = os.path.join(media_root, BLOB_DIR, 'tmp')
+            os.makedirs(directory, exist_ok=True)
+            descriptor, bounded_path = tempfile.mkstemp(suffix=extension, dir=directory)
+            os.close(descriptor)
+            _save(img, bounded_path)
+            with open(bounded_path, 'rb') as bounded:
+                content = bounded.read()
+            sha256 = hashlib.sha256(content).hexdigest()
+            result['bounded'] = {'path': bounded_path, 'sha256': sha256, 'size': len(content), 'extension': extension}
+            # Derivatives are named after the file they are rendered from.
+            basename = f'{sha256}{extension.lower()}'
+
+        for derivative, size in derivatives.items():
+            relative_path = os.path.join('derivatives', derivative, basename)
+            copy = img.copy()
+            copy.thumbnail((size, size))
+            _save(copy, os.path.join(media_root, relative_path))
+            result['derivatives'][derivative] = relative_path
+    return result
+
+
+def _save(img, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.lower().endswith(JPEG_EXTENSIONS) and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(path)
+
+
+def claim_jobs(limit):
+    """
+    Marks up to ``limit`` pending jobs as running. Each claim is a conditional update,
+    so concurrent workers never pick the same job.
+    """
+    candidates = ImageJob.objects.filter(status='pending').order_by('created_at', 'id').values_list('id', flat=True)
+    claimed = []
+    for job_id in candidates[:limit]:
+        updated = ImageJob.objects.filter(id=job_id, status='pending').update(
+            status='running', attempts=F('attempts') + 1, started_at=timezone.now()
+        )
+        if updated:
+            claimed.append(job_id)
+
+    jobs = list(ImageJob.objects.filter(id__in=claimed).select_related('image'))
+    Image.objects.filter(jobs__in=claimed).update(processing_status='processing')
+    return jobs
+
+
+def complete_job(job, result=None, error=None):
+    """
+    Records the outcome of a job. Failed jobs go back to the queue until they have
+    been attempted MAX_ATTEMPTS times.
+    """
+    image = job.image
+    job.finished_at = timezone.now()
+    if error is None:
+        job.status = 'done'
+        job.error = ''
+        bounded = result['bounded']
+        if bounded is not None:
+            blob = blobs.intern(bounded['path'], bounded['sha256'], bounded['size'], bounded['extension'])
+            image.image = blob.path
+        image.derivatives = result['derivatives']
+        image.processing_status = 'ready'
+    elif job.attempts < settings.IMAGE_PROCESSING['MAX_ATTEMPTS']:
+        job.status = 'pending'
+        job.error = error
+        image.processing_status = 'pending'
+    else:
+        job.status = 'failed'
+        job.error = error
+        image.processing_status = 'failed'
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    # Saved through the model so the catalog signals see the new derivatives.
+    image.save(update_fields=['image', 'blob', 'processing_status', 'derivatives'], enqueue=False)
+
+
+def requeue_stale_jobs():
+    """
+    Puts back jobs left running by a worker that died before completing them.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_PROCESSING['STALE_AFTER'])
+    return ImageJob.objects.filter(status='running', started_at__lt=cutoff).update(status='pending')
+
+
+def process_pending(executor=None, limit=None):
+    """
+    Claims a batch of jobs and renders them, in ``executor`` when given or inline
+    otherwise. Returns the number of jobs handled.
+    """
+    options = settings.IMAGE_PROCESSING
+    jobs = claim_jobs(limit or options['BATCH_SIZE'])
+    arguments = [(job.image.image.name, settings.MEDIA_ROOT, options['MAX_SIZE'], options['DERIVATIVES'])
+                 for job in jobs]
+
+    if executor is None:
+        for job, args in zip(jobs, arguments):
+            try:
+                complete_job(job, result=render_derivatives(*args))
+            except Exception as e:
+                complete_job(job, error=str(e))
+        return len(jobs)
+
+    futures = {executor.submit(render_derivatives, *args): job for job, args in zip(jobs, arguments)}
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            complete_job(job, result=future.result())
+        except Exception as e:
+            complete_job(job, error=str(e))
+    return len(jobs)
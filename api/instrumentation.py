@@ -0,0 +1,36 @@
+import time
+
+from ninja.renderers import JSONRenderer
+
+
+class QueryTimer:
+    """
+    ``connection.execute_wrapper`` counting the queries of a request and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSON renderer recording the time spent encoding responses on the request. The
+    validation against the response schema happens before, inside Ninja's operation,
+    and only counts in the request's total time.
+    """
+
+    def render(self, request, data, *, response_status):
+        started = time.perf_counter()
+        try:
+            return super().render(request, data, response_status=response_status)
+        finally:
+            request.encoding_time = getattr(request, 'encoding_time', 0.0) + time.perf_counter() - started
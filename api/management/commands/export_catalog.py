@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.export import CHUNK_SIZE, ENTITIES, FORMATS, export_chunks, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = "Streams a catalog table as NDJSON or CSV, to a file or the standard output."
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=list(ENTITIES))
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help="File to write, the standard output by default.")
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, entity, format, output, gzip, chunk_size, **options):
+        started = time.monotonic()
+        chunks = export_chunks(entity, format, chunk_size)
+        if gzip:
+            chunks = gzip_chunks(chunks)
+
+        written = 0
+        target = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                target.write(chunk)
+                written += len(chunk)
+        finally:
+            if output:
+                target.close()
+            else:
+                target.flush()
+
+        if output:
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f"Exported {entity} to {output}, {written} bytes in {elapsed:.2f}s."))
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api.blobs import collect_blobs
+from api.image_gc import CHUNK_SIZE, delete_images, orphaned_images, remove_file, untracked_files
+
+
+class Command(BaseCommand):
+    help = ("Deletes images linked to no pizza and no ingredient, the blobs they leave "
+            "unreferenced, and media files that no row references.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted, delete nothing.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=8, help="Threads unlinking files.")
+        parser.add_argument('--skip-files', action='store_true', help="Do not scan the media directories.")
+
+    def handle(self, *args, dry_run, chunk_size, workers, skip_files, **options):
+        started = time.monotonic()
+        orphans = orphaned_images()
+        total = orphans.count()
+        self.stdout.write(f"{total} orphaned images.")
+
+        if dry_run:
+            if not skip_files:
+                self.report_untracked()
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f"Dry run, nothing deleted ({elapsed:.2f}s)."))
+            return
+
+        images = blobs = 0
+        removals = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def remove(paths):
+                removals.extend(executor.submit(remove_file, path) for path in paths)
+
+            for count, files in delete_images(orphans, chunk_size):
+                images += count
+                remove(files)
+                self.stdout.write(f"Deleted {images}/{total} images ({self.rate(images, started)}/s).")
+
+            blobs = collect_blobs(chunk_size, remove=remove)
+            self.stdout.write(f"Deleted {blobs} unreferenced blobs.")
+
+            if not skip_files:
+                untracked = list(untracked_files())
+                self.stdout.write(f"Removing {len(untracked)} untracked files "
+                                  f"({sum(size for _, size in untracked)} bytes).")
+                remove(path for path, _ in untracked)
+
+        files = sum(future.result() for future in removals)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {images} images, {blobs} blobs and {files} files in {elapsed:.2f}s "
+            f"({self.rate(images, started)} images/s, {self.rate(files, started)} files/s)."
+        ))
+
+    def report_untracked(self):
+        count = size = 0
+        for path, file_size in untracked_files():
+            self.stdout.write(f"  untracked: {path} ({file_size} bytes)")
+            count += 1
+            size += file_size
+        self.stdout.write(f"{count} untracked files ({size} bytes).")
+
+    @staticmethod
+    def rate(count, started):
+        elapsed = time.monotonic() - started
+        return f"{count / elapsed:.0f}" if elapsed else "-"
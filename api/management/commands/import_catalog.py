@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog_import import BATCH_SIZE, IMPORTERS, import_catalog, open_source
+from api.export import FORMATS
+
+
+class Command(BaseCommand):
+    help = "Upserts catalog records, matched by name, from a NDJSON or CSV file or the standard input."
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=list(IMPORTERS))
+        parser.add_argument('path', nargs='?', help="File to read (.gz allowed), the standard input by default.")
+        parser.add_argument('--format', choices=list(FORMATS), help="Guessed from the file extension by default.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, entity, path, format, batch_size, **options):
+        if path is None and format is None:
+            raise CommandError("--format is required when reading the standard input.")
+        started = time.monotonic()
+        source = open(path, 'rb') if path else sys.stdin.buffer
+        try:
+            stream, fmt = open_source(source, path or '', format)
+            result = import_catalog(stream, entity, fmt, batch_size)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if path:
+                source.close()
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['field'] or '-'}: {error['detail']}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {entity}: {result.created} created, {result.updated} updated, "
+            f"{result.failed} failed in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,33 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.image_processing import process_pending, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Processes queued images (resizing and derivatives) with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_PROCESSING['WORKERS'])
+        parser.add_argument('--batch-size', type=int, default=settings.IMAGE_PROCESSING['BATCH_SIZE'])
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, workers, batch_size, once, **options):
+        poll_interval = settings.IMAGE_PROCESSING['POLL_INTERVAL']
+        processed = 0
+        # Workers only run Pillow; every database access stays in this process.
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                requeue_stale_jobs()
+                handled = process_pending(executor, limit=batch_size)
+                processed += handled
+                if handled:
+                    self.stdout.write(f"Processed {handled} images.")
+                elif once:
+                    break
+                else:
+                    time.sleep(poll_interval)
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} images in total."))
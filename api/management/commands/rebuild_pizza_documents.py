@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cache import invalidate_catalog
+from api.read_model import BATCH_SIZE, rebuild_pizza_documents
+
+
+class Command(BaseCommand):
+    help = "Renders the pizza read model (PizzaDocument) for the whole catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--pizza', type=int, action='append', dest='pizza_ids',
+                            help="Only rebuild this pizza, can be repeated.")
+
+    def handle(self, *args, batch_size, pizza_ids, **options):
+        started = time.monotonic()
+        written = rebuild_pizza_documents(pizza_ids, batch_size=batch_size)
+        invalidate_catalog()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} pizza documents in {elapsed:.2f}s."))
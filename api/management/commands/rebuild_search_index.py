@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cache import invalidate_catalog
+from api.search import get_search_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of pizzas, ingredients, categories and images."
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        backend = get_search_backend()
+        indexed = rebuild_index(backend)
+        invalidate_catalog()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} documents with {type(backend).__name__} in {elapsed:.2f}s."
+        ))
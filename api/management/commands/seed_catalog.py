@@ -0,0 +1,127 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.allergen_mask import refresh_allergen_masks
+from api.cache import invalidate_catalog
+from api.image_gc import DEFAULT_IMAGE
+from api.pricing import refresh_ingredient_costs
+from api.models.category import Category
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+
+WORDS = ('Regina', 'Margherita', 'Diavola', 'Calzone', 'Napoli', 'Romana', 'Capricciosa', 'Funghi',
+         'Ortolana', 'Marinara', 'Bianca', 'Tartufo', 'Siciliana', 'Boscaiola', 'Parma', 'Vesuvio')
+ALLERGENS = ('Gluten', 'Lactose', 'Eggs', 'Fish', 'Crustaceans', 'Nuts', 'Peanuts', 'Soy', 'Celery',
+             'Mustard', 'Sesame', 'Sulphites', 'Lupin', 'Molluscs')
+
+
+class Command(BaseCommand):
+    help = ("Fills the database with a generated catalog (pizzas, ingredients, images and nested "
+            "categories) for benchmarks. Deterministic for a given --seed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pizzas', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=300)
+        parser.add_argument('--images', type=int, default=500)
+        parser.add_argument('--categories', type=int, default=150)
+        parser.add_argument('--depth', type=int, default=4, help="Levels of the category tree.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete the existing pizzas, ingredients, allergens and categories, "
+                                 "and previously seeded images, first.")
+
+    def handle(self, *args, pizzas, ingredients, images, categories, depth, seed, batch_size, flush, **options):
+        if not flush and Category.objects.filter(name__startswith='Category ').exists():
+            raise CommandError("The catalog is already seeded, use --flush to replace it.")
+        started = time.monotonic()
+        rng = random.Random(seed)
+        with transaction.atomic():
+            if flush:
+                self.flush()
+            counts = self.seed(rng, pizzas, ingredients, images, categories, depth, batch_size)
+
+        call_command('rebuild_search_index', stdout=self.stdout)
+        if settings.PIZZA_READ_MODEL:
+            call_command('rebuild_pizza_documents', stdout=self.stdout)
+        invalidate_catalog()
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.2f}s."))
+
+    def flush(self):
+        for model in (Pizza, Ingredient, Allergen, Category):
+            model.objects.all().delete()
+        Image.objects.filter(description__startswith='Seeded image ').delete()
+
+    def seed(self, rng, pizzas, ingredients, images, categories, depth, batch_size):
+        allergen_rows = Allergen.objects.bulk_create([Allergen(name=name) for name in ALLERGENS])
+        image_rows = Image.objects.bulk_create(
+            [Image(image=DEFAULT_IMAGE, description=f'Seeded image {index}') for index in range(images)],
+            batch_size=batch_size)
+
+        # Breadth first: every level has about twice as many categories as the one above.
+        category_rows = []
+        level = [None]
+        per_level = max(1, categories // (2 ** depth - 1))
+        for height in range(depth):
+            size = min(per_level * 2 ** height, categories - len(category_rows))
+            if size <= 0:
+                break
+            parents = [rng.choice(level) for _ in range(size)]
+            level = Category.objects.bulk_create([
+                Category(name=f'Category {len(category_rows) + index}', parent=parent,
+                         path=parent.subtree_path if parent else '/', description=f'Level {height}')
+                for index, parent in enumerate(parents)
+            ])
+            category_rows += level
+
+        types = [choice for choice, _ in Ingredient.TYPE_CHOICES]
+        ingredient_rows = Ingredient.objects.bulk_create([
+            Ingredient(name=f'{rng.choice(WORDS)} ingredient {index}', type=rng.choice(types),
+                       cost=Decimal(rng.randint(10, 400)) / 100)
+            for index in range(ingredients)
+        ], batch_size=batch_size)
+        Ingredient.allergens.through.objects.bulk_create([
+            Ingredient.allergens.through(ingredient_id=ingredient.id, allergen_id=allergen.id)
+            for ingredient in ingredient_rows
+            for allergen in rng.sample(allergen_rows, rng.randint(0, 3))
+        ], batch_size=batch_size)
+        Ingredient.images.through.objects.bulk_create([
+            Ingredient.images.through(ingredient_id=ingredient.id, image_id=image.id)
+            for ingredient in ingredient_rows
+            for image in rng.sample(image_rows, min(len(image_rows), rng.randint(0, 2)))
+        ], batch_size=batch_size)
+
+        pizza_rows = Pizza.objects.bulk_create([
+            Pizza(name=f'{rng.choice(WORDS)} {index}', description=f'Pizza {index}',
+                  price=Decimal(rng.randint(700, 1800)) / 100, vegetarian=rng.random() < 0.3,
+                  available=rng.random() < 0.9)
+            for index in range(pizzas)
+        ], batch_size=batch_size)
+        Pizza.ingredients.through.objects.bulk_create([
+            Pizza.ingredients.through(pizza_id=pizza.id, ingredient_id=ingredient.id)
+            for pizza in pizza_rows
+            for ingredient in rng.sample(ingredient_rows, min(len(ingredient_rows), rng.randint(3, 8)))
+        ], batch_size=batch_size)
+        Pizza.category.through.objects.bulk_create([
+            Pizza.category.through(pizza_id=pizza.id, category_id=category.id)
+            for pizza in pizza_rows
+            for category in rng.sample(category_rows, min(len(category_rows), rng.randint(1, 3)))
+        ], batch_size=batch_size)
+        Pizza.custom_images.through.objects.bulk_create([
+            Pizza.custom_images.through(pizza_id=pizza.id, image_id=rng.choice(image_rows).id)
+            for pizza in pizza_rows if image_rows and rng.random() < 0.5
+        ], batch_size=batch_size)
+        refresh_allergen_masks([pizza.id for pizza in pizza_rows])
+        refresh_ingredient_costs(Pizza.objects.values('id'))
+
+        return {'pizzas': len(pizza_rows), 'ingredients': len(ingredient_rows), 'images': len(image_rows),
+                'categories': len(category_rows), 'allergens': len(allergen_rows)}
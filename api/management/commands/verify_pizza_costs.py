@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import invalidate_catalog
+from api.pricing import cost_drift, refresh_ingredient_costs
+
+
+class Command(BaseCommand):
+    help = "Checks Pizza.ingredient_cost against the cost of the pizza ingredients."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Recompute the drifted pizzas.")
+        parser.add_argument('--pizza', type=int, action='append', dest='pizza_ids',
+                            help="Only check this pizza, can be repeated.")
+
+    def handle(self, *args, repair, pizza_ids, **options):
+        started = time.monotonic()
+        drifted = cost_drift(pizza_ids)
+        for pizza_id, stored, expected in drifted[:10]:
+            self.stdout.write(f"Pizza {pizza_id}: stored {stored}, expected {expected}")
+        if repair and drifted:
+            with transaction.atomic():
+                refresh_ingredient_costs([pizza_id for pizza_id, _, _ in drifted])
+            invalidate_catalog()
+        elapsed = time.monotonic() - started
+        action = "repaired" if repair else "found"
+        style = self.style.SUCCESS if repair or not drifted else self.style.WARNING
+        self.stdout.write(style(f"{len(drifted)} drifted pizza costs {action} in {elapsed:.2f}s."))
@@ -0,0 +1,346 @@
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Upper bounds of the latency buckets, in seconds (+Inf is implicit).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)  # bytes
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """
+    Base of the registry's metric families. Samples are kept per thread: each thread
+    only ever writes its own dict, so recording takes no lock, and ``collect`` adds
+    the threads' dicts up when the metrics are scraped. The dicts of finished threads
+    are folded into a shared base, so short-lived threads do not pile up.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._local = threading.local()
+        self._shards = []  # (thread, samples)
+        self._base = {}
+        self._shards_lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _shard(self):
+        shard = getattr(self._local, 'samples', None)
+        if shard is None:
+            shard = self._local.samples = {}
+            with self._shards_lock:
+                self._prune()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _prune(self):
+        # Called with _shards_lock held. A finished thread no longer writes its dict.
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._fold(self._base, shard)
+        self._shards = live
+
+    def _fold(self, samples, shard):
+        for key, value in dict(shard).items():
+            samples[key] = self.merge(samples.get(key), value)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def collect(self):
+        """
+        Returns ``{label values: value}`` of this process.
+        """
+        samples = {}
+        with self._shards_lock:
+            self._prune()
+            self._fold(samples, self._base)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            self._fold(samples, shard)
+        return samples
+
+    def merge(self, total, value):
+        return value if total is None else total + value
+
+    def expose(self, samples):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type}'
+        for key, value in sorted(samples.items()):
+            yield f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Per-process value, summed across processes, or computed by ``callback``
+    (returning ``{label values: value}``) for values read from the database, which
+    are the same for every process. Those are recomputed at most every ``max_age``
+    seconds, the registry's flush interval, however often the metrics are scraped.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), registry=None, callback=None):
+        super().__init__(name, documentation, labels, registry)
+        self.callback = callback
+        self._values = {}
+        self._computed = None
+        self._computed_at = 0.0
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def collect(self):
+        if self.callback is not None:
+            return {}
+        return dict(self._values)
+
+    def collect_callback(self, max_age=0):
+        with self._shards_lock:
+            if self._computed is None or time.monotonic() - self._computed_at >= max_age:
+                values = self.callback()
+                self._computed = {tuple(str(value) for value in key): value for key, value in values.items()}
+                self._computed_at = time.monotonic()
+            return self._computed
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        sample = shard.get(key)
+        if sample is None:
+            # Counts per bucket (the last one is +Inf) followed by the sum.
+            sample = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        sample[bisect_left(self.buckets, value)] += 1
+        sample[-1] += value
+
+    def merge(self, total, value):
+        return list(value) if total is None else [left + right for left, right in zip(total, value)]
+
+    def expose(self, samples):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type}'
+        for key, sample in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), sample[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, [('le', _format_value(float(bound)))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.label_names, key)
+            yield f'{self.name}_sum{labels} {_format_value(sample[-1])}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    """
+    Metric families of the process. With ``directory`` set, each process writes its
+    samples to ``<directory>/<pid>.json`` at most every ``flush_interval`` seconds (and
+    at exit), and a scrape adds up the files of every process: counters and histograms
+    of exited processes are kept, gauges only count for running ones.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.directory = None
+        self.flush_interval = None
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def configure(self, directory, flush_interval):
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def collect_local(self):
+        return {name: metric.collect() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        if not self.directory:
+            return
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            data = {name: [[list(key), value] for key, value in samples.items()]
+                    for name, samples in self.collect_local().items()}
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            temporary = f'{path}.tmp'
+            with open(temporary, 'w') as output:
+                json.dump(data, output)
+            os.replace(temporary, path)
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def _process_samples(self):
+        if not self.directory:
+            yield True, self.collect_local()
+            return
+        self.flush()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                pid = int(os.path.basename(path)[:-len('.json')])
+                with open(path) as source:
+                    data = json.load(source)
+            except (ValueError, OSError):
+                continue
+            samples = {name: {tuple(key): value for key, value in rows} for name, rows in data.items()}
+            yield _is_running(pid), samples
+
+    def collect(self):
+        """
+        Returns ``{name: {label values: value}}`` summed across processes.
+        """
+        totals = {name: {} for name in self.metrics}
+        for running, samples in self._process_samples():
+            for name, metric in self.metrics.items():
+                if isinstance(metric, Gauge) and not running:
+                    continue
+                merged = totals[name]
+                for key, value in samples.get(name, {}).items():
+                    merged[key] = metric.merge(merged.get(key), value)
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Gauge) and metric.callback is not None:
+                totals[name] = metric.collect_callback(self.flush_interval or 0)
+        return totals
+
+    def expose(self):
+        """
+        Renders every metric in the Prometheus text format (version 0.0.4).
+        """
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.extend(metric.expose(totals[name]))
+        lines.extend(_cache_hit_ratios(totals.get(CACHE_REQUESTS.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+def _is_running(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _cache_hit_ratios(samples):
+    # Derived from the aggregated counters, ratios cannot be added up across processes.
+    totals = {}
+    for (cache, result), count in samples.items():
+        hits, requests = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result == 'hit' else 0), requests + count)
+    yield '# HELP cache_hit_ratio Share of cache lookups that were hits.'
+    yield '# TYPE cache_hit_ratio gauge'
+    for cache, (hits, requests) in sorted(totals.items()):
+        yield f'cache_hit_ratio{_format_labels(("cache",), (cache,))} {_format_value(hits / requests)}'
+
+
+def _image_jobs():
+    from django.db.models import Count
+
+    from api.models.image import ImageJob
+
+    rows = ImageJob.objects.filter(status__in=['pending', 'running']).values('status').annotate(count=Count('id'))
+    depth = {('pending',): 0, ('running',): 0}
+    depth.update({(row['status'],): row['count'] for row in rows})
+    return depth
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by Ninja operation and status.',
+                   ('api', 'operation', 'method', 'status'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by Ninja operation.',
+                            ('api', 'operation'))
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit or miss).',
+                         ('cache', 'result'))
+AUTH_FAILURES = Counter('auth_failures_total', 'Rejected credentials by scheme and reason.',
+                        ('scheme', 'reason'))
+# Recorded by InstrumentationMiddleware for the sampled requests (settings.INSTRUMENTATION).
+REQUEST_STAGE_DURATION = Histogram(
+    'http_request_stage_duration_seconds',
+    'Time of the sampled requests by route and stage: total, database, and json_encoding '
+    '(the renderer only, the response schema validation counts in total).',
+    ('route', 'stage'), buckets=STAGE_BUCKETS)
+REQUEST_QUERIES = Histogram('http_request_queries', 'Database queries of the sampled requests by route.',
+                            ('route',), buckets=QUERY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size of the sampled requests by route.',
+                          ('route',), buckets=SIZE_BUCKETS)
+# Recorded by user_auth.activity_log.ActivityLogWriter.
+ACTIVITY_LOG_ENTRIES = Counter('activity_log_entries_total',
+                               'Activity log entries by outcome: enqueued, written, overflowed '
+                               '(queue full, written by the request) or failed (lost).', ('outcome',))
+ACTIVITY_LOG_QUEUE = Gauge('activity_log_queue_entries', 'Activity log entries waiting for the writer thread.')
+ACTIVITY_LOG_CAPACITY = Gauge('activity_log_queue_capacity', 'Size of the activity log queue.')
+IMAGE_JOBS = Gauge('image_processing_jobs', 'Image processing jobs waiting or running.',
+                   ('status',), callback=_image_jobs)
+
+_configured = False
+
+
+def get_registry():
+    global _configured
+    if not _configured:
+        options = settings.METRICS
+        REGISTRY.configure(options['MULTIPROCESS_DIR'], options['FLUSH_INTERVAL'])
+        _configured = True
+    return REGISTRY
@@ -1,7 +1,18 @@
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
-from api_pizza_django import settings
 import logging
 
+from api.instrumentation import QueryTimer
+from api.metrics import (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_STAGE_DURATION, REQUESTS, RESPONSE_SIZE,
+                         get_registry)
+from api.views.metrics import metrics as metrics_view
+
 logger = logging.getLogger(__name__)
 
 class LogRequestsMiddleware(MiddlewareMixin):
@@ -12,3 +23,147 @@ class LogRequestsMiddleware(MiddlewareMixin):
     def process_exception(self, request, exception):
         if settings.DEBUG:
             logger.info(f"Exception at the {request.method} to {request.path}: {exception}")
+
+
+class InstrumentationMiddleware:
+    """
+    Measures wall time, database queries and time, JSON encoding time and response
+    size of a sample of the requests (settings.INSTRUMENTATION['SAMPLE_RATE']), adds
+    them as a Server-Timing header and records them per route in the /metrics
+    histograms (REQUEST_STAGE_DURATION, REQUEST_QUERIES, RESPONSE_SIZE).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = settings.INSTRUMENTATION
+        self.enabled = options['ENABLED']
+        self.sample_rate = options['SAMPLE_RATE']
+        self.server_timing = options['SERVER_TIMING']
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    @staticmethod
+    def time_queries(timers):
+        stack = ExitStack()
+        for alias, timer in zip(settings.DATABASES, timers):
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timers = [QueryTimer() for _ in settings.DATABASES]
+        started = time.perf_counter()
+        with self.time_queries(timers):
+            response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started, timers)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timers = [QueryTimer() for _ in settings.DATABASES]
+        # Connections are per thread: the ORM calls of async views run in the sync
+        # thread, so the wrappers are installed (and removed) there.
+        queries = await sync_to_async(self.time_queries)(timers)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            await sync_to_async(queries.close)()
+        return self.record(request, response, duration, timers)
+
+    def record(self, request, response, duration, timers):
+        db_time = sum(timer.duration for timer in timers)
+        queries = sum(timer.count for timer in timers)
+        encoding = getattr(request, 'encoding_time', None)
+
+        match = request.resolver_match
+        route = f"{request.method} /{match.route}" if match is not None else f"{request.method} <unmatched>"
+        REQUEST_STAGE_DURATION.observe(duration, route=route, stage='total')
+        REQUEST_STAGE_DURATION.observe(db_time, route=route, stage='database')
+        if encoding is not None:
+            REQUEST_STAGE_DURATION.observe(encoding, route=route, stage='json_encoding')
+        REQUEST_QUERIES.observe(queries, route=route)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), route=route)
+
+        if self.server_timing:
+            timings = [f'app;dur={duration * 1000:.2f}',
+                       f'db;dur={db_time * 1000:.2f};desc="{queries} queries"']
+            if encoding is not None:
+                timings.append(f'json;dur={encoding * 1000:.2f};desc="JSON encoding"')
+            response['Server-Timing'] = ', '.join(timings)
+        return response
+
+
+def operation_labels(request):
+    """
+    Returns ``(api, operation)`` of a request: the URL prefix of the NinjaAPI and the
+    operation id, or the view name for plain Django views. None for the scrapes of
+    /metrics, which are not measured.
+    """
+    match = request.resolver_match
+    if match is None:
+        return '', '<unmatched>'
+    if match.func is metrics_view:
+        return None
+    api = match.route.split('/', 1)[0]
+    # Ninja routes resolve to PathView methods, which hold one operation per HTTP method.
+    path_view = getattr(match.func, '__self__', None)
+    for operation in getattr(path_view, 'operations', ()):
+        if request.method in operation.methods:
+            return api, operation.operation_id or operation.api.get_openapi_operation_id(operation)
+    return api, match.view_name
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records their latency per Ninja operation for /metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.METRICS['ENABLED']
+        self.registry = get_registry()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started)
+
+    def record(self, request, response, duration):
+        labels = operation_labels(request)
+        if labels is None:
+            return response
+        api, operation = labels
+        REQUESTS.inc(api=api, operation=operation, method=request.method, status=response.status_code)
+        REQUEST_LATENCY.observe(duration, api=api, operation=operation)
+        self.registry.maybe_flush()
+        return response
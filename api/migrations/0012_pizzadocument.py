@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-18 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_category_created_at_category_is_active_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PizzaDocument',
+            fields=[
+                ('pizza', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='api.pizza')),
+                ('name', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('document', models.JSONField()),
+                ('rendered_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Pizza document',
+                'verbose_name_plural': 'Pizza documents',
+                'indexes': [models.Index(fields=['is_deleted', 'name'], name='api_pizzado_is_dele_4c5812_idx'), models.Index(fields=['is_deleted', 'price'], name='api_pizzado_is_dele_6355c2_idx')],
+            },
+        ),
+    ]
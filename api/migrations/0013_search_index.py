@@ -0,0 +1,31 @@
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS api_search_index USING fts5("
+            "entity UNINDEXED, object_id UNINDEXED, name, body, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: api.search falls back to the in-process index.
+        pass
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS api_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_pizzadocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 14:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_image_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Image blob',
+                'verbose_name_plural': 'Image blobs',
+                'indexes': [models.Index(fields=['ref_count'], name='api_imagebl_ref_cou_773f33_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='images', to='api.imageblob'),
+        ),
+    ]
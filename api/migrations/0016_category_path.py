@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # Parents first: every category is reached from an already computed parent.
+    Category = apps.get_model('api', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {pk: '/' for pk, parent_id in parents.items() if parent_id is None}
+    level = set(paths)
+    while level:
+        next_level = [pk for pk, parent_id in parents.items() if parent_id in level and pk not in paths]
+        for pk in next_level:
+            paths[pk] = f'{paths[parents[pk]]}{parents[pk]}/'
+        level = set(next_level)
+    Category.objects.bulk_update([Category(id=pk, path=path) for pk, path in paths.items() if path != '/'],
+                                 ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='/', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='api_categor_path_014f93_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 14:47
+
+from django.db import migrations, models
+
+
+def fill_masks(apps, schema_editor):
+    # Same bits as api.allergen_mask.allergen_bit: allergen n is bit n - 1, up to id 63.
+    Pizza = apps.get_model('api', 'Pizza')
+    masks = {}
+    links = Pizza.ingredients.through.objects.filter(
+        ingredient__allergens__id__lte=63).values_list('pizza_id', 'ingredient__allergens')
+    for pizza_id, allergen_id in links.iterator():
+        masks[pizza_id] = masks.get(pizza_id, 0) | 1 << (allergen_id - 1)
+    Pizza.objects.bulk_update([Pizza(id=pizza_id, allergen_mask=mask) for pizza_id, mask in masks.items()],
+                              ['allergen_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pizza',
+            name='allergen_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+    ]
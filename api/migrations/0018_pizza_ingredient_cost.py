@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-18 14:49
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def fill_costs(apps, schema_editor):
+    # Same expression as api.pricing.ingredient_cost_subquery, in a single UPDATE.
+    Pizza = apps.get_model('api', 'Pizza')
+    total = (Pizza.ingredients.through.objects.filter(pizza_id=OuterRef('pk'))
+             .values('pizza_id').annotate(total=Sum('ingredient__cost')).values('total'))
+    Pizza.objects.update(ingredient_cost=Round(
+        Coalesce(Subquery(total), Value(Decimal('0'))), 2,
+        output_field=models.DecimalField(max_digits=8, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_pizza_allergen_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pizza',
+            name='ingredient_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8),
+        ),
+        migrations.RunPython(fill_costs, migrations.RunPython.noop),
+    ]
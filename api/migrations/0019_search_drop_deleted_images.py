@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def drop_deleted_images(apps, schema_editor):
+    # Soft-deleted images used to be indexed; api.search now leaves them out.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    if 'api_search_index' not in schema_editor.connection.introspection.table_names():
+        return
+    Image = apps.get_model('api', 'Image')
+    deleted = list(Image.objects.filter(is_deleted=True).values_list('id', flat=True))
+    with schema_editor.connection.cursor() as cursor:
+        # rowid = object_id * 8 + 4, see api.search.ENTITY_CODES.
+        cursor.executemany('DELETE FROM api_search_index WHERE rowid = %s', [(pk * 8 + 4,) for pk in deleted])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_pizza_ingredient_cost'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_deleted_images, migrations.RunPython.noop),
+    ]
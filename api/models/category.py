@@ -1,16 +1,141 @@
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import DEFERRED, Q
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 
 
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, category, include_self=True):
+        """
+        ``category`` and all its descendants, whatever their depth, in one query.
+        """
+        descendants = Q(path__startswith=category.subtree_path)
+        return self.filter(descendants | Q(pk=category.pk) if include_self else descendants)
+
+    def ancestors(self, category):
+        return self.filter(pk__in=category.ancestor_ids)
+
+
+# Prefixes per subtree query: SQLite limits the parameters and the depth of an expression.
+SUBTREE_CHUNK_SIZE = 500
+
+
+def subtree_roots(paths):
+    """
+    The given subtree paths minus those nested under another one, whose descendants
+    the outer prefix already matches. A nested path sorts right after its prefix.
+    """
+    roots = []
+    for path in sorted(set(paths)):
+        if not roots or not path.startswith(roots[-1]):
+            roots.append(path)
+    return roots
+
+
+def attach_subtrees(categories):
+    """
+    Attaches their active descendants to the given categories with one more query,
+    so that CategorySchema renders the nested children without querying. Returns
+    the categories.
+    """
+    if not categories:
+        return categories
+    paths = subtree_roots(category.subtree_path for category in categories)
+    descendants = []
+    for start in range(0, len(paths), SUBTREE_CHUNK_SIZE):
+        chunk = paths[start:start + SUBTREE_CHUNK_SIZE]
+        descendants.extend(Category.objects.filter(is_deleted=False).filter(
+            reduce(or_, (Q(path__startswith=path) for path in chunk))
+        ))
+    build_tree([*categories, *sorted(descendants, key=lambda category: category.pk)])
+    return categories
+
+
+def build_tree(categories):
+    """
+    Links the given categories to their children in one pass, a category whose
+    parent is not in the list being a root. Returns the roots.
+    """
+    nodes = {}
+    for category in categories:
+        # A category may be fetched both on its own and as a descendant of another one.
+        nodes.setdefault(category.pk, category)
+    children = {pk: [] for pk in nodes}
+    roots = []
+    for category in nodes.values():
+        if category.parent_id in children:
+            children[category.parent_id].append(category)
+        else:
+            roots.append(category)
+    for category in categories:
+        category.subtree_children = sorted(children[category.pk], key=lambda child: child.pk)
+    return roots
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.SET_NULL)
+    # Materialized path: ids of the ancestors, root first, e.g. "/1/5/" ("/" for a root).
+    path = models.CharField(max_length=255, default='/', editable=False)
     is_deleted = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CategoryQuerySet.as_manager()
+
+    @property
+    def subtree_path(self):
+        # Prefix of the paths of all the descendants.
+        return f'{self.path}{self.pk}/'
+
+    @property
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.strip('/').split('/') if pk]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared by save(): the path only changes when the parent does.
+        instance._loaded_parent_id = instance.__dict__.get('parent_id', DEFERRED)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'parent', 'parent_id'} & set(update_fields):
+            return super().save(*args, **kwargs)
+        if not self._state.adding and self.parent_id == getattr(self, '_loaded_parent_id', DEFERRED):
+            # Not moved: the stored path is kept as is, it follows the moves of the ancestors.
+            if update_fields is None:
+                update_fields = [field.attname for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = set(update_fields) - {'path'}
+            return super().save(*args, **kwargs)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'path'}
+
+        if self.parent_id is None:
+            path = '/'
+        else:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            path = f'{parent_path}{self.parent_id}/'
+            if self.pk is not None and f'/{self.pk}/' in path:
+                raise ValidationError("A category cannot be moved under itself or one of its descendants.")
+        old_path = None if self.pk is None else (
+            Category.objects.filter(pk=self.pk).values_list('path', flat=True).first())
+        self.path = path
+        super().save(*args, **kwargs)
+        self._loaded_parent_id = self.parent_id
+        if old_path is not None and old_path != path:
+            # Moved: the whole subtree follows, with a single UPDATE.
+            old_prefix = f'{old_path}{self.pk}/'
+            Category.objects.filter(path__startswith=old_prefix).update(
+                path=Concat(models.Value(self.subtree_path), Substr('path', len(old_prefix) + 1)))
+
     def delete(self, *args, **kwargs):
         self.is_deleted = True
         self.save()
@@ -26,6 +151,42 @@ class Category(models.Model):
             models.Index(fields=['name']),
             models.Index(fields=['is_deleted']),
             models.Index(fields=['is_active']),
+            models.Index(fields=['path']),
         ]
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
+
+
+def rebuild_paths():
+    """
+    Recomputes every path from the parent links, for the writes that bypass
+    Category.save() (bulk_create, bulk_update, queryset updates). The oldest category
+    of a parent cycle is detached and becomes a root. Returns the number of rows fixed.
+    """
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    detached = set()
+    checked = set()
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in checked and node not in chain:
+            chain.append(node)
+            node = parents[node]
+        if node is not None and node in chain:
+            oldest = min(chain[chain.index(node):])
+            parents[oldest] = None
+            detached.add(oldest)
+        checked.update(chain)
+
+    paths = {}
+
+    def resolve(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = '/' if parent_id is None else f'{resolve(parent_id)}{parent_id}/'
+        return paths[pk]
+
+    stale = [Category(pk=pk, path=resolve(pk), parent_id=parents[pk])
+             for pk, path in Category.objects.values_list('id', 'path') if path != resolve(pk) or pk in detached]
+    Category.objects.bulk_update(stale, ['path', 'parent_id'], batch_size=500)
+    return len(stale)
@@ -1,42 +1,130 @@
+import os
+
+from django.conf import settings
 from django.db import models
-from PIL import Image as PILImage
+from django.utils import timezone
+
+
+class ImageBlob(models.Model):
+    """
+    Image file stored once under its SHA-256, shared by every Image with the same bytes.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    path = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.sha256
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count']),
+        ]
+        verbose_name = 'Image blob'
+        verbose_name_plural = 'Image blobs'
+
 
 class Image(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     image = models.ImageField(upload_to='images/')
+    blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='images')
     description = models.CharField(max_length=255, blank=True)
     is_default = models.BooleanField(default=False)
+    is_deleted = models.BooleanField(default=False)
+    processing_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ready')
+    derivatives = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.description or f"Image {self.id}"
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._loaded_image_name = instance.__dict__['image']
+        if 'blob_id' in instance.__dict__:
+            instance._loaded_blob_id = instance.blob_id
+        return instance
+
+    def save(self, *args, enqueue=True, **kwargs):
+        from api import blobs
+
+        if self._state.adding:
+            file_changed = bool(self.image)
+        else:
+            file_changed = ('_loaded_image_name' in self.__dict__
+                            and self.image.name != self._loaded_image_name)
+        if file_changed:
+            blobs.attach(self)
+        if file_changed and enqueue:
+            # Resizing and derivatives are generated by the `process_images` workers,
+            # unless another image already processed the same bytes.
+            shared = blobs.processed_derivatives(self.blob_id, exclude=self.pk)
+            if shared:
+                self.derivatives = shared
+                self.processing_status = 'ready'
+                enqueue = False
+            else:
+                self.derivatives = {}
+                self.processing_status = 'pending'
         super().save(*args, **kwargs)
 
-        img = PILImage.open(self.image.path)
-        if img.height > 800 or img.width > 800:
-            output_size = (800, 800)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
+        loaded_blob_id = self.__dict__.get('_loaded_blob_id')
+        if self.blob_id != loaded_blob_id:
+            blobs.acquire(self.blob_id)
+            blobs.release(loaded_blob_id)
+        self._loaded_image_name = self.image.name
+        self._loaded_blob_id = self.blob_id
+        if file_changed and enqueue:
+            ImageJob.objects.create(image=self)
+
+    def enqueue_processing(self):
+        self.processing_status = 'pending'
+        self.save(update_fields=['processing_status'])
+        return ImageJob.objects.create(image=self)
 
     def delete(self, *args, **kwargs):
-        try:
-            self.image.delete()
-        except Exception as e:
-            print(f"Error deleting image file: {e}")
+        # Shared blobs are released by the post_delete signal and removed by collect_blobs().
+        if self.blob_id is None:
+            try:
+                self.image.delete(save=False)
+                for path in self.derivatives.values():
+                    os.remove(os.path.join(settings.MEDIA_ROOT, path))
+            except Exception as e:
+                print(f"Error deleting image file: {e}")
         super().delete(*args, **kwargs)
 
-    def create_thumbnail(self):
-        img = PILImage.open(self.image.path)
-        img.thumbnail((200, 200))
-        thumbnail_path = self.image.path.replace('images/', 'thumbnails/')
-        img.save(thumbnail_path)
-        return thumbnail_path
+    def get_derivative_url(self, name):
+        path = self.derivatives.get(name)
+        return settings.MEDIA_URL + path if path else None
+
+    @staticmethod
+    def get_default():
+        return Image.objects.filter(id=1).first()
+
+    @staticmethod
+    async def aget_default():
+        return await Image.objects.filter(id=1).afirst()
 
     @staticmethod
     def cleanup_orphaned_images():
-        for image in Image.objects.all():
-            if not image.custom_pizzas.exists() and not image.ingredients.exists():
-                image.delete()
+        from api import blobs
+        from api.image_gc import delete_images, orphaned_images
+
+        deleted = 0
+        for count, files in delete_images(orphaned_images()):
+            blobs.unlink(files)
+            deleted += count
+        blobs.collect_blobs()
+        return deleted
 
     class Meta:
         indexes = [
@@ -45,3 +133,33 @@ class Image(models.Model):
         ]
         verbose_name = 'Image'
         verbose_name_plural = 'Images'
+
+
+class ImageJob(models.Model):
+    """
+    Database-backed queue of image processing work, drained by `manage.py process_images`.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.id} for image {self.image_id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        verbose_name = 'Image job'
+        verbose_name_plural = 'Image jobs'
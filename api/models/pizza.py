@@ -1,13 +1,37 @@
 from django.db import models
+from django.db.models import Prefetch
 from django.core.exceptions import ValidationError
 from django.urls import reverse
-from django.db.models.signals import m2m_changed
-from django.dispatch import receiver
 from django.utils import timezone
 
-from api.models.category import Category
+from api.models.category import Category, attach_subtrees
 from api.models.image import Image
-from api.models.ingredients import Ingredient
+from api.models.ingredients import Allergen, Ingredient
+
+
+class PizzaQuerySet(models.QuerySet):
+    def for_read(self):
+        """
+        Loads everything PizzaSchema renders with a fixed number of queries,
+        whatever the number of pizzas.
+        """
+        return self.prefetch_related(
+            Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+            Prefetch('ingredients__images', queryset=Image.objects.order_by('id')),
+            Prefetch('ingredients__allergens', queryset=Allergen.objects.order_by('id')),
+            Prefetch('custom_images', queryset=Image.objects.order_by('id')),
+            # Their subtrees are attached once the pizzas are fetched, see attach_category_subtrees().
+            Prefetch('category', queryset=Category.objects.filter(is_deleted=False).order_by('id')),
+        )
+
+
+def attach_category_subtrees(pizzas):
+    """
+    Attaches the whole subtrees of the categories prefetched by for_read(), whatever
+    their depth, with one more query. Returns the pizzas.
+    """
+    attach_subtrees([category for pizza in pizzas for category in pizza.category.all()])
+    return pizzas
 
 
 class Pizza(models.Model):
@@ -21,6 +45,12 @@ class Pizza(models.Model):
     custom_images = models.ManyToManyField(Image, related_name='custom_pizzas', blank=True)
     last_modified = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False)
+    # One bit per allergen of the ingredients, maintained by api.allergen_mask.
+    allergen_mask = models.BigIntegerField(default=0, editable=False)
+    # Sum of the ingredient costs, maintained by api.pricing.
+    ingredient_cost = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False)
+
+    objects = PizzaQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -36,16 +66,20 @@ class Pizza(models.Model):
                 if ingredient.type == 'meat':
                     raise ValidationError("Vegetarian pizza cannot contain meat ingredients.")
 
+    def get_custom_image(self):
+        # Served from the prefetch cache when the pizza comes from Pizza.objects.for_read().
+        custom_images = sorted(self.custom_images.all(), key=lambda image: image.id)
+        return custom_images[0] if custom_images else None
+
     def get_image(self):
-        if self.custom_images.exists():
-            return self.custom_images.first()
-        return Image.objects.filter(id=1).first()
+        return self.get_custom_image() or Image.get_default()
 
     def get_absolute_url(self):
         return reverse('pizza_detail', args=[str(self.id)])
 
     def total_ingredient_cost(self):
-        return sum(ingredient.cost for ingredient in self.ingredients.all())
+        # Kept up to date by api.pricing, see verify_pizza_costs.
+        return self.ingredient_cost
 
     def delete(self):
         self.is_deleted = True
@@ -62,13 +96,6 @@ class Pizza(models.Model):
         ]
 
 
-@receiver(m2m_changed, sender=Pizza.ingredients.through)
-def update_pizza_price(sender, instance, action, **kwargs):
-    if action == ['post_add', 'post_remove']:
-        instance.price = instance.total_ingredient_cost()
-        instance.save()
-
-
 class PizzaHistory(models.Model):
     pizza = models.ForeignKey(Pizza, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
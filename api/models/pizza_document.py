@@ -0,0 +1,27 @@
+from django.db import models
+
+from api.models.pizza import Pizza
+
+
+class PizzaDocument(models.Model):
+    """
+    Read model of the catalog: one row per pizza holding its rendered PizzaSchema,
+    maintained by api.read_model.
+    """
+    pizza = models.OneToOneField(Pizza, on_delete=models.CASCADE, primary_key=True, related_name='document')
+    name = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=5, decimal_places=2)
+    is_deleted = models.BooleanField(default=False)
+    document = models.JSONField()
+    rendered_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Pizza document'
+        verbose_name_plural = 'Pizza documents'
+        indexes = [
+            models.Index(fields=['is_deleted', 'name']),
+            models.Index(fields=['is_deleted', 'price']),
+        ]
@@ -0,0 +1,118 @@
+import base64
+import binascii
+import json
+from typing import Any, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from ninja import Field, Schema
+from ninja.conf import settings as ninja_settings
+from ninja.pagination import AsyncPaginationBase
+
+from api.exception import BadRequestError
+
+
+class CursorPagination(AsyncPaginationBase):
+    """
+    Keyset pagination on ``(sort_key, id)``.
+
+    The cursor is an opaque token holding the sort key and id of the last item of the
+    previous page, so every page is a single indexed range scan whatever its depth.
+    Items may be model instances or dicts (e.g. rendered documents). ``prepare`` is
+    called with the instances of the page once fetched, e.g. to attach related rows.
+    """
+
+    class Input(Schema):
+        cursor: Optional[str] = None
+        limit: int = Field(ninja_settings.PAGINATION_PER_PAGE, ge=1)
+        ordering: Optional[str] = None
+
+    class Output(Schema):
+        items: List[Any]
+        next: Optional[str] = None
+
+    def __init__(self, orderings=('id',), max_limit=None, prepare=None, **kwargs):
+        self.orderings = orderings
+        self.prepare = prepare
+        self.max_limit = max_limit or ninja_settings.PAGINATION_MAX_LIMIT
+        super().__init__(**kwargs)
+
+    def paginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        queryset, ordering, limit = self._page_queryset(queryset, pagination)
+        items = list(queryset)
+        if self._preparable(items):
+            self.prepare(items)
+        return self._page(items, ordering, limit)
+
+    async def apaginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        queryset, ordering, limit = self._page_queryset(queryset, pagination)
+        items = [item async for item in queryset]
+        if self._preparable(items):
+            await sync_to_async(self.prepare)(items)
+        return self._page(items, ordering, limit)
+
+    def _preparable(self, items):
+        return self.prepare is not None and items and not isinstance(items[0], dict)
+
+    def _page_queryset(self, queryset, pagination):
+        ordering = pagination.ordering or self.orderings[0]
+        if ordering not in self.orderings:
+            raise BadRequestError(f"Invalid ordering, expected one of: {', '.join(self.orderings)}")
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        limit = min(pagination.limit, self.max_limit)
+
+        if field == 'id':
+            queryset = queryset.order_by('-pk' if descending else 'pk')
+        else:
+            queryset = queryset.order_by(ordering, '-pk' if descending else 'pk')
+
+        if pagination.cursor:
+            try:
+                queryset = queryset.filter(self._after(ordering, field, descending, pagination.cursor))
+            except (ValidationError, ValueError, TypeError):
+                # A well-formed cursor whose value does not fit the field.
+                raise BadRequestError("Invalid cursor")
+        # One extra row tells whether there is a next page.
+        return queryset[:limit + 1], ordering, limit
+
+    def _page(self, items, ordering, limit):
+        field = ordering.lstrip('-')
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            if isinstance(last, dict):
+                next_cursor = self.encode_cursor(ordering, last[field], last['id'])
+            else:
+                next_cursor = self.encode_cursor(ordering, getattr(last, field), last.pk)
+        return {'items': items, 'next': next_cursor}
+
+    @staticmethod
+    def encode_cursor(ordering, value, pk):
+        if not isinstance(value, (int, float, str)) and value is not None:
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        payload = json.dumps([ordering, value, pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            ordering, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise BadRequestError("Invalid cursor")
+        if (not isinstance(ordering, str) or not isinstance(value, (str, int, float, type(None)))
+                or not isinstance(pk, int) or isinstance(pk, bool)):
+            raise BadRequestError("Invalid cursor")
+        return ordering, value, pk
+
+    def _after(self, ordering, field, descending, cursor):
+        cursor_ordering, value, pk = self.decode_cursor(cursor)
+        if cursor_ordering != ordering:
+            raise BadRequestError("Cursor does not match the requested ordering")
+        op = 'lt' if descending else 'gt'
+        if field == 'id':
+            return Q(**{f'pk__{op}': pk})
+        return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
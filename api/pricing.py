@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+from api.models.pizza import Pizza
+
+PizzaIngredient = Pizza.ingredients.through
+
+
+def ingredient_cost_subquery():
+    """
+    ``SUM(ingredient.cost)`` of the ingredients of the outer pizza, 0 without ingredients.
+    """
+    total = (PizzaIngredient.objects.filter(pizza_id=OuterRef('pk'))
+             .values('pizza_id').annotate(total=Sum('ingredient__cost')).values('total'))
+    # Rounded: SQLite sums decimals as floats.
+    return Round(Coalesce(Subquery(total), Value(Decimal('0'))), 2,
+                 output_field=DecimalField(max_digits=8, decimal_places=2))
+
+
+def refresh_ingredient_costs(pizzas):
+    """
+    Recomputes ``Pizza.ingredient_cost`` with a single ``UPDATE ... SET ingredient_cost =
+    (SELECT SUM ...)``. ``pizzas`` is a list of ids or a queryset / subquery of ids.
+    Returns the number of updated rows.
+    """
+    return Pizza.objects.filter(id__in=pizzas).update(ingredient_cost=ingredient_cost_subquery())
+
+
+def pizzas_with_ingredients(ingredient_ids):
+    # A subquery: the affected pizzas are never loaded.
+    return PizzaIngredient.objects.filter(ingredient_id__in=ingredient_ids).values('pizza_id')
+
+
+def cost_drift(pizzas=None):
+    """
+    Pizzas whose stored ``ingredient_cost`` differs from the sum of their ingredient
+    costs, as ``(id, stored, expected)`` tuples.
+    """
+    queryset = Pizza.objects.all() if pizzas is None else Pizza.objects.filter(id__in=pizzas)
+    drifted = queryset.annotate(expected=ingredient_cost_subquery()).exclude(ingredient_cost=F('expected'))
+    return list(drifted.values_list('id', 'ingredient_cost', 'expected').order_by('id'))
@@ -0,0 +1,108 @@
+from django.db.models import Q
+
+from api.cache import invalidate_catalog
+from api.commit_queue import CommitQueue
+from api.models.category import Category
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza, attach_category_subtrees
+from api.models.pizza_document import PizzaDocument
+from api.schemas.pizza import PizzaSchema
+
+BATCH_SIZE = 200
+
+
+def render_pizzas(pizzas, context=None):
+    context = {} if context is None else context
+    for pizza in pizzas:
+        yield PizzaDocument(
+            pizza_id=pizza.id,
+            name=pizza.name,
+            price=pizza.price,
+            is_deleted=pizza.is_deleted,
+            document=PizzaSchema.from_orm(pizza, context=context).model_dump(mode='json'),
+        )
+
+
+def rebuild_pizza_documents(pizza_ids=None, batch_size=BATCH_SIZE):
+    """
+    Renders the documents of the given pizzas, or of the whole catalog when
+    ``pizza_ids`` is None, and upserts them. Returns the number of documents written.
+    """
+    pizzas = Pizza.objects.for_read()
+    if pizza_ids is None:
+        batches = _iter_batches(pizzas, batch_size)
+    else:
+        pizza_ids = sorted(set(pizza_ids))
+        batches = (pizzas.filter(id__in=pizza_ids[start:start + batch_size])
+                   for start in range(0, len(pizza_ids), batch_size))
+
+    written = 0
+    context = {}
+    for batch in batches:
+        documents = list(render_pizzas(attach_category_subtrees(list(batch)), context))
+        PizzaDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['pizza'],
+            update_fields=['name', 'price', 'is_deleted', 'document', 'rendered_at'],
+        )
+        written += len(documents)
+    return written
+
+
+def _iter_batches(pizzas, batch_size):
+    last_id = 0
+    while True:
+        batch = list(pizzas.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def affected_pizza_ids(instance):
+    """
+    Ids of the pizzas whose document embeds ``instance``.
+    """
+    if isinstance(instance, Pizza):
+        return [instance.pk]
+    if isinstance(instance, Ingredient):
+        pizzas = Pizza.objects.filter(ingredients=instance)
+    elif isinstance(instance, Allergen):
+        pizzas = Pizza.objects.filter(ingredients__allergens=instance)
+    elif isinstance(instance, Image):
+        if instance.pk == getattr(Image.get_default(), 'pk', None):
+            pizzas = Pizza.objects.all()
+        else:
+            pizzas = Pizza.objects.filter(Q(custom_images=instance) | Q(ingredients__images=instance))
+    elif isinstance(instance, Category):
+        # Categories are embedded with their children, so ancestors are affected as well.
+        pizzas = Pizza.objects.filter(category__in=[*instance.ancestor_ids, instance.pk])
+    else:
+        return []
+    return list(pizzas.values_list('id', flat=True).distinct())
+
+
+def m2m_affected_pizza_ids(instance, reverse, model, pk_set):
+    if reverse and pk_set:
+        if model is Pizza:
+            return list(pk_set)
+        return list(Pizza.objects.filter(ingredients__in=pk_set).values_list('id', flat=True).distinct())
+    return affected_pizza_ids(instance)
+
+
+def _rebuild_committed(pizza_ids):
+    rebuild_pizza_documents(pizza_ids)
+    # Responses cached while the documents were being rebuilt must not be served.
+    invalidate_catalog()
+
+
+pending_rebuilds = CommitQueue(_rebuild_committed)
+
+
+def schedule_rebuild(pizza_ids):
+    """
+    Queues the pizzas for a rebuild once the current transaction commits.
+    """
+    pending_rebuilds.add(pizza_ids)
@@ -0,0 +1,235 @@
+import fcntl
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image as PILImage, ImageOps
+
+from api.metrics import CACHE_REQUESTS
+
+# Output format -> (Pillow format, file extension, content type)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'avif': ('AVIF', 'avif', 'image/avif'),
+}
+
+
+def available_formats():
+    """
+    Configured formats that the installed Pillow can encode, best compression first.
+    """
+    PILImage.init()
+    configured = settings.IMAGE_RENDITIONS['FORMATS']
+    return [fmt for fmt in ('avif', 'webp', 'jpeg') if fmt in configured and FORMATS[fmt][0] in PILImage.SAVE]
+
+
+def negotiate_format(accept):
+    """
+    Picks the best available format listed in an Accept header, JPEG otherwise.
+    """
+    accept = accept or ''
+    for fmt in available_formats():
+        if fmt == 'jpeg' or FORMATS[fmt][2] in accept:
+            return fmt
+    return 'jpeg'
+
+
+def snap_width(width):
+    """
+    Rounds a requested width up to the closest configured width, so that clients
+    cannot make us render and store an unbounded number of variants.
+    """
+    widths = sorted(settings.IMAGE_RENDITIONS['WIDTHS'])
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+# Share of CACHE_MAX_BYTES the rendition cache is trimmed down to.
+LOW_WATER = 0.9
+
+# Source digests memoized per process, least recently used evicted first.
+DIGESTS_MAX_ENTRIES = 4096
+
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def source_digest(path):
+    """
+    SHA-256 of a source file, memoized on its size and modification time.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+            while len(_digests) > DIGESTS_MAX_ENTRIES:
+                _digests.popitem(last=False)
+    return digest
+
+
+def rendition_name(digest, width, fmt):
+    """
+    Content-hashed file name: the same source bytes, width and format always give the same name.
+    """
+    quality = settings.IMAGE_RENDITIONS['QUALITY']
+    key = hashlib.sha256(f'{digest}:{width}:{fmt}:{quality}'.encode()).hexdigest()[:32]
+    return f'{key}-{width}.{FORMATS[fmt][1]}'
+
+
+def render(path, width, fmt):
+    """
+    Encodes the source at ``path`` resized to ``width`` (never upscaled) in ``fmt``.
+    """
+    with PILImage.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), PILImage.LANCZOS)
+        if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        output = io.BytesIO()
+        img.save(output, FORMATS[fmt][0], quality=settings.IMAGE_RENDITIONS['QUALITY'], optimize=True)
+        return output.getvalue()
+
+
+class RenditionCache:
+    """
+    Disk cache of rendered files shared by the worker processes, bounded by the total
+    size of the directory. That total is kept in a lock file, updated under an
+    exclusive lock by every write; above ``max_bytes`` the directory is rescanned and
+    the least recently used files, by modification time (set on every write and
+    hit), are removed down to LOW_WATER of ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stamp = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _scan(self):
+        # (modification time, name, size) of the cached files, least recently used first.
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith('.') and not entry.name.endswith('.tmp'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        return sorted(files)
+
+    @contextmanager
+    def _locked_total(self):
+        """
+        Holds the directory lock and yields the lock file, which stores the total size
+        of the cached files (empty until the first write: a scan is needed).
+        """
+        with open(os.path.join(self.root, '.lock'), 'a+') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            lock.seek(0)
+            yield lock
+
+    def _touch(self, path):
+        # The clock of the file system is coarser than time_ns(): keep successive stamps apart.
+        with self._lock:
+            self._stamp = max(time.time_ns(), self._stamp + 1)
+            stamp = self._stamp
+        os.utime(path, ns=(stamp, stamp))
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def get(self, name):
+        path = self.path(name)
+        try:
+            with open(path, 'rb') as cached:
+                content = cached.read()
+            self._touch(path)
+        except FileNotFoundError:
+            # Never rendered, or evicted by a process.
+            return None
+        return content
+
+    def put(self, name, content):
+        path = self.path(name)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as output:
+            output.write(content)
+        self._touch(temporary)
+        with self._locked_total() as lock:
+            stored = lock.read()
+            os.replace(temporary, path)
+            total = int(stored) + len(content) if stored else None
+            if total is None or total > self.max_bytes:
+                total = self._evict()
+            lock.seek(0)
+            lock.truncate()
+            lock.write(str(total))
+
+    def _evict(self):
+        # Called with the directory lock held. Returns the size of the files left.
+        files = self._scan()
+        total = sum(size for _, _, size in files)
+        if total <= self.max_bytes:
+            return total
+        # The most recent file is kept, even when larger than the bound.
+        for _, name, size in files[:-1]:
+            if total <= self.max_bytes * LOW_WATER:
+                break
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def stats(self):
+        files = self._scan()
+        return {'files': len(files), 'bytes': sum(size for _, _, size in files), 'max_bytes': self.max_bytes}
+
+
+_rendition_cache = None
+
+
+def get_rendition_cache():
+    global _rendition_cache
+    options = settings.IMAGE_RENDITIONS
+    root = os.path.join(settings.MEDIA_ROOT, options['CACHE_DIR'])
+    if _rendition_cache is None or _rendition_cache.root != root:
+        _rendition_cache = RenditionCache(root, options['CACHE_MAX_BYTES'])
+    return _rendition_cache
+
+
+def get_rendition(image, width, fmt):
+    """
+    Returns ``(content, name)`` of the rendition, rendering and caching it on a miss.
+    """
+    source = image.image.path
+    width = snap_width(width)
+    name = rendition_name(image.blob_id or source_digest(source), width, fmt)
+    cache = get_rendition_cache()
+    content = cache.get(name)
+    CACHE_REQUESTS.inc(cache='renditions', result='miss' if content is None else 'hit')
+    if content is None:
+        content = render(source, width, fmt)
+        cache.put(name, content)
+    return content, name
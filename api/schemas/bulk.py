@@ -0,0 +1,28 @@
+from typing import Optional
+
+from ninja import Schema
+
+
+class BulkErrorSchema(Schema):
+    index: int  # Position of the item in the request
+    field: Optional[str] = None
+    detail: str
+
+
+class BulkResultSchema(Schema):
+    created: list[int] = []
+    updated: list[int] = []
+    errors: list[BulkErrorSchema] = []
+
+
+class ImportErrorSchema(Schema):
+    line: int  # Line of the record in the file
+    field: Optional[str] = None
+    detail: str
+
+
+class ImportResultSchema(Schema):
+    created: int
+    updated: int
+    failed: int
+    errors: list[ImportErrorSchema] = []  # The first MAX_ERRORS ones
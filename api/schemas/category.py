@@ -1,4 +1,5 @@
 from ninja import Schema
+from datetime import datetime
 from typing import Optional, List
 from pydantic import validator
 
@@ -11,12 +12,22 @@ class CategorySchema(Schema):
     is_deleted: bool
     parent_id: Optional[int] = None
     children: List['CategorySchema'] = []  # Gestion des sous-catégories
-    created_at: Optional[str] = None
-    updated_at: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
 
+    @staticmethod
+    def resolve_children(obj):
+        if isinstance(obj, dict):  # already rendered (PizzaDocument)
+            return obj.get('children', [])
+        if hasattr(obj, 'subtree_children'):  # api.models.category.attach_subtrees()
+            return obj.subtree_children
+        if 'children' in getattr(obj, '_prefetched_objects_cache', {}):
+            return obj.children.all()
+        return obj.children.filter(is_deleted=False)
+
 
 class CategoryCreateSchema(Schema):
     name: str
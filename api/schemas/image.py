@@ -1,3 +1,5 @@
+from typing import Optional
+
 from ninja import Schema
 from pydantic import validator
 
@@ -7,7 +9,14 @@ class ImageSchema(Schema):
     image: str
     description: str = ""
     is_default: bool = False
-    thumbnail: str = None  # Ajout du champ pour la miniature
+    thumbnail: Optional[str] = None  # Ajout du champ pour la miniature
+    processing_status: Optional[str] = None
+
+    @staticmethod
+    def resolve_thumbnail(obj):
+        if isinstance(obj, dict):
+            return obj.get('thumbnail')
+        return obj.get_derivative_url('thumbnail')
 
     @validator('image')
     def validate_image_path(cls, value):
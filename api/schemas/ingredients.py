@@ -1,3 +1,5 @@
+from typing import Optional
+
 from ninja import Schema
 from pydantic import validator
 from enum import Enum
@@ -12,27 +14,39 @@ class IngredientType(str, Enum):
     other = 'other'
 
 
+class AllergenCreateSchema(Schema):
+    name: str
+    description: str = 'some default description'
+
+
 class IngredientCreateSchema(Schema):
     name: str
     description: str
     type: IngredientType
-    allergens: str = ''
+    allergens: list[str] = []
     images: list[int] = []
 
     @validator('allergens', pre=True, always=True)
     def validate_allergens(cls, value):
+        # Names, given as a list or comma separated.
         if isinstance(value, str):
-            return [allergen.strip() for allergen in value.split(',')]
-        return value
+            value = value.split(',')
+        return [allergen.strip() for allergen in value if allergen.strip()]
 
 
 class IngredientUpdateSchema(Schema):
     name: str = None
     description: str = None
     type: IngredientType = None
-    allergens: str = None
+    allergens: Optional[list[str]] = None
     images: list[int] = None
 
+    @validator('allergens', pre=True)
+    def validate_allergens(cls, value):
+        if value is None:
+            return value
+        return IngredientCreateSchema.validate_allergens(value)
+
 
 class IngredientSchema(Schema):
     id: int
@@ -3,10 +3,11 @@ from typing import Optional
 from ninja import Schema
 from pydantic import conlist, validator
 
+from ..models.image import Image
 from ..models.pizza import Pizza
 from ..schemas.category import CategorySchema
 from ..schemas.image import ImageSchema
-from ..schemas.ingredients import IngredientCreateSchema, IngredientSchema
+from ..schemas.ingredients import IngredientCreateSchema, IngredientSchema, IngredientType
 
 
 class PizzaCreateSchema(Schema):
@@ -38,7 +39,7 @@ class PizzaUpdateSchema(Schema):
     price: float = None
     vegetarian: bool = None
     available: bool = None
-    ingredients: conlist(int, min_length=3) = None
+    ingredients: Optional[conlist(int, min_length=3)] = None
     categories: list[int] = None
     default_image: int = None
     custom_images: list[int] = None
@@ -56,6 +57,37 @@ class PizzaUpdateSchema(Schema):
         return value
 
 
+def split_commas(value):
+    # Lists are given as repeated parameters, comma separated values or both.
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    return [item.strip() for part in value for item in str(part).split(',') if item.strip()]
+
+
+class PizzaFilterSchema(Schema):
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    vegetarian: Optional[bool] = None
+    available: Optional[bool] = None
+    ingredient_type: Optional[IngredientType] = None
+    ingredients: list[int] = []  # All of them
+    exclude_ingredients: list[int] = []
+    allergen_free: list[str] = []  # Allergen names
+    category: Optional[int] = None  # With its subcategories
+
+    @validator('ingredients', 'exclude_ingredients', 'allergen_free', pre=True)
+    def split_lists(cls, value):
+        return split_commas(value)
+
+    @validator('max_price')
+    def check_price_range(cls, value, values):
+        if value is not None and values.get('min_price') is not None and value < values['min_price']:
+            raise ValueError("max_price must not be lower than min_price")
+        return value
+
+
 class PizzaSchema(Schema):
     id: int
     name: str
@@ -70,3 +102,28 @@ class PizzaSchema(Schema):
     class Config:
         orm_mode = True
 
+    @staticmethod
+    def resolve_image(obj, context=None):
+        if isinstance(obj, dict):  # already rendered (PizzaDocument)
+            return obj.get('image')
+        custom_image = obj.get_custom_image()
+        if custom_image is not None:
+            return custom_image
+        # The default image is shared by every pizza of the response, load it once per serialization.
+        if context is None:
+            return Image.get_default()
+        if 'default_pizza_image' not in context:
+            request = context.get('request')
+            if hasattr(request, 'default_pizza_image'):
+                # Preloaded by the async views, the ORM can't be queried from the event loop.
+                context['default_pizza_image'] = request.default_pizza_image
+            else:
+                context['default_pizza_image'] = Image.get_default()
+        return context['default_pizza_image']
+
+    @staticmethod
+    def resolve_categories(obj):
+        if isinstance(obj, dict):
+            return obj.get('categories', [])
+        return obj.category.all()
+
@@ -0,0 +1,8 @@
+from ninja import Schema
+
+
+class SearchResultSchema(Schema):
+    type: str
+    id: int
+    name: str
+    score: float
@@ -0,0 +1,339 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from api.cache import invalidate_catalog
+from api.commit_queue import CommitQueue
+from api.models.category import Category
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+
+SearchDocument = namedtuple('SearchDocument', ['entity', 'object_id', 'name', 'body'])
+SearchHit = namedtuple('SearchHit', ['entity', 'object_id', 'name', 'score'])
+
+# Entity codes are part of the FTS rowid (object_id * 8 + code) so rows can be replaced by rowid.
+ENTITY_CODES = {'pizza': 1, 'ingredient': 2, 'category': 3, 'image': 4}
+NAME_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Same normalization as the FTS5 ``unicode61 remove_diacritics 2`` tokenizer.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_RE.findall(text.lower())
+
+
+def _join(*parts):
+    return ' '.join(part for part in parts if part)
+
+
+def build_documents(entity, ids=None):
+    if entity == 'pizza':
+        objects = Pizza.objects.filter(is_deleted=False).prefetch_related('ingredients__allergens')
+    elif entity == 'ingredient':
+        objects = Ingredient.objects.prefetch_related('allergens')
+    elif entity == 'category':
+        objects = Category.objects.filter(is_deleted=False)
+    else:
+        objects = Image.objects.filter(is_deleted=False)
+    if ids is not None:
+        objects = objects.filter(id__in=ids)
+
+    for obj in objects.iterator(chunk_size=500):
+        if entity == 'pizza':
+            ingredients = list(obj.ingredients.all())
+            allergens = {allergen.name for ingredient in ingredients for allergen in ingredient.allergens.all()}
+            body = _join(obj.description, *(i.name for i in ingredients), *sorted(allergens))
+            yield SearchDocument(entity, obj.id, obj.name, body)
+        elif entity == 'ingredient':
+            body = _join(obj.description, obj.type, *(allergen.name for allergen in obj.allergens.all()))
+            yield SearchDocument(entity, obj.id, obj.name, body)
+        elif entity == 'category':
+            yield SearchDocument(entity, obj.id, obj.name, obj.description)
+        else:
+            yield SearchDocument(entity, obj.id, obj.description or str(obj), '')
+
+
+class SQLiteFTSBackend:
+    """
+    Index stored in the ``api_search_index`` FTS5 table created by migration 0013.
+    """
+    table = 'api_search_index'
+
+    @staticmethod
+    def is_available():
+        if connection.vendor != 'sqlite':
+            return False
+        return SQLiteFTSBackend.table in connection.introspection.table_names()
+
+    @staticmethod
+    def _match_expression(query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        # Every token is quoted, so user input can't use the FTS5 query syntax.
+        return ' AND '.join(f'"{token}"*' for token in tokens)
+
+    def is_empty(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {self.table} LIMIT 1')
+            return cursor.fetchone() is None
+
+    def index(self, documents):
+        rows = [
+            (document.object_id * 8 + ENTITY_CODES[document.entity], document.entity, document.object_id,
+             document.name, document.body)
+            for document in documents
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, entity, object_id, name, body) VALUES (%s, %s, %s, %s, %s)', rows
+            )
+
+    def remove(self, keys):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [(object_id * 8 + ENTITY_CODES[entity],) for entity, object_id in keys],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def search(self, query, entities=None, limit=20):
+        match = self._match_expression(query)
+        if match is None:
+            return []
+        sql = (f'SELECT entity, object_id, name, bm25({self.table}, 0, 0, %s, %s) AS rank '
+               f'FROM {self.table} WHERE {self.table} MATCH %s')
+        params = [NAME_WEIGHT, BODY_WEIGHT, match]
+        if entities:
+            sql += f' AND entity IN ({", ".join(["%s"] * len(entities))})'
+            params += list(entities)
+        sql += ' ORDER BY rank LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25() is lower for better matches.
+            return [SearchHit(entity, object_id, name, -rank) for entity, object_id, name, rank in cursor.fetchall()]
+
+    def matching_ids(self, entity, query):
+        match = self._match_expression(query)
+        if match is None:
+            return []
+        return RawSQL(f'SELECT object_id FROM {self.table} WHERE {self.table} MATCH %s AND entity = %s',
+                      [match, entity])
+
+
+class PythonSearchBackend:
+    """
+    In-process inverted index, used when FTS5 is not available. Each process builds it
+    from the database on first use and only sees the index updates made in that process.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents = {}
+        self._postings = defaultdict(dict)
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+
+    def is_empty(self):
+        return not self._documents
+
+    def index(self, documents):
+        with self._lock:
+            for document in documents:
+                key = (document.entity, document.object_id)
+                self._remove(key)
+                weights = defaultdict(float)
+                for token in tokenize(document.name):
+                    weights[token] += NAME_WEIGHT
+                for token in tokenize(document.body):
+                    weights[token] += BODY_WEIGHT
+                for token, weight in weights.items():
+                    if token not in self._postings:
+                        self._vocabulary_dirty = True
+                    self._postings[token][key] = weight
+                self._documents[key] = (document.name, tuple(weights))
+
+    def remove(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._documents.pop(key, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            postings = self._postings[token]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._postings.clear()
+            self._vocabulary = []
+
+    def _expand(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        return self._vocabulary[start:end]
+
+    def _scores(self, query, entities=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = None
+            for prefix in tokens:
+                token_scores = defaultdict(float)
+                for token in self._expand(prefix):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total / len(postings))
+                    for key, weight in postings.items():
+                        if entities is None or key[0] in entities:
+                            token_scores[key] += weight * idf
+                if scores is None:
+                    scores = token_scores
+                else:
+                    # Every query token has to match, like the FTS5 AND query.
+                    scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+                if not scores:
+                    return {}
+            return scores
+
+    def search(self, query, entities=None, limit=20):
+        scores = self._scores(query, entities)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [SearchHit(key[0], key[1], self._documents[key][0], score) for key, score in ranked]
+
+    def matching_ids(self, entity, query):
+        return [object_id for _, object_id in self._scores(query, {entity})]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """
+    The backend named by settings.SEARCH_BACKEND, or FTS5 when its table exists and the
+    in-process index otherwise. The index is filled from the database on first use.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.SEARCH_BACKEND:
+                    backend = import_string(settings.SEARCH_BACKEND)()
+                elif SQLiteFTSBackend.is_available():
+                    backend = SQLiteFTSBackend()
+                else:
+                    backend = PythonSearchBackend()
+                if backend.is_empty():
+                    rebuild_index(backend)
+                _backend = backend
+    return _backend
+
+
+def rebuild_index(backend=None):
+    backend = backend or get_search_backend()
+    backend.clear()
+    indexed = 0
+    for entity in ENTITY_CODES:
+        documents = list(build_documents(entity))
+        backend.index(documents)
+        indexed += len(documents)
+    return indexed
+
+
+def reindex(keys):
+    """
+    Refreshes the given ``(entity, object_id)`` entries; objects that are gone or
+    soft-deleted are removed from the index.
+    """
+    backend = get_search_backend()
+    ids_by_entity = defaultdict(set)
+    for entity, object_id in keys:
+        ids_by_entity[entity].add(object_id)
+    for entity, ids in ids_by_entity.items():
+        documents = list(build_documents(entity, ids))
+        backend.remove([(entity, object_id) for object_id in ids - {document.object_id for document in documents}])
+        backend.index(documents)
+
+
+def search(query, entities=None, limit=20):
+    return get_search_backend().search(query, entities, limit)
+
+
+def matching_ids(entity, query):
+    """
+    Ids of the ``entity`` objects matching ``query``, usable as ``id__in``.
+    """
+    return get_search_backend().matching_ids(entity, query)
+
+
+def _pizza_keys(pizzas):
+    return [('pizza', pizza_id) for pizza_id in pizzas.values_list('id', flat=True).distinct()]
+
+
+def affected_keys(instance):
+    if isinstance(instance, Pizza):
+        return [('pizza', instance.pk)]
+    if isinstance(instance, Ingredient):
+        return [('ingredient', instance.pk)] + _pizza_keys(Pizza.objects.filter(ingredients=instance))
+    if isinstance(instance, Allergen):
+        ingredient_ids = list(instance.ingredients.values_list('id', flat=True))
+        return ([('ingredient', ingredient_id) for ingredient_id in ingredient_ids]
+                + _pizza_keys(Pizza.objects.filter(ingredients__in=ingredient_ids)))
+    if isinstance(instance, Category):
+        return [('category', instance.pk)]
+    if isinstance(instance, Image):
+        return [('image', instance.pk)]
+    return []
+
+
+def m2m_affected_keys(instance, reverse, model, pk_set):
+    if reverse and pk_set:
+        if model is Pizza:
+            return [('pizza', pizza_id) for pizza_id in pk_set]
+        return ([('ingredient', ingredient_id) for ingredient_id in pk_set]
+                + _pizza_keys(Pizza.objects.filter(ingredients__in=pk_set)))
+    return affected_keys(instance)
+
+
+def _reindex_committed(keys):
+    reindex(keys)
+    invalidate_catalog()
+
+
+pending_reindex = CommitQueue(_reindex_committed)
+
+
+def schedule_reindex(keys):
+    pending_reindex.add(keys)
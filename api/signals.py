@@ -1,15 +1,99 @@
-from django.db.models.signals import post_save, post_delete, post_migrate
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
-from django.utils import timezone
 
+from .allergen_mask import linked_pizza_ids, m2m_masked_pizza_ids, refresh_allergen_masks
+from .blobs import release
+from .pricing import pizzas_with_ingredients, refresh_ingredient_costs
+from .cache import invalidate_catalog
+from .models.category import Category
+from .models.image import Image
+from .models.ingredients import Allergen, Ingredient
 from .models.pizza import Pizza
+from .read_model import affected_pizza_ids, m2m_affected_pizza_ids, schedule_rebuild
+from .search import affected_keys, m2m_affected_keys, schedule_reindex
 
+CATALOG_MODELS = [Pizza, Ingredient, Allergen, Category, Image]
+CATALOG_RELATIONS = [
+    Pizza.category.through,
+    Pizza.ingredients.through,
+    Pizza.custom_images.through,
+    Ingredient.allergens.through,
+    Ingredient.images.through,
+]
 
-@receiver(post_save, sender=Pizza)
-def update_last_modified(sender, instance, created, **kwargs):
-    if not  created and instance.has_changed('last_modified'):
-        instance.last_modified = timezone.now()
-        instance.save(update_fields=['last_modified'])
+
+def bump_catalog_version(sender, action=None, **kwargs):
+    if action is not None and not action.startswith('post_'):
+        return
+    # The version must only move once the write is visible to other connections.
+    transaction.on_commit(invalidate_catalog)
+
+
+def rebuild_documents(sender, instance, **kwargs):
+    # Connected to pre_delete too: the links to the pizzas are gone after the delete.
+    schedule_rebuild(affected_pizza_ids(instance))
+    schedule_reindex(affected_keys(instance))
+
+
+def rebuild_documents_on_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        schedule_rebuild(m2m_affected_pizza_ids(instance, reverse, model, pk_set))
+        schedule_reindex(m2m_affected_keys(instance, reverse, model, pk_set))
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+    post_save.connect(rebuild_documents, sender=model, dispatch_uid=f'document_save_{model.__name__}')
+    pre_delete.connect(rebuild_documents, sender=model, dispatch_uid=f'document_delete_{model.__name__}')
+
+for through in CATALOG_RELATIONS:
+    m2m_changed.connect(bump_catalog_version, sender=through, dispatch_uid=f'catalog_m2m_{through.__name__}')
+    m2m_changed.connect(rebuild_documents_on_m2m, sender=through, dispatch_uid=f'document_m2m_{through.__name__}')
+
+
+def refresh_pizza_aggregates(through, pizza_ids):
+    # Allergen masks and ingredient costs, both derived from the ingredients of the pizzas.
+    refresh_allergen_masks(pizza_ids)
+    if through is Pizza.ingredients.through and pizza_ids:
+        refresh_ingredient_costs(pizza_ids)
+
+
+def refresh_aggregates_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # The links are gone once cleared, remember who they pointed to.
+        instance._aggregated_pizza_ids = linked_pizza_ids(sender, instance, reverse)
+    elif action == 'post_clear':
+        refresh_pizza_aggregates(sender, getattr(instance, '_aggregated_pizza_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh_pizza_aggregates(sender, m2m_masked_pizza_ids(sender, instance, reverse, pk_set))
+
+
+for through in (Pizza.ingredients.through, Ingredient.allergens.through):
+    m2m_changed.connect(refresh_aggregates_on_m2m, sender=through, dispatch_uid=f'aggregates_m2m_{through.__name__}')
+
+
+@receiver(pre_delete, sender=Allergen)
+@receiver(pre_delete, sender=Ingredient)
+def collect_aggregates_on_delete(sender, instance, **kwargs):
+    # Deletes remove the links without m2m_changed: refresh once they are gone.
+    instance._aggregated_pizza_ids = linked_pizza_ids(
+        Ingredient.allergens.through if sender is Allergen else Pizza.ingredients.through, instance, reverse=True)
+
+
+@receiver(post_delete, sender=Allergen)
+@receiver(post_delete, sender=Ingredient)
+def refresh_aggregates_on_delete(sender, instance, **kwargs):
+    refresh_pizza_aggregates(Ingredient.allergens.through if sender is Allergen else Pizza.ingredients.through,
+                             getattr(instance, '_aggregated_pizza_ids', []))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_costs_on_ingredient_save(sender, instance, created, update_fields=None, **kwargs):
+    # A new ingredient is on no pizza yet.
+    if not created and (update_fields is None or 'cost' in update_fields):
+        refresh_ingredient_costs(pizzas_with_ingredients([instance.pk]))
 
 
 @receiver(post_delete, sender=Pizza)
@@ -19,6 +103,12 @@ def delete_custom_images(sender, instance, **kwargs):
     #     image.delete()
 
 
+@receiver(post_delete, sender=Image)
+def release_image_blob(sender, instance, **kwargs):
+    # Also runs for queryset deletes, which skip Image.delete().
+    release(instance.blob_id)
+
+
 @receiver(post_migrate)
 def preload_data(sender, **kwargs):
     from django.conf import settings
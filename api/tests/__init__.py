@@ -0,0 +1,6 @@
+from ninja.testing import TestClient
+
+from api.api import api
+
+# Ninja registers one URL namespace per client, so the test modules share this one.
+client = TestClient(api)
@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from api.cache import CatalogCache, DjangoCacheBackend, LRUBackend, get_catalog_cache, invalidate_catalog
+from api.models.pizza import Pizza
+from api.tests import client
+
+
+class LRUBackendTest(SimpleTestCase):
+    def test_evicts_the_least_recently_used_entry(self):
+        backend = LRUBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (1, None, 3))
+
+    def test_version_bump_drops_every_entry(self):
+        backend = LRUBackend()
+        backend.set('a', 1)
+        version = backend.get_version()
+        self.assertEqual(backend.bump_version(), version + 1)
+        self.assertIsNone(backend.get('a'))
+
+    def test_version_is_shared_between_workers(self):
+        worker, other_worker = LRUBackend(), LRUBackend()
+        version = other_worker.get_version()
+        worker.bump_version()
+        self.assertEqual(other_worker.get_version(), version + 1)
+
+    def test_entries_expire_after_the_timeout(self):
+        backend = LRUBackend(timeout=10)
+        with mock.patch('api.cache.time.monotonic', return_value=100.0):
+            backend.set('a', 1)
+        with mock.patch('api.cache.time.monotonic', return_value=109.0):
+            self.assertEqual(backend.get('a'), 1)
+        with mock.patch('api.cache.time.monotonic', return_value=110.0):
+            self.assertIsNone(backend.get('a'))
+
+
+class CatalogCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_keys_ignore_parameter_order_and_empty_values(self):
+        cache = CatalogCache(LRUBackend())
+        key = cache.make_key('pizzas:list', self.factory.get('/?limit=20&ordering=price'))
+        self.assertEqual(cache.make_key('pizzas:list', self.factory.get('/?ordering=price&limit=20&cursor=')), key)
+        self.assertNotEqual(cache.make_key('pizzas:list', self.factory.get('/?limit=21&ordering=price')), key)
+        self.assertNotEqual(cache.make_key('pizzas:search', self.factory.get('/?limit=20&ordering=price')), key)
+        self.assertNotEqual(cache.make_key('pizzas:list', self.factory.get('/?limit=20&ordering=price'),
+                                           {'category_id': 1}), key)
+
+        cache.invalidate()
+        self.assertNotEqual(cache.make_key('pizzas:list', self.factory.get('/?limit=20&ordering=price')), key)
+
+    def test_counts_hits_and_misses(self):
+        cache = CatalogCache(DjangoCacheBackend(alias='default'))
+        key = cache.make_key('pizzas:list', self.factory.get('/'))
+        cache.get(key)
+        cache.set(key, (b'[]', 'application/json'))
+        cache.get(key)
+        self.assertEqual({name: cache.stats()[name] for name in ('hits', 'misses', 'hit_ratio')},
+                         {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+
+class CachedResponseTest(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+
+    def test_hit_until_a_write_bumps_the_version(self):
+        Pizza.objects.create(name='Margherita', description='Classic', price=8)
+        response = client.get('/pizzas/?limit=10&ordering=name')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = client.get('/pizzas/?ordering=name&limit=10')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual([pizza['name'] for pizza in response.json()['items']], ['Margherita'])
+
+        version = get_catalog_cache().backend.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Pizza.objects.create(name='Diavola', description='Spicy', price=10)
+        self.assertGreater(get_catalog_cache().backend.get_version(), version)
+        response = client.get('/pizzas/?limit=10&ordering=name')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([pizza['name'] for pizza in response.json()['items']], ['Diavola', 'Margherita'])
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(client.get('/pizzas/search/').status_code, 422)
+        self.assertEqual(client.get('/pizzas/?limit=10&ordering=unknown').status_code, 400)
+        self.assertEqual(client.get('/pizzas/?limit=10&ordering=unknown')['X-Cache'], 'MISS')
@@ -0,0 +1,95 @@
+import asyncio
+from unittest import mock
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from ninja import NinjaAPI
+
+from api.api import api
+from api.cache import CatalogCache, invalidate_catalog
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+from api.views.catalog_async import router as async_catalog_router
+
+# The async routes are only mounted on the API with settings.ASYNC_CATALOG_VIEWS.
+if settings.ASYNC_CATALOG_VIEWS:
+    async_api = api
+else:
+    async_api = NinjaAPI(urls_namespace='async-catalog-test')
+    async_api.add_router("/async/", async_catalog_router)
+
+urlpatterns = [
+    path('api/', async_api.urls),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncCatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        gluten = Allergen.objects.create(name='Gluten')
+        tomato, flour = Ingredient.objects.create(name='Tomato'), Ingredient.objects.create(name='Flour')
+        flour.allergens.add(gluten)
+        for name, ingredients in (('Marinara', [tomato]), ('Bianca', [flour])):
+            pizza = Pizza.objects.create(name=name, description=name, price=9)
+            pizza.ingredients.set(ingredients)
+
+    def setUp(self):
+        invalidate_catalog()
+
+    async def test_filter_resolves_allergens_off_the_event_loop(self):
+        response = await AsyncClient().get('/api/async/pizzas/filter/?allergen_free=Gluten')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([pizza['name'] for pizza in response.json()['items']], ['Marinara'])
+
+    async def test_cache_is_read_off_the_event_loop(self):
+        loops = []
+        get = CatalogCache.get
+
+        def tracked_get(cache, key):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return get(cache, key)
+
+        with mock.patch.object(CatalogCache, 'get', tracked_get):
+            response = await AsyncClient().get('/api/async/pizzas/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(loops, [None])
+
+
+@override_settings(ROOT_URLCONF=__name__, RATE_LIMIT={**settings.RATE_LIMIT, 'ANONYMOUS_LIMIT': 100})
+class AsyncStackTest(TransactionTestCase):
+    """
+    Requests through the whole middleware stack, committed data and all, as served
+    under ASGI.
+    """
+
+    def setUp(self):
+        invalidate_catalog()
+        tomato = Ingredient.objects.create(name='Tomato')
+        self.pizza = Pizza.objects.create(name='Marinara', description='Tomato, garlic', price=9)
+        self.pizza.ingredients.add(tomato)
+
+    def test_middleware_stack_is_async(self):
+        # Adapting a sync middleware is only logged in debug mode.
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    async def test_catalog_reads(self):
+        client = AsyncClient()
+        response = await client.get('/api/async/pizzas/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([pizza['name'] for pizza in response.json()['items']], ['Marinara'])
+        self.assertIn('X-RateLimit-Remaining', response)
+        if settings.INSTRUMENTATION['ENABLED']:
+            self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+        response = await client.get(f'/api/async/pizzas/{self.pizza.id}')
+        self.assertEqual(response.json()['ingredients'][0]['name'], 'Tomato')
+        response = await client.get('/api/async/ingredients/')
+        self.assertEqual([ingredient['name'] for ingredient in response.json()['items']], ['Tomato'])
+        self.assertEqual((await client.get('/api/async/pizzas/0')).status_code, 404)
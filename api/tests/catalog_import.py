@@ -0,0 +1,121 @@
+import gzip
+import io
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from api.catalog_import import import_catalog
+from api.export import export_chunks
+from api.models.category import Category
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+from api.models.pizza_document import PizzaDocument
+from api.tests import client
+
+
+def ndjson(*rows):
+    return io.BytesIO(''.join(json.dumps(row) + '\n' for row in rows).encode())
+
+
+class CatalogImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [Ingredient.objects.create(name=name) for name in ('Tomato', 'Mozzarella', 'Basil')]
+        Ingredient.objects.create(name='Ham', type='meat')
+
+    def test_ingredients_upsert_by_name(self):
+        stream = io.BytesIO(b'name,description,type,cost,allergens\n'
+                            b'Tomato,Red,vegetable,0.40,\n'
+                            b'Flour,White,other,0.10,Gluten|Wheat\n'
+                            b'Olive,Green,fruit,0.20,\n'
+                            b'Pepper,Hot,vegetable,abc,\n')
+        result = import_catalog(stream, 'ingredients', 'csv')
+
+        self.assertEqual((result.created, result.updated, result.failed), (1, 1, 2))
+        self.assertEqual([(error['line'], error['field']) for error in result.errors], [(5, 'cost'), (4, 'type')])
+        tomato = Ingredient.objects.get(id=self.ingredients[0].id)
+        self.assertEqual((tomato.description, str(tomato.cost)), ('Red', '0.40'))
+        flour = Ingredient.objects.get(name='Flour')
+        self.assertEqual(sorted(flour.allergens.values_list('name', flat=True)), ['Gluten', 'Wheat'])
+        self.assertEqual(Ingredient.objects.filter(name='Tomato').count(), 1)
+
+    def test_pizzas_by_ingredient_name(self):
+        category = Category.objects.create(name='Classic')
+        rows = [
+            {'name': 'Margherita', 'description': 'Classic', 'price': 8, 'vegetarian': True, 'available': True,
+             'ingredients': ['Tomato', 'Mozzarella', 'Basil'], 'categories': ['Classic']},
+            {'name': 'Veggie', 'description': 'Ham', 'price': 9, 'vegetarian': True, 'available': True,
+             'ingredients': ['Tomato', 'Mozzarella', 'Ham']},
+            {'name': 'Unknown', 'description': '-', 'price': 9, 'vegetarian': False, 'available': True,
+             'ingredients': ['Tomato', 'Mozzarella', 'Truffle']},
+        ]
+        result = import_catalog(ndjson(*rows), 'pizzas', 'ndjson', batch_size=2)
+        self.assertEqual((result.created, result.updated, result.failed), (1, 0, 2))
+
+        pizza = Pizza.objects.get(name='Margherita')
+        self.assertEqual(set(pizza.ingredients.all()), set(self.ingredients))
+        self.assertEqual(list(pizza.category.all()), [category])
+
+        # Imported again: the same pizza is updated, its ingredients replaced.
+        rows[0].update(price=10, ingredients=['Tomato', 'Mozzarella', 'Ham'], vegetarian=False)
+        result = import_catalog(ndjson(rows[0]), 'pizzas', 'ndjson')
+        self.assertEqual((result.created, result.updated), (0, 1))
+        pizza.refresh_from_db()
+        self.assertEqual(pizza.price, 10)
+        self.assertEqual(sorted(pizza.ingredients.values_list('name', flat=True)), ['Ham', 'Mozzarella', 'Tomato'])
+        self.assertEqual(Pizza.objects.filter(name='Margherita').count(), 1)
+
+    def test_categories_with_parent_names(self):
+        Category.objects.create(name='Classic', description='Old')
+        result = import_catalog(ndjson({'name': 'Classic', 'description': 'New'},
+                                       {'name': 'Roman', 'parent': 'Classic'},
+                                       {'name': 'Orphan', 'parent': 'Missing'}), 'categories', 'ndjson')
+        self.assertEqual((result.created, result.updated, result.failed), (2, 1, 1))
+        self.assertEqual(Category.objects.get(name='Classic').description, 'New')
+        self.assertEqual(Category.objects.get(name='Roman').parent.name, 'Classic')
+
+    @override_settings(PIZZA_READ_MODEL=True)
+    def test_categories_rebuild_the_pizza_documents(self):
+        classic = Category.objects.create(name='Classic')
+        roman = Category.objects.create(name='Roman', parent=classic)
+        with self.captureOnCommitCallbacks(execute=True):
+            margherita = Pizza.objects.create(name='Margherita', description='Pizza', price=8)
+            margherita.category.add(classic)
+            marinara = Pizza.objects.create(name='Marinara', description='Pizza', price=7)
+            marinara.category.add(roman)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_catalog(ndjson({'name': 'Seasonal'},
+                                           {'name': 'Roman', 'description': 'Thin', 'parent': 'Seasonal'},
+                                           {'name': 'Sicilian', 'parent': 'Classic'}),
+                                    'categories', 'ndjson', batch_size=2)
+        self.assertEqual((result.created, result.updated, result.failed), (2, 1, 0))
+
+        document = PizzaDocument.objects.get(pizza=margherita).document
+        self.assertEqual([c['name'] for c in document['categories'][0]['children']], ['Sicilian'])
+        document = PizzaDocument.objects.get(pizza=marinara).document
+        self.assertEqual(document['categories'][0]['description'], 'Thin')
+        self.assertEqual(Category.objects.get(name='Roman').path,
+                         f"/{Category.objects.get(name='Seasonal').id}/")
+
+    def test_export_round_trip(self):
+        Allergen.objects.create(name='Lactose')
+        self.ingredients[1].allergens.add(Allergen.objects.get(name='Lactose'))
+        exported = b''.join(export_chunks('ingredients', 'csv'))
+        result = import_catalog(io.BytesIO(exported), 'ingredients', 'csv')
+        self.assertEqual((result.created, result.updated, result.failed), (0, 4, 0))
+        self.assertEqual(b''.join(export_chunks('ingredients', 'csv')), exported)
+
+    def test_upload_endpoint(self):
+        content = gzip.compress(b'{"name": "Gluten", "description": "Wheat"}\nnot json\n')
+        response = client.post('/import/allergens', FILES={'file': SimpleUploadedFile('allergens.ndjson.gz', content)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'][0]['line'], 2)
+        self.assertEqual(Allergen.objects.get(name='Gluten').description, 'Wheat')
+
+        upload = SimpleUploadedFile('allergens.xml', b'')
+        self.assertEqual(client.post('/import/allergens', FILES={'file': upload}).status_code, 400)
+        upload = SimpleUploadedFile('orders.csv', b'')
+        self.assertEqual(client.post('/import/orders', FILES={'file': upload}).status_code, 404)
@@ -0,0 +1,113 @@
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models.category import Category, attach_subtrees, rebuild_paths, subtree_roots
+from api.models.ingredients import Ingredient
+from api.models.pizza import Pizza
+from api.tests import client
+
+
+class CategoryTreeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # menu > classic > roman > thin, menu > special
+        cls.menu = Category.objects.create(name='Menu')
+        cls.classic = Category.objects.create(name='Classic', parent=cls.menu)
+        cls.roman = Category.objects.create(name='Roman', parent=cls.classic)
+        cls.thin = Category.objects.create(name='Thin', parent=cls.roman)
+        cls.special = Category.objects.create(name='Special', parent=cls.menu)
+
+    def test_paths(self):
+        self.assertEqual(self.thin.path, f'/{self.menu.id}/{self.classic.id}/{self.roman.id}/')
+        self.assertEqual(list(Category.objects.ancestors(self.thin).order_by('id')),
+                         [self.menu, self.classic, self.roman])
+        self.assertEqual(set(Category.objects.subtree(self.classic, include_self=False)), {self.roman, self.thin})
+
+    def test_move_updates_subtree(self):
+        self.classic.parent = self.special
+        self.classic.save()
+        self.thin.refresh_from_db()
+        self.assertEqual(self.thin.path, f'/{self.menu.id}/{self.special.id}/{self.classic.id}/{self.roman.id}/')
+
+        self.classic.parent = self.thin
+        with self.assertRaises(ValidationError):
+            self.classic.save()
+        response = client.put(f'/categories/{self.menu.id}', json={'parent_id': self.roman.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_save_without_move_keeps_the_path(self):
+        roman = Category.objects.get(id=self.roman.id)
+        # Moved by another request since roman was loaded.
+        classic = Category.objects.get(id=self.classic.id)
+        classic.parent = self.special
+        classic.save()
+
+        roman.name = 'Rome'
+        with CaptureQueriesContext(connection) as queries:
+            roman.save()
+        # Only the UPDATE: the path of the parent and the stored one are not read.
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'FROM "api_category"' in query['sql']
+                          or 'UPDATE "api_category"' in query['sql']], ['UPDATE'])
+        roman.refresh_from_db()
+        self.assertEqual((roman.name, roman.path), ('Rome', f'/{self.menu.id}/{self.special.id}/{self.classic.id}/'))
+
+    def test_rebuild_paths(self):
+        Category.objects.filter(id=self.roman.id).update(parent=self.special)
+        Category.objects.filter(id=self.menu.id).update(parent=self.thin)  # cycle
+        self.assertEqual(rebuild_paths(), 3)  # menu, roman and thin
+        self.thin.refresh_from_db()
+        self.menu.refresh_from_db()
+        self.assertIsNone(self.menu.parent_id)
+        self.assertEqual(self.thin.path, f'/{self.menu.id}/{self.special.id}/{self.roman.id}/')
+
+    def test_tree_renders_from_one_fetch(self):
+        # One query for the ETag, one for the whole tree.
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/categories/tree')
+        self.assertEqual(len(queries), 2)
+        [menu] = response.json()
+        self.assertEqual([child['name'] for child in menu['children']], ['Classic', 'Special'])
+        self.assertEqual(menu['children'][0]['children'][0]['children'][0]['name'], 'Thin')
+
+        # Nested children of a list page come from a single extra query, whatever the depth.
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/categories/?limit=10')
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(response.json()['items'][1]['children'][0]['children'][0]['name'], 'Thin')
+
+    def test_nested_subtrees_are_fetched_once_by_chunks(self):
+        self.assertEqual(subtree_roots(['/1/5/', '/10/', '/1/', '/1/5/7/', '/2/']), ['/1/', '/10/', '/2/'])
+
+        extra = [Category.objects.create(name=f'Extra {index}') for index in range(3)]
+        with mock.patch('api.models.category.SUBTREE_CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as queries:
+            categories = attach_subtrees(list(Category.objects.order_by('id')))
+        # The categories, then the subtrees of menu and the extra roots, two by two.
+        self.assertEqual(len(queries), 3)
+        menu = categories[0]
+        self.assertEqual([child.name for child in menu.subtree_children], ['Classic', 'Special'])
+        self.assertEqual(menu.subtree_children[0].subtree_children[0].subtree_children[0].name, 'Thin')
+        self.assertEqual(categories[-1], extra[-1])
+        self.assertEqual(categories[-1].subtree_children, [])
+
+    def test_subtree_endpoints(self):
+        response = client.get(f'/categories/{self.classic.id}/descendants/')
+        self.assertEqual([item['name'] for item in response.json()['items']], ['Roman', 'Thin'])
+        response = client.get(f'/categories/{self.thin.id}/ancestors/')
+        self.assertEqual([item['name'] for item in response.json()], ['Menu', 'Classic', 'Roman'])
+
+        ingredients = [Ingredient.objects.create(name=name) for name in ('Tomato', 'Mozzarella', 'Basil')]
+        for name, category in (('Margherita', self.thin), ('Diavola', self.special), ('Marinara', self.classic)):
+            pizza = Pizza.objects.create(name=name, description=name, price=9)
+            pizza.ingredients.set(ingredients)
+            pizza.category.add(category)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'/categories/{self.classic.id}/pizzas/?ordering=name')
+        self.assertEqual([item['name'] for item in response.json()['items']], ['Margherita', 'Marinara'])
+        # ETag, category, pizzas (the subtree is a subquery), five prefetches, the
+        # category subtrees and the default image.
+        self.assertEqual(len(queries), 10)
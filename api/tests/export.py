@@ -0,0 +1,51 @@
+import csv
+import gzip
+import io
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.export import export_chunks
+from api.models.category import Category
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+from api.tests import client
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        allergen = Allergen.objects.create(name='Gluten')
+        cls.ingredients = [Ingredient.objects.create(name=name) for name in ('Tomato', 'Mozzarella', 'Basil')]
+        cls.ingredients[0].allergens.add(allergen)
+        category = Category.objects.create(name='Classic')
+        for index in range(25):
+            pizza = Pizza.objects.create(name=f'Pizza, {index}', description='Pizza', price=10)
+            pizza.ingredients.set(cls.ingredients)
+            pizza.category.add(category)
+
+    def test_ndjson_streams_by_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(export_chunks('pizzas', 'ndjson', chunk_size=10))
+        self.assertEqual(len(chunks), 3)
+        # One query for the pizzas, then one per prefetched relation for each chunk.
+        self.assertEqual(len(queries), 1 + 3 * 3)
+
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0]['ingredients'], sorted(ingredient.id for ingredient in self.ingredients))
+        self.assertEqual(rows[0]['price'], '10.00')
+
+    def test_gzipped_csv_endpoint(self):
+        response = client.get('/export/ingredients?format=csv', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(response.content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['name'] for row in rows], ['Tomato', 'Mozzarella', 'Basil'])
+        self.assertEqual(rows[0]['allergens'], 'Gluten')
+
+        self.assertEqual(client.get('/export/orders').status_code, 404)
+        self.assertEqual(client.get('/export/pizzas?format=xml').status_code, 400)
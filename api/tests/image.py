@@ -0,0 +1,254 @@
+import io
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from api import image_gc
+from api.image_gc import delete_images, orphaned_images, untracked_files
+from api.image_processing import claim_jobs, process_pending
+from api.models.image import Image, ImageBlob, ImageJob
+from api.models.pizza import Pizza
+from api import renditions
+from api.renditions import RenditionCache, get_rendition_cache, source_digest
+from api.tests import client
+
+
+class ImageProcessingTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def create_image(self, name, size=(1200, 900)):
+        os.makedirs(os.path.join(self.media_root, 'images'), exist_ok=True)
+        PILImage.new('RGB', size, 'red').save(os.path.join(self.media_root, 'images', name))
+        return Image.objects.create(image=f'images/{name}', description=name)
+
+    def test_save_queues_the_image_without_processing_it(self):
+        image = self.create_image('big.jpg')
+
+        self.assertEqual(image.processing_status, 'pending')
+        self.assertEqual(ImageJob.objects.filter(image=image, status='pending').count(), 1)
+        with PILImage.open(image.image.path) as img:
+            self.assertEqual(img.size, (1200, 900))
+
+        image.description = 'Renamed'
+        image.save()
+        self.assertEqual(ImageJob.objects.filter(image=image).count(), 1)
+
+    def test_worker_renders_derivatives(self):
+        image = self.create_image('big.jpg')
+
+        self.assertEqual(process_pending(), 1)
+
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertEqual(set(image.derivatives), {'thumbnail', 'medium'})
+        with PILImage.open(image.image.path) as img:
+            self.assertEqual(max(img.size), 800)
+        with PILImage.open(os.path.join(self.media_root, image.derivatives['thumbnail'])) as img:
+            self.assertEqual(max(img.size), 200)
+        self.assertEqual(ImageJob.objects.get(image=image).status, 'done')
+
+    def test_jobs_are_claimed_once(self):
+        self.create_image('a.jpg')
+        self.create_image('b.jpg')
+
+        self.assertEqual(len(claim_jobs(10)), 2)
+        self.assertEqual(claim_jobs(10), [])
+
+    @override_settings(IMAGE_PROCESSING={
+        'MAX_ATTEMPTS': 2, 'BATCH_SIZE': 10, 'MAX_SIZE': 800, 'DERIVATIVES': {'thumbnail': 200},
+    })
+    def test_failed_jobs_are_retried_then_marked_failed(self):
+        image = Image.objects.create(image='images/missing.jpg', description='Missing')
+
+        process_pending()
+        self.assertEqual(ImageJob.objects.get(image=image).status, 'pending')
+        process_pending()
+
+        job = ImageJob.objects.get(image=image)
+        image.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(job.error)
+        self.assertEqual(image.processing_status, 'failed')
+
+
+class BlobStoreTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        content = io.BytesIO()
+        PILImage.new('RGB', (100, 80), 'green').save(content, 'PNG')
+        self.content = content.getvalue()
+
+    def upload(self, name):
+        return Image.objects.create(image=SimpleUploadedFile(name, self.content), description=name)
+
+    def stored_files(self):
+        blobs = os.path.join(self.media_root, 'blobs')
+        return [os.path.join(root, name) for root, _, names in os.walk(blobs)
+                for name in names if not root.startswith(os.path.join(blobs, 'tmp'))]
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.upload('first.png')
+        second = self.upload('second.png')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 2)
+
+    def test_clone_reuses_the_blob_and_its_derivatives(self):
+        image = self.upload('first.png')
+        process_pending()
+
+        response = client.post(f'/images/{image.id}/clone/')
+
+        clone = Image.objects.get(id=response.json()['id'])
+        self.assertEqual(clone.blob_id, image.blob_id)
+        self.assertEqual(clone.processing_status, 'ready')
+        self.assertFalse(ImageJob.objects.filter(image=clone).exists())
+        self.assertEqual(ImageBlob.objects.get().ref_count, 2)
+
+    def test_cleanup_removes_unreferenced_blobs(self):
+        kept = self.upload('kept.png')
+        pizza = Pizza.objects.create(name='Margherita', description='Pizza', price=10)
+        pizza.custom_images.add(kept)
+        PILImage.new('RGB', (10, 10), 'white').save(content := io.BytesIO(), 'PNG')
+        Image.objects.create(image=SimpleUploadedFile('orphan.png', content.getvalue()))
+
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertEqual(Image.cleanup_orphaned_images(), 1)
+
+        self.assertEqual(list(ImageBlob.objects.values_list('sha256', flat=True)), [kept.blob_id])
+        self.assertEqual(self.stored_files(), [kept.image.path])
+
+    def test_gc_images_removes_orphans_and_untracked_files(self):
+        kept = self.upload('kept.png')
+        kept.ingredients.create(name='Basil')
+        Image.objects.create(image=SimpleUploadedFile('orphan.png', b'orphan'), description='Orphan')
+        os.makedirs(os.path.join(self.media_root, 'images'))
+        for name in ('stray.png', 'pizza_by_default.jpg'):
+            with open(os.path.join(self.media_root, 'images', name), 'wb') as stray:
+                stray.write(b'stray')
+        self.addCleanup(setattr, image_gc, 'GRACE_PERIOD', image_gc.GRACE_PERIOD)
+        image_gc.GRACE_PERIOD = -1
+
+        self.assertEqual(list(orphaned_images().values_list('description', flat=True)), ['Orphan'])
+        self.assertEqual([path for path, _ in untracked_files()], ['images/stray.png'])
+
+        call_command('gc_images', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(Image.objects.count(), 2)
+
+        call_command('gc_images', stdout=io.StringIO())
+        self.assertEqual(list(Image.objects.all()), [kept])
+        self.assertEqual(self.stored_files(), [kept.image.path])
+        self.assertEqual(list(untracked_files()), [])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'images', 'stray.png')))
+        # Shipped with the repository, referenced or not.
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, image_gc.DEFAULT_IMAGE)))
+
+    def test_images_linked_after_the_select_are_kept(self):
+        linked = Image.objects.create(image=SimpleUploadedFile('linked.png', b'linked'), description='Linked')
+        Image.objects.create(image=SimpleUploadedFile('orphan.png', b'orphan'), description='Orphan')
+        chunks = delete_images(orphaned_images(), chunk_size=2)
+
+        def atomic():
+            # Linked between the select of the chunk and its delete.
+            linked.ingredients.create(name='Basil')
+            return transaction.atomic()
+
+        with mock.patch.object(image_gc, 'transaction', SimpleNamespace(atomic=atomic)):
+            self.assertEqual(next(chunks)[0], 1)
+        self.assertEqual(list(Image.objects.all()), [linked])
+
+
+class RenditionTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'images'))
+        PILImage.new('RGBA', (1000, 500), 'blue').save(os.path.join(self.media_root, 'images', 'wide.png'))
+        self.image = Image.objects.create(image='images/wide.png', description='Wide')
+
+    def test_render_resizes_to_a_configured_width(self):
+        response = client.get(f'/images/{self.image.id}/render?w=300&fmt=webp')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with PILImage.open(io.BytesIO(response.content)) as img:
+            self.assertEqual(img.format, 'WEBP')
+            self.assertEqual(img.size, (320, 160))
+
+    def test_render_negotiates_the_format_and_reuses_the_cached_file(self):
+        first = client.get(f'/images/{self.image.id}/render?w=160', headers={'Accept': 'image/webp,*/*'})
+        second = client.get(f'/images/{self.image.id}/render?w=150', headers={'Accept': 'image/webp,*/*'})
+
+        self.assertEqual(first['Content-Type'], 'image/webp')
+        self.assertEqual(first['Vary'], 'Accept')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(get_rendition_cache().stats()['files'], 1)
+
+        fallback = client.get(f'/images/{self.image.id}/render?w=160')
+        self.assertEqual(fallback['Content-Type'], 'image/jpeg')
+
+    def test_render_rejects_unknown_formats(self):
+        response = client.get(f'/images/{self.image.id}/render?w=160&fmt=bmp')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_evicts_least_recently_used_files(self):
+        cache = RenditionCache(os.path.join(self.media_root, 'lru'), max_bytes=25)
+        cache.put('a', b'a' * 10)
+        cache.put('b', b'b' * 10)
+        cache.get('a')
+        cache.put('c', b'c' * 10)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'a' * 10)
+        self.assertEqual(cache.stats()['bytes'], 20)
+        self.assertEqual(sorted(name for name in os.listdir(cache.root) if not name.startswith('.')), ['a', 'c'])
+
+    def test_cache_bound_is_shared_by_the_processes(self):
+        root = os.path.join(self.media_root, 'shared')
+        workers = [RenditionCache(root, max_bytes=100), RenditionCache(root, max_bytes=100)]
+        for index in range(30):
+            workers[index % 2].put(f'{index:02}', b'x' * 10)
+            self.assertLessEqual(workers[0].stats()['bytes'], 100)
+
+        # Evicted least recently used first, whichever worker wrote the files.
+        self.assertEqual(sorted(name for name in os.listdir(root) if not name.startswith('.')),
+                         [f'{index:02}' for index in range(20, 30)])
+        self.assertIsNone(workers[1].get('19'))
+
+    def test_source_digests_are_memoized_up_to_a_bound(self):
+        paths = []
+        for index in range(3):
+            paths.append(os.path.join(self.media_root, 'images', f'{index}.txt'))
+            with open(paths[-1], 'w') as output:
+                output.write(str(index))
+        with mock.patch.object(renditions, '_digests', OrderedDict()), \
+                mock.patch.object(renditions, 'DIGESTS_MAX_ENTRIES', 2):
+            digests = [source_digest(path) for path in paths]
+            self.assertEqual(len(renditions._digests), 2)
+            self.assertEqual([key[0] for key in renditions._digests], paths[1:])
+            self.assertEqual(source_digest(paths[0]), digests[0])
@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.cache import invalidate_catalog
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+from api.tests import client
+
+
+class IngredientBulkTest(TestCase):
+    def test_creates_and_updates(self):
+        image = Image.objects.create(image='images/pizza_by_default.jpg', description='Default pizza')
+        Allergen.objects.create(name='Gluten')
+        ham = Ingredient.objects.create(name='Ham', type='meat')
+
+        items = [{'name': f'Ingredient {index}', 'description': 'Ingredient', 'type': 'vegetable',
+                  'allergens': 'Gluten, Celery', 'images': [image.id]} for index in range(20)]
+        items.append({'id': ham.id, 'name': 'Smoked ham', 'allergens': ['Sulphites']})
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/ingredients/bulk', json=items)
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertLess(len(queries), 20)
+        self.assertEqual(len(response.json()['created']), 20)
+        self.assertEqual(response.json()['updated'], [ham.id])
+
+        self.assertEqual(Allergen.objects.filter(name='Gluten').count(), 1)
+        ingredient = Ingredient.objects.get(id=response.json()['created'][0])
+        self.assertEqual(sorted(ingredient.allergens.values_list('name', flat=True)), ['Celery', 'Gluten'])
+        self.assertEqual(list(ingredient.images.all()), [image])
+        ham.refresh_from_db()
+        self.assertEqual(ham.name, 'Smoked ham')
+        self.assertEqual(list(ham.allergens.values_list('name', flat=True)), ['Sulphites'])
+
+    def test_reports_invalid_items(self):
+        response = client.post('/ingredients/bulk', json=[
+            {'name': 'Basil', 'description': 'Herb', 'type': 'herb'},
+            {'name': 'Tomato', 'description': 'Fruit', 'type': 'vegetable', 'images': [999]},
+            {'id': 999, 'name': 'Olive'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = {(error['index'], error['field']) for error in response.json()['errors']}
+        self.assertEqual(errors, {(0, 'type'), (1, 'images'), (2, 'id')})
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(Pizza.objects.exists())
+
+
+class IngredientReadQueriesTest(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+
+    def create_ingredients(self, count):
+        image = Image.objects.create(image='images/pizza_by_default.jpg', description='Default pizza')
+        gluten = Allergen.objects.get_or_create(name='Gluten')[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                ingredient = Ingredient.objects.create(name=f'Flour {index}', type='other')
+                ingredient.allergens.add(gluten)
+                ingredient.images.add(image)
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'][0]['allergens'], 'Gluten')
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_ingredients(self):
+        paths = ['/ingredients/?limit=100', '/ingredients/filter/?type=other&limit=100',
+                 '/ingredients/search/?name=flour&limit=100']
+        self.create_ingredients(2)
+        small_counts = [self.count_queries(path) for path in paths]
+
+        self.create_ingredients(20)
+        self.assertEqual([self.count_queries(path) for path in paths], small_counts)
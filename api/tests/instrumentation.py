@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from api.instrumentation import TimedJSONRenderer
+from api.metrics import REQUEST_QUERIES, REQUEST_STAGE_DURATION, RESPONSE_SIZE
+from api.middleware import InstrumentationMiddleware
+from api.models.category import Category
+from api.models.pizza import Pizza
+
+ROUTE = ('GET /api/instrumented/',)
+
+
+def observed(histogram, key):
+    # (count, sum) of a histogram's samples in this process.
+    sample = histogram.collect().get(key)
+    return (0, 0.0) if sample is None else (sum(sample[:-1]), sample[-1])
+
+
+class InstrumentationTest(TestCase):
+    def get_response(self, request):
+        request.resolver_match = SimpleNamespace(route='api/instrumented/')
+        data = list(Pizza.objects.values('name')) + list(Category.objects.values('name'))
+        content = TimedJSONRenderer().render(request, data, response_status=200)
+        return HttpResponse(content, content_type='application/json')
+
+    def snapshot(self):
+        return {
+            'total': observed(REQUEST_STAGE_DURATION, ROUTE + ('total',)),
+            'json_encoding': observed(REQUEST_STAGE_DURATION, ROUTE + ('json_encoding',)),
+            'queries': observed(REQUEST_QUERIES, ROUTE),
+            'size': observed(RESPONSE_SIZE, ROUTE),
+        }
+
+    def test_server_timing_and_route_histograms(self):
+        Pizza.objects.create(name='Regina', description='Pizza', price=11)
+        before = self.snapshot()
+        response = InstrumentationMiddleware(self.get_response)(RequestFactory().get('/api/instrumented/'))
+        after = self.snapshot()
+
+        timing = response['Server-Timing']
+        self.assertIn('app;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('json;dur=', timing)
+
+        self.assertEqual(after['total'][0] - before['total'][0], 1)
+        self.assertEqual(after['json_encoding'][0] - before['json_encoding'][0], 1)
+        self.assertEqual(after['queries'][1] - before['queries'][1], 2)
+        self.assertEqual(after['size'][1] - before['size'][1], len(response.content))
+
+    @override_settings(INSTRUMENTATION={'ENABLED': True, 'SAMPLE_RATE': 0, 'SERVER_TIMING': True})
+    def test_unsampled_requests_are_not_measured(self):
+        before = self.snapshot()
+        response = InstrumentationMiddleware(self.get_response)(RequestFactory().get('/api/instrumented/'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.snapshot(), before)
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from api.metrics import IMAGE_JOBS, Counter, Gauge, Histogram, Registry, get_registry
+from api.middleware import operation_labels
+from api.models.image import Image, ImageJob
+from api.tests import client
+from api.views.metrics import metrics
+
+
+class RegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.requests = Counter('requests_total', 'Requests.', ('status',), registry=self.registry)
+        self.latency = Histogram('latency_seconds', 'Latency.', registry=self.registry, buckets=(0.1, 1))
+        self.workers = Gauge('busy_workers', 'Busy workers.', registry=self.registry)
+
+    def test_text_format(self):
+        self.requests.inc(status=200)
+        self.requests.inc(2, status=200)
+        self.latency.observe(0.05)
+        self.latency.observe(5)
+        lines = self.registry.expose().splitlines()
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{status="200"} 3', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn('latency_seconds_count 2', lines)
+        self.assertIn('latency_seconds_sum 5.05', lines)
+
+    def test_finished_threads_are_folded_into_the_base(self):
+        def record():
+            self.requests.inc(status=200)
+            self.latency.observe(0.5)
+
+        for _ in range(5):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        record()
+
+        self.assertEqual(self.requests.collect(), {('200',): 6})
+        self.assertEqual(self.latency.collect(), {(): [0, 6, 0, 3.0]})
+        self.assertEqual(len(self.requests._shards), 1)
+        self.assertEqual(self.requests.collect(), {('200',): 6})
+
+    def test_processes_are_added_up_through_the_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.configure(directory, flush_interval=60)
+            self.requests.inc(status=200)
+            self.workers.set(2)
+            # An exited worker: its counters still count, its gauges no longer do.
+            exited = {'requests_total': [[['200'], 4], [['500'], 1]], 'busy_workers': [[[], 7]],
+                      'latency_seconds': []}
+            with open(os.path.join(directory, '999999999.json'), 'w') as output:
+                json.dump(exited, output)
+
+            totals = self.registry.collect()
+            self.assertEqual(totals['requests_total'], {('200',): 5, ('500',): 1})
+            self.assertEqual(totals['busy_workers'], {(): 2})
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+            self.registry.directory = None
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        IMAGE_JOBS._computed = None
+
+    def test_operation_labels(self):
+        match = next(filter(None, (url.resolve('pizzas/') for url in client.urls)))
+        request = RequestFactory().get('/api/pizzas/')
+        request.resolver_match = SimpleNamespace(route='api/pizzas/', func=match.func, view_name=match.view_name)
+        self.assertEqual(operation_labels(request), ('api', 'api_views_pizza_list_pizzas'))
+
+        request = RequestFactory().get('/metrics')
+        request.resolver_match = SimpleNamespace(route='metrics', func=metrics, view_name='metrics')
+        self.assertIsNone(operation_labels(request))
+
+    @override_settings(METRICS={**settings.METRICS, 'ALLOWED_IPS': ['10.0.0.1'], 'TOKEN': 's3cret'})
+    def test_scrapes_are_restricted(self):
+        self.assertEqual(metrics(RequestFactory().get('/metrics', REMOTE_ADDR='10.0.0.1')).status_code, 200)
+        self.assertEqual(metrics(RequestFactory().get('/metrics')).status_code, 403)
+        request = RequestFactory().get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(metrics(request).status_code, 200)
+        request = RequestFactory().get('/metrics', HTTP_AUTHORIZATION='Bearer guess')
+        self.assertEqual(metrics(request).status_code, 403)
+
+    def test_database_gauges_are_not_read_on_every_scrape(self):
+        metrics(RequestFactory().get('/metrics'))
+        ImageJob.objects.create(image=Image.objects.create(image='images/a.jpg', description='A'))
+        with self.assertNumQueries(0):
+            metrics(RequestFactory().get('/metrics'))
+
+        IMAGE_JOBS._computed_at -= get_registry().flush_interval + 1
+        pending = ImageJob.objects.filter(status='pending').count()
+        with self.assertNumQueries(1):
+            body = metrics(RequestFactory().get('/metrics')).content.decode()
+        self.assertIn(f'image_processing_jobs{{status="pending"}} {pending}', body)
+
+    def test_exposes_queue_depth_and_cache_ratios(self):
+        Image.objects.create(image='images/pizza_by_default.jpg', description='Default pizza')
+        pending = ImageJob.objects.filter(status='pending').count()
+        client.get('/pizzas/')
+        client.get('/pizzas/')
+
+        response = metrics(RequestFactory().get('/metrics'))
+        self.assertIsInstance(response, HttpResponse)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(f'image_processing_jobs{{status="pending"}} {pending}', body)
+        self.assertIn('cache_requests_total{cache="catalog",result="hit"}', body)
+        self.assertIn('cache_hit_ratio{cache="catalog"}', body)
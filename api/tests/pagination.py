@@ -0,0 +1,60 @@
+from django.test import TestCase
+
+from api.cache import invalidate_catalog
+from api.models.pizza import Pizza
+from api.pagination import CursorPagination
+from api.tests import client
+
+
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Two pizzas share each price, so pages have to break ties on the id.
+        for index, name in enumerate(('Bianca', 'Calzone', 'Diavola', 'Funghi', 'Margherita')):
+            Pizza.objects.create(name=name, description=name, price=8 + index // 2)
+
+    def setUp(self):
+        invalidate_catalog()
+
+    def pages(self, query):
+        names, cursor = [], None
+        while True:
+            url = f'/pizzas/?{query}' + (f'&cursor={cursor}' if cursor else '')
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            page = response.json()
+            names.append([pizza['name'] for pizza in page['items']])
+            cursor = page['next']
+            if cursor is None:
+                return names
+
+    def test_next_cursor_walks_every_page(self):
+        self.assertEqual(self.pages('limit=2&ordering=name'),
+                         [['Bianca', 'Calzone'], ['Diavola', 'Funghi'], ['Margherita']])
+        self.assertEqual(self.pages('limit=5'), [['Bianca', 'Calzone', 'Diavola', 'Funghi', 'Margherita']])
+
+    def test_descending_ordering(self):
+        # Ties on the price are in descending id order too.
+        self.assertEqual(self.pages('limit=2&ordering=-price'),
+                         [['Margherita', 'Funghi'], ['Diavola', 'Calzone'], ['Bianca']])
+        self.assertEqual(self.pages('limit=3&ordering=price'),
+                         [['Bianca', 'Calzone', 'Diavola'], ['Funghi', 'Margherita']])
+
+    def test_invalid_cursors(self):
+        cursor = client.get('/pizzas/?limit=2&ordering=price').json()['next']
+        invalid = {
+            'not base64': '%%%',
+            'not json': CursorPagination.encode_cursor('price', 8, 1)[:-3],
+            'another ordering': cursor,
+            'non-integer pk': CursorPagination.encode_cursor('price', 8, 'x'),
+            'boolean pk': CursorPagination.encode_cursor('price', 8, True),
+            'nested value': CursorPagination.encode_cursor('price', [8], 1),
+            'value of another type': CursorPagination.encode_cursor('price', 'cheap', 1),
+        }
+        for reason, cursor in invalid.items():
+            ordering = 'name' if reason == 'another ordering' else 'price'
+            with self.subTest(reason):
+                response = client.get(f'/pizzas/?limit=2&ordering={ordering}&cursor={cursor}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json()['detail'].lower())
+        self.assertEqual(client.get('/pizzas/?ordering=size').status_code, 400)
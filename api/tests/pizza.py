@@ -0,0 +1,370 @@
+import io
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import parse_http_date
+
+from api.cache import SharedVersion
+from api.filters import filtered_pizzas
+from api.models.category import Category
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza, PizzaHistory
+from api.models.pizza_document import PizzaDocument
+from api.schemas.pizza import PizzaFilterSchema
+from api.tests import client
+
+
+class PizzaReadQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.allergen = Allergen.objects.create(name='Gluten')
+        cls.image = Image.objects.create(image='images/pizza_by_default.jpg', description='Default pizza')
+        menu = Category.objects.create(name='Menu')
+        cls.categories = [Category.objects.create(name=name, parent=menu) for name in ('Classic', 'Special')]
+        Category.objects.create(name='Seasonal', parent=cls.categories[1])
+        cls.ingredients = []
+        for name in ('Tomato', 'Mozzarella', 'Basil', 'Ham'):
+            ingredient = Ingredient.objects.create(name=name)
+            ingredient.allergens.add(cls.allergen)
+            ingredient.images.add(cls.image)
+            cls.ingredients.append(ingredient)
+
+    def create_pizzas(self, count):
+        # Runs the on_commit hooks so the catalog cache sees the new pizzas.
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                pizza = Pizza.objects.create(name=f'Pizza {index}', description='Pizza', price=10)
+                pizza.ingredients.set(self.ingredients)
+                pizza.category.set(self.categories)
+                if index % 2:
+                    pizza.custom_images.add(self.image)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/pizzas/', query_params={'limit': 100, 'ordering': 'name'})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_query_count_does_not_grow_with_pizzas(self):
+        self.create_pizzas(2)
+        small_count, _ = self.count_list_queries()
+
+        self.create_pizzas(20)
+        large_count, payload = self.count_list_queries()
+
+        self.assertEqual(len(payload['items']), 22)
+        self.assertEqual(small_count, large_count)
+
+    def test_list_renders_prefetched_relations(self):
+        self.create_pizzas(2)
+        _, payload = self.count_list_queries()
+
+        pizza = payload['items'][1]
+        self.assertEqual([i['name'] for i in pizza['ingredients']], ['Tomato', 'Mozzarella', 'Basil', 'Ham'])
+        self.assertEqual(pizza['ingredients'][0]['allergens'], 'Gluten')
+        self.assertEqual(len(pizza['ingredients'][0]['images']), 1)
+        self.assertEqual(pizza['image']['id'], self.image.id)
+        self.assertEqual([c['name'] for c in pizza['categories']], ['Classic', 'Special'])
+        self.assertEqual([c['name'] for c in pizza['categories'][1]['children']], ['Seasonal'])
+
+
+@override_settings(PIZZA_READ_MODEL=True)
+class PizzaDocumentTest(TestCase):
+    def test_document_follows_catalog_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pizza = Pizza.objects.create(name='Regina', description='Pizza', price=11)
+            pizza.ingredients.add(Ingredient.objects.create(name='Ham'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name='Ham').get().allergens.add(Allergen.objects.create(name='Sulphites'))
+
+        document = PizzaDocument.objects.get(pizza=pizza).document
+        self.assertEqual(document['ingredients'][0]['allergens'], 'Sulphites')
+
+        response = client.get(f'/pizzas/{pizza.id}')
+        self.assertEqual(response.json(), document)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pizza.delete()
+        self.assertEqual(client.get('/pizzas/').json()['items'], [])
+
+
+class PizzaBulkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [Ingredient.objects.create(name=name, type=kind)
+                           for name, kind in (('Tomato', 'vegetable'), ('Mozzarella', 'dairy'),
+                                              ('Basil', 'vegetable'), ('Ham', 'meat'))]
+        cls.category = Category.objects.create(name='Classic')
+        cls.image = Image.objects.create(image='images/pizza_by_default.jpg', description='Default pizza')
+
+    def item(self, index, **fields):
+        return {'name': f'Pizza {index}', 'description': 'Pizza', 'price': 10 + index, 'vegetarian': False,
+                'available': True, 'ingredients': [ingredient.id for ingredient in self.ingredients[:3]],
+                'categories': [self.category.id], **fields}
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        counts = []
+        for size in (5, 50):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post('/pizzas/bulk', json=[self.item(index) for index in range(size)])
+            self.assertEqual(response.status_code, 200, response.json())
+            self.assertEqual(len(response.json()['created']), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        pizza = Pizza.objects.get(id=response.json()['created'][0])
+        self.assertEqual(set(pizza.ingredients.values_list('id', flat=True)),
+                         {ingredient.id for ingredient in self.ingredients[:3]})
+        self.assertEqual(list(pizza.category.values_list('id', flat=True)), [self.category.id])
+
+    def test_creates_and_updates(self):
+        pizza = Pizza.objects.create(name='Regina', description='Pizza', price=11)
+        pizza.ingredients.set(self.ingredients)
+        response = client.post('/pizzas/bulk', json=[
+            self.item(0, custom_images=[self.image.id]),
+            {'id': pizza.id, 'price': 13, 'ingredients': [ingredient.id for ingredient in self.ingredients[1:]]},
+        ])
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()['updated'], [pizza.id])
+
+        pizza.refresh_from_db()
+        self.assertEqual((pizza.name, float(pizza.price)), ('Regina', 13))
+        self.assertEqual(pizza.ingredients.count(), 3)
+        self.assertEqual(PizzaHistory.objects.get(pizza=pizza).price, 11)
+        created = Pizza.objects.get(id=response.json()['created'][0])
+        self.assertEqual(list(created.custom_images.all()), [self.image])
+
+    def test_reports_every_invalid_item_and_writes_nothing(self):
+        response = client.post('/pizzas/bulk', json=[
+            self.item(0),
+            self.item(1, price=-1),
+            self.item(2, ingredients=[self.ingredients[0].id, self.ingredients[1].id, 999]),
+            self.item(3, vegetarian=True, ingredients=[ingredient.id for ingredient in self.ingredients[1:]]),
+            {'id': 999, 'price': 12},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = {(error['index'], error['field']) for error in response.json()['errors']}
+        self.assertEqual(errors, {(1, 'price'), (2, 'ingredients'), (3, 'ingredients'), (4, 'id')})
+        self.assertFalse(Pizza.objects.exists())
+
+
+class ConditionalRequestTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [Ingredient.objects.create(name=name) for name in ('Tomato', 'Mozzarella', 'Basil')]
+        cls.pizza = Pizza.objects.create(name='Margherita', description='Classic', price=8)
+        cls.pizza.ingredients.set(cls.ingredients)
+
+    def test_detail_not_modified(self):
+        response = client.get(f'/pizzas/{self.pizza.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # Validated against the validators kept for this catalog version, without a query.
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'/pizzas/{self.pizza.id}', META={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 0)
+        response = client.get(f'/pizzas/{self.pizza.id}', META={'HTTP_IF_MODIFIED_SINCE': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pizza.price = 9
+            self.pizza.save()
+        response = client.get(f'/pizzas/{self.pizza.id}', META={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(client.get('/pizzas/0', META={'HTTP_IF_NONE_MATCH': etag}).status_code, 404)
+
+    def test_list_etag_follows_catalog_version(self):
+        etag = client.get('/pizzas/?limit=10')['ETag']
+        # A cache hit still sends the validators, and runs no state query.
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/pizzas/?limit=10')
+        self.assertEqual((response['X-Cache'], response['ETag'], len(queries)), ('HIT', etag, 0))
+        self.assertEqual(client.get('/pizzas/?limit=10', META={'HTTP_IF_NONE_MATCH': etag}).status_code, 304)
+        # Another page is another representation.
+        self.assertNotEqual(client.get('/pizzas/?limit=5')['ETag'], etag)
+
+        # Ingredients have no timestamp, their writes move the catalog version.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[0].name = 'Tomatoes'
+            self.ingredients[0].save()
+        response = client.get('/pizzas/?limit=10', META={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'][0]['ingredients'][0]['name'], 'Tomatoes')
+
+    def test_last_modified_follows_catalog_version(self):
+        last_modified = client.get('/pizzas/?limit=10')['Last-Modified']
+        meta = {'HTTP_IF_MODIFIED_SINCE': last_modified}
+        self.assertEqual(client.get('/pizzas/?limit=10', META=meta).status_code, 304)
+
+        # No pizza timestamp moves, in the same second or not.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[0].allergens.add(Allergen.objects.create(name='Sulphites'))
+        response = client.get('/pizzas/?limit=10', META=meta)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(last_modified))
+
+    def test_writes_of_other_workers_invalidate_the_validators(self):
+        etag = client.get(f'/pizzas/{self.pizza.id}')['ETag']
+        # Another worker's write moves the shared version, this worker's entries are untouched.
+        SharedVersion().bump()
+        response = client.get(f'/pizzas/{self.pizza.id}', META={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_categories(self):
+        category = Category.objects.create(name='Classic')
+        response = client.get(f'/categories/{category.id}')
+        meta = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        self.assertEqual(client.get(f'/categories/{category.id}', META=meta).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Roman', parent=category)
+        self.assertEqual(client.get(f'/categories/{category.id}', META=meta).status_code, 200)
+
+    @override_settings(CONDITIONAL_REQUESTS=False)
+    def test_disabled(self):
+        response = client.get(f'/pizzas/{self.pizza.id}')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class PizzaFilterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        gluten = Allergen.objects.create(name='Gluten')
+        cls.tomato, cls.mozzarella, cls.basil, cls.ham, cls.flour = [
+            Ingredient.objects.create(name=name, type=kind) for name, kind in (
+                ('Tomato', 'vegetable'), ('Mozzarella', 'dairy'), ('Basil', 'vegetable'),
+                ('Ham', 'meat'), ('Flour', 'other'))]
+        cls.flour.allergens.add(gluten)
+        menu = Category.objects.create(name='Menu')
+        cls.classic = Category.objects.create(name='Classic', parent=menu)
+        roman = Category.objects.create(name='Roman', parent=cls.classic)
+        for name, price, vegetarian, ingredients, category in (
+                ('Margherita', 8, True, [cls.tomato, cls.mozzarella, cls.basil], roman),
+                ('Prosciutto', 11, False, [cls.tomato, cls.mozzarella, cls.ham], cls.classic),
+                ('Bianca', 9, True, [cls.mozzarella, cls.basil, cls.flour], menu)):
+            pizza = Pizza.objects.create(name=name, description=name, price=price, vegetarian=vegetarian)
+            pizza.ingredients.set(ingredients)
+            pizza.category.add(category)
+
+    def names(self, query):
+        response = client.get(f'/pizzas/filter/?ordering=name&{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [pizza['name'] for pizza in response.json()['items']]
+
+    def test_filters(self):
+        self.assertEqual(self.names('min_price=8.5&max_price=12'), ['Bianca', 'Prosciutto'])
+        self.assertEqual(self.names('vegetarian=true'), ['Bianca', 'Margherita'])
+        self.assertEqual(self.names('ingredient_type=vegetable'), ['Bianca', 'Margherita', 'Prosciutto'])
+        self.assertEqual(self.names(f'ingredients={self.tomato.id},{self.basil.id}'), ['Margherita'])
+        self.assertEqual(self.names(f'ingredients={self.tomato.id}&ingredients={self.basil.id}'), ['Margherita'])
+        self.assertEqual(self.names(f'exclude_ingredients={self.ham.id}'), ['Bianca', 'Margherita'])
+        self.assertEqual(self.names('allergen_free=Gluten'), ['Margherita', 'Prosciutto'])
+        self.assertEqual(self.names(f'category={self.classic.id}'), ['Margherita', 'Prosciutto'])
+        self.assertEqual(self.names(f'category={self.classic.id}&allergen_free=Gluten&vegetarian=true'),
+                         ['Margherita'])
+        self.assertEqual(client.get('/pizzas/filter/?min_price=10&max_price=5').status_code, 422)
+
+    @skipUnless(connection.vendor == 'sqlite', "Query plans are checked on SQLite")
+    def test_query_plan_uses_indexes(self):
+        filters = PizzaFilterSchema(min_price=8, max_price=12, ingredient_type='vegetable',
+                                    ingredients=[self.tomato.id], exclude_ingredients=[self.ham.id],
+                                    category=self.classic.id)
+        plan = filtered_pizzas(filters).order_by('price', 'pk').explain()
+
+        self.assertIn('USING INDEX api_pizza_price', plan)
+        self.assertNotIn('DISTINCT', plan)
+        # Every relation is a correlated lookup on the (pizza_id, ...) unique index of its m2m table.
+        self.assertEqual(plan.count('CORRELATED SCALAR SUBQUERY'), 4)
+        for line in plan.splitlines():
+            if ' U0 ' in line:
+                self.assertRegex(line, r'SEARCH U0 USING COVERING INDEX api_pizza_\w+_pizza_id_\w+_uniq \(pizza_id=')
+        self.assertNotRegex(plan, r'SCAN (api_pizza|U0)\b')
+
+    def allergen_free(self, *names):
+        # Straight from the queryset: the endpoint cache only moves on commit.
+        pizzas = filtered_pizzas(PizzaFilterSchema(allergen_free=names)).order_by('name')
+        return list(pizzas.values_list('name', flat=True))
+
+    def test_allergen_mask_follows_links(self):
+        lactose = Allergen.objects.create(name='Lactose')
+        margherita = Pizza.objects.get(name='Margherita')
+        self.assertEqual(self.allergen_free('Lactose'), ['Bianca', 'Margherita', 'Prosciutto'])
+
+        self.mozzarella.allergens.add(lactose)
+        self.assertEqual(self.allergen_free('Lactose'), [])
+        lactose.ingredients.remove(self.mozzarella)
+        self.assertEqual(self.allergen_free('Lactose', 'Gluten'), ['Margherita', 'Prosciutto'])
+
+        self.basil.allergens.add(lactose)
+        margherita.ingredients.remove(self.basil)
+        self.assertEqual(self.allergen_free('Lactose'), ['Margherita', 'Prosciutto'])
+        self.basil.pizzas.add(margherita)
+        self.assertEqual(self.allergen_free('Lactose'), ['Prosciutto'])
+        lactose.ingredients.clear()
+        self.assertEqual(self.allergen_free('Lactose'), ['Bianca', 'Margherita', 'Prosciutto'])
+
+        self.flour.delete()
+        self.assertEqual(Pizza.objects.get(name='Bianca').allergen_mask, 0)
+        # A bitwise test on the pizza row, without subquery.
+        plan = filtered_pizzas(PizzaFilterSchema(allergen_free=['Gluten'])).explain()
+        self.assertNotIn('SUBQUERY', plan)
+
+
+class PizzaCostTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tomato = Ingredient.objects.create(name='Tomato', cost='0.40')
+        cls.mozzarella = Ingredient.objects.create(name='Mozzarella', cost='1.10')
+        cls.basil = Ingredient.objects.create(name='Basil', cost='0.25')
+        cls.pizza = Pizza.objects.create(name='Margherita', description='Margherita', price=9)
+
+    def cost(self):
+        return str(Pizza.objects.values_list('ingredient_cost', flat=True).get(id=self.pizza.id))
+
+    def test_cost_follows_links_and_ingredient_costs(self):
+        self.pizza.ingredients.add(self.tomato, self.mozzarella)
+        self.assertEqual(self.cost(), '1.50')
+        self.basil.pizzas.add(self.pizza)
+        self.assertEqual(self.cost(), '1.75')
+        self.pizza.ingredients.remove(self.tomato)
+        self.assertEqual(self.cost(), '1.35')
+
+        self.mozzarella.cost = '2.00'
+        self.mozzarella.save()
+        self.assertEqual(self.cost(), '2.25')
+        self.mozzarella.pizzas.clear()
+        self.assertEqual(self.cost(), '0.25')
+        self.basil.delete()
+        self.assertEqual(self.cost(), '0.00')
+        # The selling price is not derived from the cost.
+        self.assertEqual(Pizza.objects.get(id=self.pizza.id).price, 9)
+
+    def test_verify_and_repair_drift(self):
+        self.pizza.ingredients.set([self.tomato, self.basil])
+        Pizza.objects.update(ingredient_cost=0)
+        out = io.StringIO()
+        call_command('verify_pizza_costs', stdout=out)
+        self.assertIn(f"Pizza {self.pizza.id}: stored 0.00, expected 0.65", out.getvalue())
+        self.assertIn("1 drifted pizza costs found", out.getvalue())
+        self.assertEqual(self.cost(), '0.00')
+
+        out = io.StringIO()
+        call_command('verify_pizza_costs', repair=True, stdout=out)
+        self.assertIn("1 drifted pizza costs repaired", out.getvalue())
+        self.assertEqual(self.cost(), '0.65')
+        self.assertEqual(Pizza.objects.get(id=self.pizza.id).total_ingredient_cost(), Decimal('0.65'))
+
+        out = io.StringIO()
+        call_command('verify_pizza_costs', stdout=out)
+        self.assertIn("0 drifted pizza costs found", out.getvalue())
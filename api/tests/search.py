@@ -0,0 +1,114 @@
+from unittest import skipUnless
+
+from django.test import SimpleTestCase, TestCase
+
+from api.cache import invalidate_catalog
+from api.models.image import Image
+from api.models.ingredients import Allergen, Ingredient
+from api.models.pizza import Pizza
+from api.search import (PythonSearchBackend, SearchDocument, SQLiteFTSBackend, matching_ids, search,
+                        tokenize)
+from api.tests import client
+
+DOCUMENTS = [
+    SearchDocument('pizza', 1, 'Regina', 'Tomato Ham Mushrooms'),
+    SearchDocument('pizza', 2, 'Quattro Formaggi', 'Mozzarella Gorgonzola Parmesan Ham'),
+    SearchDocument('ingredient', 3, 'Ham', 'meat'),
+    SearchDocument('category', 4, 'Crème fraîche', 'White bases'),
+]
+
+
+class BackendTests:
+    """
+    Behavior shared by the search backends, run against a fresh index of DOCUMENTS.
+    """
+
+    def test_name_matches_rank_first(self):
+        hits = self.backend.search('ham')
+        self.assertEqual([(hit.entity, hit.object_id) for hit in hits][0], ('ingredient', 3))
+        self.assertEqual({hit.object_id for hit in hits}, {1, 2, 3})
+
+    def test_prefixes_diacritics_and_every_token(self):
+        self.assertEqual([hit.object_id for hit in self.backend.search('creme fraich')], [4])
+        self.assertEqual([hit.object_id for hit in self.backend.search('ham gorg')], [2])
+        self.assertEqual(self.backend.search('ham pineapple'), [])
+        self.assertEqual(self.backend.search('"*)'), [])
+
+    def test_entities_and_limit(self):
+        self.assertEqual([hit.entity for hit in self.backend.search('ham', ['pizza'])], ['pizza', 'pizza'])
+        self.assertEqual(len(self.backend.search('ham', limit=1)), 1)
+
+    def test_reindex_and_remove(self):
+        self.backend.index([SearchDocument('pizza', 1, 'Regina', 'Tomato Artichoke')])
+        self.assertEqual({hit.object_id for hit in self.backend.search('ham', ['pizza'])}, {2})
+        self.backend.remove([('pizza', 2)])
+        self.assertEqual(self.backend.search('ham', ['pizza']), [])
+        self.assertEqual([hit.object_id for hit in self.backend.search('artichoke')], [1])
+
+
+class PythonSearchBackendTest(BackendTests, SimpleTestCase):
+    def setUp(self):
+        self.backend = PythonSearchBackend()
+        self.backend.index(DOCUMENTS)
+
+    def test_matching_ids(self):
+        self.assertEqual(sorted(self.backend.matching_ids('pizza', 'ham')), [1, 2])
+
+
+@skipUnless(SQLiteFTSBackend.is_available(), "SQLite without FTS5")
+class SQLiteFTSBackendTest(BackendTests, TestCase):
+    def setUp(self):
+        self.backend = SQLiteFTSBackend()
+        self.backend.clear()
+        self.backend.index(DOCUMENTS)
+
+    def test_tokenizer_matches_fts5(self):
+        self.assertEqual(tokenize('Crème  Fraîche, 2x'), ['creme', 'fraiche', '2x'])
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+
+    def search(self, query, **params):
+        return [(hit.entity, hit.name) for hit in search(query, **params)]
+
+    def test_writes_are_indexed_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sesame = Allergen.objects.create(name='Sesame')
+            tahini = Ingredient.objects.create(name='Tahini', type='other')
+            pizza = Pizza.objects.create(name='Levantina', description='Za\'atar', price=12)
+            pizza.ingredients.add(tahini)
+        self.assertEqual(self.search('levantina'), [('pizza', 'Levantina')])
+        self.assertEqual(sorted(self.search('tahini')), [('ingredient', 'Tahini'), ('pizza', 'Levantina')])
+
+        # Allergens reach the pizzas through their ingredients.
+        with self.captureOnCommitCallbacks(execute=True):
+            tahini.allergens.add(sesame)
+        self.assertEqual(list(Pizza.objects.filter(id__in=matching_ids('pizza', 'sesame'))), [pizza])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pizza.delete()
+        self.assertEqual(self.search('levantina'), [])
+
+    def test_soft_deleted_images_are_not_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(description='Wood-fired oven')
+        self.assertEqual(self.search('oven', entities=['image']), [('image', 'Wood-fired oven')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.is_deleted = True
+            image.save()
+        self.assertEqual(self.search('oven', entities=['image']), [])
+
+    def test_search_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Ricotta')
+            Pizza.objects.create(name='Ricotta e spinaci', description='White', price=11)
+        response = client.get('/search/?q=ricotta')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted((hit['type'], hit['name']) for hit in response.json()),
+                         [('ingredient', 'Ricotta'), ('pizza', 'Ricotta e spinaci')])
+        response = client.get('/search/?q=ricotta&types=pizza&limit=5')
+        self.assertEqual([hit['type'] for hit in response.json()], ['pizza'])
+        self.assertEqual(client.get('/search/?q=ricotta&types=drinks').status_code, 400)
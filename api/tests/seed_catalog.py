@@ -0,0 +1,24 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.models.category import Category
+from api.models.pizza import Pizza
+
+
+class SeedCatalogTest(TestCase):
+    def test_seeds_a_linked_catalog(self):
+        out = io.StringIO()
+        call_command('seed_catalog', pizzas=40, ingredients=20, images=10, categories=15, depth=3, stdout=out)
+        self.assertIn("Seeded 40 pizzas", out.getvalue())
+        self.assertEqual(Pizza.objects.count(), 40)
+        self.assertEqual(Category.objects.filter(parent__parent__isnull=False).count(), 8)
+        for pizza in Pizza.objects.prefetch_related('ingredients', 'category'):
+            self.assertGreaterEqual(len(pizza.ingredients.all()), 3)
+            self.assertTrue(pizza.category.all())
+        names = list(Pizza.objects.order_by('id').values_list('name', flat=True))
+
+        call_command('seed_catalog', pizzas=40, ingredients=20, images=10, categories=15, depth=3, flush=True,
+                     stdout=io.StringIO())
+        self.assertEqual(list(Pizza.objects.order_by('id').values_list('name', flat=True)), names)
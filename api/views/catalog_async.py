@@ -0,0 +1,92 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import aget_object_or_404
+from ninja import Query, Router
+from ninja.decorators import decorate_view
+from ninja.pagination import paginate
+
+from api.cache import cached_response
+from api.conditional import conditional_response, ingredients_state, pizza_state, pizzas_state
+from api.filters import filtered_pizzas
+from api.models.image import Image
+from api.models.ingredients import Ingredient
+from api.models.pizza import Pizza, attach_category_subtrees
+from api.models.pizza_document import PizzaDocument
+from api.pagination import CursorPagination
+from api.schemas.ingredients import IngredientSchema
+from api.schemas.pizza import PizzaFilterSchema, PizzaSchema
+from api.search import matching_ids
+from api.views.pizza import PIZZA_ORDERINGS
+
+# Native async versions of the catalog reads, mounted under /api/async/ when
+# settings.ASYNC_CATALOG_VIEWS is on. Querysets are only evaluated by the async
+# paginator or aget(), and everything the schemas read is prefetched, so no ORM call
+# happens during serialization on the event loop. Cached responses are shared with
+# the sync routes.
+
+router = Router()
+
+
+async def preload_default_image(request):
+    request.default_pizza_image = await Image.aget_default()
+
+
+@router.get("/pizzas/", response=list[PizzaSchema])
+@decorate_view(conditional_response("pizzas:list", pizzas_state))
+@decorate_view(cached_response("pizzas:list"))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
+async def list_pizzas(request):
+    if settings.PIZZA_READ_MODEL:
+        return PizzaDocument.objects.filter(is_deleted=False).values_list('document', flat=True)
+    await preload_default_image(request)
+    return Pizza.objects.filter(is_deleted=False).for_read()
+
+
+@router.get("/pizzas/{pizza_id}", response=PizzaSchema)
+@decorate_view(conditional_response("pizzas:detail", pizza_state))
+async def get_pizza(request, pizza_id: int):
+    if settings.PIZZA_READ_MODEL:
+        document = await PizzaDocument.objects.filter(
+            pizza_id=pizza_id, is_deleted=False
+        ).values_list('document', flat=True).afirst()
+        if document is not None:
+            return document
+    await preload_default_image(request)
+    pizza = await aget_object_or_404(Pizza.objects.for_read(), id=pizza_id, is_deleted=False)
+    await sync_to_async(attach_category_subtrees)([pizza])
+    return pizza
+
+
+@router.get("/pizzas/search/", response=list[PizzaSchema])
+@decorate_view(conditional_response("pizzas:search", pizzas_state))
+@decorate_view(cached_response("pizzas:search"))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
+async def search_pizzas(request, query: str):
+    await preload_default_image(request)
+    # The in-process search index may have to be loaded from the database.
+    ids = await sync_to_async(matching_ids)('pizza', query)
+    return Pizza.objects.filter(id__in=ids, is_deleted=False).for_read()
+
+
+@router.get("/pizzas/filter/", response=list[PizzaSchema])
+@decorate_view(conditional_response("pizzas:filter", pizzas_state))
+@decorate_view(cached_response("pizzas:filter"))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
+async def filter_pizzas(request, filters: PizzaFilterSchema = Query(...)):
+    await preload_default_image(request)
+    # Allergen names are resolved to ids while the conditions are built.
+    pizzas = await sync_to_async(filtered_pizzas)(filters)
+    return pizzas.for_read()
+
+
+@router.get("/ingredients/", response=list[IngredientSchema])
+@decorate_view(conditional_response("ingredients:list", ingredients_state))
+@paginate(CursorPagination, orderings=('id', 'name'))
+async def list_ingredients(request):
+    return Ingredient.objects.prefetch_related('images', 'allergens')
+
+
+@router.get("/ingredients/{ingredient_id}", response=IngredientSchema)
+@decorate_view(conditional_response("ingredients:detail", ingredients_state))
+async def get_ingredient(request, ingredient_id: int):
+    return await aget_object_or_404(Ingredient.objects.prefetch_related('images', 'allergens'), id=ingredient_id)
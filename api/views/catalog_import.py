@@ -0,0 +1,22 @@
+from django.conf import settings
+from ninja import File, Router
+from ninja.files import UploadedFile
+
+from api.catalog_import import IMPORTERS, import_catalog, open_source
+from api.exception import BadRequestError, NotFoundError
+from api.schemas.bulk import ImportResultSchema
+
+router = Router()
+
+
+@router.post("/{entity}", response=ImportResultSchema)
+def import_entity(request, entity: str, file: UploadedFile = File(...), format: str = None):
+    if entity not in IMPORTERS:
+        raise NotFoundError(f"Unknown entity {entity}, expected one of: {', '.join(IMPORTERS)}")
+    try:
+        stream, fmt = open_source(file.file, file.name or '', format)
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+
+    # Lu par lots de IMPORT_BATCH_SIZE lignes, une transaction par lot.
+    return import_catalog(stream, entity, fmt, settings.IMPORT_BATCH_SIZE).as_dict()
@@ -1,24 +1,43 @@
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from ninja import Router
+from ninja.decorators import decorate_view
+from ninja.pagination import paginate
 from django.db import transaction
-from django.db.models import Q
 
-from api.models.category import Category
+from api.models.category import Category, attach_subtrees, build_tree
+from api.models.pizza import Pizza, attach_category_subtrees
 from api.schemas.category import CategorySchema, CategoryCreateSchema, CategoryUpdateSchema
+from api.schemas.pizza import PizzaSchema
+from api.conditional import categories_state, category_state, conditional_response, pizzas_state
 from api.exception import BadRequestError
+from api.pagination import CursorPagination
+from api.views.pizza import PIZZA_ORDERINGS
+from api.search import matching_ids
 
 router = Router()
 
 
 @router.get("/", response=list[CategorySchema])
+@decorate_view(conditional_response("categories:list", categories_state))
+@paginate(CursorPagination, orderings=('id', 'name'), prepare=attach_subtrees)
 def list_categories(request):
     categories = Category.objects.filter(is_deleted=False)
     return categories
 
 
+@router.get("/tree", response=list[CategorySchema])
+@decorate_view(conditional_response("categories:tree", categories_state))
+def get_category_tree(request):
+    # Tout l'arbre en une seule requête, assemblé en mémoire.
+    return build_tree(list(Category.objects.filter(is_deleted=False).order_by('id')))
+
+
 @router.get("/{category_id}", response=CategorySchema)
+@decorate_view(conditional_response("categories:detail", category_state))
 def get_category(request, category_id: int):
     category = get_object_or_404(Category, id=category_id, is_deleted=False)
+    attach_subtrees([category])
     return category
 
 
@@ -43,7 +62,12 @@ def update_category(request, category_id: int, data: CategoryUpdateSchema):
     category = get_object_or_404(Category, id=category_id, is_deleted=False)
     for attr, value in data.dict(exclude_unset=True).items():
         setattr(category, attr, value)
-    category.save()
+    try:
+        category.save()
+    except Category.DoesNotExist:
+        raise BadRequestError("Parent category not found")
+    except ValidationError as e:
+        raise BadRequestError(e.messages[0])
     return category
 
 
@@ -63,15 +87,45 @@ def restore_category(request, category_id: int):
 
 
 @router.get("/search/", response=list[CategorySchema])
+@decorate_view(conditional_response("categories:search", categories_state))
+@paginate(CursorPagination, orderings=('id', 'name'))
 def search_categories(request, query: str):
-    categories = Category.objects.filter(
-        (Q(name__icontains=query) | Q(description__icontains=query)) & Q(is_deleted=False)
-    )
+    categories = Category.objects.filter(id__in=matching_ids('category', query), is_deleted=False)
     return categories
 
 
 @router.get("/{category_id}/children/", response=list[CategorySchema])
+@decorate_view(conditional_response("categories:children", categories_state))
+@paginate(CursorPagination, orderings=('id', 'name'), prepare=attach_subtrees)
 def list_subcategories(request, category_id: int):
     category = get_object_or_404(Category, id=category_id, is_deleted=False)
     subcategories = category.children.filter(is_deleted=False)
     return subcategories
+
+
+@router.get("/{category_id}/descendants/", response=list[CategorySchema])
+@decorate_view(conditional_response("categories:descendants", categories_state))
+@paginate(CursorPagination, orderings=('id', 'name'), prepare=attach_subtrees)
+def list_descendants(request, category_id: int):
+    # Tous les niveaux, pas seulement les enfants directs.
+    category = get_object_or_404(Category, id=category_id, is_deleted=False)
+    return Category.objects.subtree(category, include_self=False).filter(is_deleted=False)
+
+
+@router.get("/{category_id}/ancestors/", response=list[CategorySchema])
+@decorate_view(conditional_response("categories:ancestors", categories_state))
+def list_ancestors(request, category_id: int):
+    category = get_object_or_404(Category, id=category_id, is_deleted=False)
+    ancestors = Category.objects.ancestors(category).filter(is_deleted=False).in_bulk()
+    attach_subtrees(list(ancestors.values()))
+    # De la racine au parent direct.
+    return [ancestors[pk] for pk in category.ancestor_ids if pk in ancestors]
+
+
+@router.get("/{category_id}/pizzas/", response=list[PizzaSchema])
+@decorate_view(conditional_response("categories:pizzas", pizzas_state))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
+def list_category_pizzas(request, category_id: int):
+    category = get_object_or_404(Category, id=category_id, is_deleted=False)
+    subtree = Category.objects.subtree(category).filter(is_deleted=False)
+    return Pizza.objects.filter(is_deleted=False, category__in=subtree).distinct().for_read()
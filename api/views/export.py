@@ -0,0 +1,25 @@
+from django.http import StreamingHttpResponse
+from ninja import Router
+
+from api.exception import BadRequestError, NotFoundError
+from api.export import ENTITIES, FORMATS, export_chunks, gzip_chunks
+
+router = Router()
+
+
+@router.get("/{entity}")
+def export_entity(request, entity: str, format: str = 'ndjson'):
+    if entity not in ENTITIES:
+        raise NotFoundError(f"Unknown entity {entity}, expected one of: {', '.join(ENTITIES)}")
+    if format not in FORMATS:
+        raise BadRequestError(f"Unknown format {format}, expected one of: {', '.join(FORMATS)}")
+
+    # Flux généré au fil de l'eau : la table n'est jamais chargée entièrement en mémoire.
+    chunks = export_chunks(entity, format)
+    gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = StreamingHttpResponse(gzip_chunks(chunks) if gzipped else chunks, content_type=FORMATS[format])
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = f'attachment; filename="{entity}.{format}"'
+    return response
@@ -1,15 +1,21 @@
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from ninja import Router
+from ninja.pagination import paginate
 from django.db import transaction
 
 from api.models.image import Image
 from api.models.pizza import Pizza  # Importation pour l'association avec des pizzas
 from api.schemas.image import ImageSchema
-from api.exception import BadRequestError
+from api.exception import BadRequestError, NotFoundError
+from api.pagination import CursorPagination
+from api.renditions import FORMATS, available_formats, get_rendition, negotiate_format, snap_width
+from api.search import matching_ids
 
 router = Router()
 
 @router.get("/", response=list[ImageSchema])
+@paginate(CursorPagination)
 def list_images(request):
     images = Image.objects.filter(is_deleted=False)
     return images
@@ -30,9 +36,7 @@ def create_image(request, data: ImageSchema):
             description=data.description,
             is_default=data.is_default
         )
-        thumbnail_path = image.create_thumbnail()  # Supposant que la méthode existe dans le modèle
-        image.thumbnail = thumbnail_path
-        image.save()
+        # Le redimensionnement et la miniature sont faits par `manage.py process_images`.
         return image
     except Exception as e:
         raise BadRequestError(f"Failed to create image: {str(e)}")
@@ -82,12 +86,14 @@ def dissociate_image_from_pizza(request, image_id: int, pizza_id: int):
 
 
 @router.get("/search/", response=list[ImageSchema])
+@paginate(CursorPagination)
 def search_images(request, query: str):
-    images = Image.objects.filter(description__icontains=query, is_deleted=False)
+    images = Image.objects.filter(id__in=matching_ids('image', query), is_deleted=False)
     return images
 
 
 @router.get("/filter/", response=list[ImageSchema])
+@paginate(CursorPagination)
 def filter_images(request, is_deleted: bool = None):
     if is_deleted is not None:
         images = Image.objects.filter(is_deleted=is_deleted)
@@ -99,12 +105,32 @@ def filter_images(request, is_deleted: bool = None):
 @router.post("/{image_id}/generate_thumbnail/", response=ImageSchema)
 def generate_thumbnail(request, image_id: int):
     image = get_object_or_404(Image, id=image_id, is_deleted=False)
-    thumbnail_path = image.create_thumbnail()  # Supposant que la méthode existe dans le modèle
-    image.thumbnail = thumbnail_path
-    image.save()
+    image.enqueue_processing()
     return image
 
 
+@router.get("/{image_id}/render")
+def render_image(request, image_id: int, w: int = None, fmt: str = None):
+    if w is not None and w <= 0:
+        raise BadRequestError("Width must be positive")
+    if fmt is not None and fmt not in available_formats():
+        raise BadRequestError(f"Unsupported format, expected one of: {', '.join(available_formats())}")
+
+    image = get_object_or_404(Image, id=image_id, is_deleted=False)
+    output_format = fmt or negotiate_format(request.headers.get('Accept'))
+    try:
+        content, name = get_rendition(image, w or snap_width(float('inf')), output_format)
+    except FileNotFoundError:
+        raise NotFoundError("Image file not found")
+
+    response = HttpResponse(content, content_type=FORMATS[output_format][2])
+    response['ETag'] = f'"{name}"'
+    response['Cache-Control'] = 'public, max-age=86400'
+    if fmt is None:
+        response['Vary'] = 'Accept'
+    return response
+
+
 @router.post("/{image_id}/clone/", response=ImageSchema)
 @transaction.atomic
 def clone_image(request, image_id: int):
@@ -1,23 +1,43 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from ninja import Router
+from ninja.decorators import decorate_view
+from ninja.pagination import paginate
 from django.db import transaction
 
+from api import bulk
 from api.models.image import Image
 from api.models.ingredients import Ingredient
 from api.schemas.ingredients import IngredientSchema, IngredientCreateSchema, IngredientUpdateSchema
 from api.exception import BadRequestError
+from api.schemas.bulk import BulkResultSchema
+from api.conditional import conditional_response, ingredients_state
+from api.pagination import CursorPagination
+from api.search import matching_ids
 
 router = Router()
 
 @router.get("/", response=list[IngredientSchema])
+@decorate_view(conditional_response("ingredients:list", ingredients_state))
+@paginate(CursorPagination, orderings=('id', 'name'))
 def list_ingredients(request):
-    ingredients = Ingredient.objects.prefetch_related('images').all()
+    ingredients = Ingredient.objects.prefetch_related('images', 'allergens').all()
     return ingredients
 
 
+@router.post("/bulk", response={200: BulkResultSchema, 400: BulkResultSchema})
+def bulk_save_ingredients(request, items: list[dict]):
+    # Éléments sans id : créations, avec id : mises à jour. Tout ou rien.
+    if len(items) > settings.BULK_MAX_ITEMS:
+        raise BadRequestError(f"At most {settings.BULK_MAX_ITEMS} items per request")
+    result = bulk.bulk_save_ingredients(items)
+    return (400 if result.errors else 200), result
+
+
 @router.get("/{ingredient_id}", response=IngredientSchema)
+@decorate_view(conditional_response("ingredients:detail", ingredients_state))
 def get_ingredient(request, ingredient_id: int):
-    ingredient = get_object_or_404(Ingredient.objects.prefetch_related('images'), id=ingredient_id)
+    ingredient = get_object_or_404(Ingredient.objects.prefetch_related('images', 'allergens'), id=ingredient_id)
     return ingredient
 
 
@@ -28,8 +48,9 @@ def create_ingredient(request, data: IngredientCreateSchema):
         name=data.name,
         description=data.description,
         type=data.type,
-        allergens=data.allergens
     )
+    if data.allergens:
+        ingredient.allergens.set(bulk.allergen_ids(data.allergens).values())
     if data.images:
         images = Image.objects.filter(id__in=data.images)
         if images.count() != len(data.images):
@@ -83,17 +104,22 @@ def delete_ingredient(request, ingredient_id: int):
 
 
 @router.get("/filter/", response=list[IngredientSchema])
+@decorate_view(conditional_response("ingredients:filter", ingredients_state))
+@paginate(CursorPagination, orderings=('id', 'name'))
 def filter_ingredients(request, type: str = None):
     if type:
-        ingredients = Ingredient.objects.filter(type=type).prefetch_related('images')
+        ingredients = Ingredient.objects.filter(type=type).prefetch_related('images', 'allergens')
     else:
-        ingredients = Ingredient.objects.prefetch_related('images').all()
+        ingredients = Ingredient.objects.prefetch_related('images', 'allergens').all()
     return ingredients
 
 
 @router.get("/search/", response=list[IngredientSchema])
+@decorate_view(conditional_response("ingredients:search", ingredients_state))
+@paginate(CursorPagination, orderings=('id', 'name'))
 def search_ingredients(request, name: str):
-    ingredients = Ingredient.objects.filter(name__icontains=name).prefetch_related('images')
+    ingredients = (Ingredient.objects.filter(id__in=matching_ids('ingredient', name))
+                   .prefetch_related('images', 'allergens'))
     return ingredients
 
 
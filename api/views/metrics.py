@@ -0,0 +1,30 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from api.metrics import get_registry
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def is_allowed(request):
+    """
+    Whether the client may scrape the metrics: its address is in
+    settings.METRICS['ALLOWED_IPS'], or it sends ``Authorization: Bearer <TOKEN>``.
+    """
+    options = settings.METRICS
+    if request.META.get('REMOTE_ADDR') in options['ALLOWED_IPS']:
+        return True
+    token = options['TOKEN']
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+
+
+# Vue Django simple : exposée hors des NinjaAPI, avec son propre contrôle d'accès.
+# MetricsMiddleware ne la compte pas (voir operation_labels).
+def metrics(request):
+    if not is_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(get_registry().expose(), content_type=CONTENT_TYPE)
@@ -1,28 +1,59 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from ninja import Router
+from ninja import Query, Router
+from ninja.decorators import decorate_view
+from ninja.pagination import paginate
 from django.db import transaction
-from django.db.models import Q
 
+from api import bulk
 from api.models.category import Category
 from api.models.image import Image
 from api.models.ingredients import Ingredient
-from api.models.pizza import Pizza, PizzaHistory
-from api.schemas.pizza import PizzaSchema, PizzaCreateSchema, PizzaUpdateSchema
+from api.models.pizza import Pizza, PizzaHistory, attach_category_subtrees
+from api.models.pizza_document import PizzaDocument
+from api.schemas.bulk import BulkResultSchema
+from api.schemas.pizza import PizzaSchema, PizzaCreateSchema, PizzaUpdateSchema, PizzaFilterSchema
+from api.cache import cached_response
+from api.conditional import conditional_response, pizza_state, pizzas_state
 from api.exception import NotFoundError, BadRequestError
+from api.filters import filtered_pizzas
+from api.pagination import CursorPagination
+from api.search import matching_ids
 
 router = Router()
 
+PIZZA_ORDERINGS = ('id', 'name', 'price', '-price')
+
 
 @router.get("/", response=list[PizzaSchema])
+@decorate_view(conditional_response("pizzas:list", pizzas_state))
+@decorate_view(cached_response("pizzas:list"))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
 def list_pizzas(request):
-    pizzas = Pizza.objects.filter(is_deleted=False).select_related('category').prefetch_related('ingredients',
-                                                                                                'custom_images').all()
+    if settings.PIZZA_READ_MODEL:
+        return PizzaDocument.objects.filter(is_deleted=False).values_list('document', flat=True)
+    pizzas = Pizza.objects.filter(is_deleted=False).for_read()
     return pizzas
 
 
+@router.post("/bulk", response={200: BulkResultSchema, 400: BulkResultSchema})
+def bulk_save_pizzas(request, items: list[dict]):
+    # Éléments sans id : créations, avec id : mises à jour. Tout ou rien.
+    if len(items) > settings.BULK_MAX_ITEMS:
+        raise BadRequestError(f"At most {settings.BULK_MAX_ITEMS} items per request")
+    result = bulk.bulk_save_pizzas(items)
+    return (400 if result.errors else 200), result
+
+
 @router.get("/{pizza_id}", response=PizzaSchema)
+@decorate_view(conditional_response("pizzas:detail", pizza_state))
 def get_only_pizzas(request, pizza_id: int):
-    pizza = get_object_or_404(Pizza, id=pizza_id, is_deleted=False)
+    if settings.PIZZA_READ_MODEL:
+        document = PizzaDocument.objects.filter(pizza_id=pizza_id, is_deleted=False).values_list('document', flat=True).first()
+        if document is not None:
+            return document
+    pizza = get_object_or_404(Pizza.objects.for_read(), id=pizza_id, is_deleted=False)
+    attach_category_subtrees([pizza])
     return pizza
 
 
@@ -135,27 +166,21 @@ def remove_ingredients_from_pizza(request, pizza_id: int, ingredient_ids: list[i
 
 
 @router.get("/search/", response=list[PizzaSchema])
+@decorate_view(conditional_response("pizzas:search", pizzas_state))
+@decorate_view(cached_response("pizzas:search"))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
 def search_pizzas(request, query: str):
-    pizzas = Pizza.objects.filter(
-        Q(name__icontains=query) | Q(description__icontains=query),
-        is_deleted=False
-    ).select_related('category').prefetch_related('ingredients', 'custom_images')
+    pizzas = Pizza.objects.filter(id__in=matching_ids('pizza', query), is_deleted=False).for_read()
     return pizzas
 
 
 @router.get("/filter/", response=list[PizzaSchema])
-def filter_pizzas(request, min_price: float = None, max_price: float = None, ingredient_type: str = None):
-    pizzas = Pizza.objects.filter(is_deleted=False)
-
-    if min_price is not None:
-        pizzas = pizzas.filter(price__gte=min_price)
-    if max_price is not None:
-        pizzas = pizzas.filter(price__lte=max_price)
-    if ingredient_type:
-        pizzas = pizzas.filter(ingredients__type=ingredient_type)
-
-    pizzas = pizzas.select_related('category').prefetch_related('ingredients', 'custom_images').distinct()
-    return pizzas
+@decorate_view(conditional_response("pizzas:filter", pizzas_state))
+@decorate_view(cached_response("pizzas:filter"))
+@paginate(CursorPagination, orderings=PIZZA_ORDERINGS, prepare=attach_category_subtrees)
+def filter_pizzas(request, filters: PizzaFilterSchema = Query(...)):
+    # Ex. : ?max_price=12&vegetarian=true&allergen_free=Gluten,Lactose&category=3
+    return filtered_pizzas(filters).for_read()
 
 
 @router.post("/{pizza_id}/clone/", response=PizzaSchema)
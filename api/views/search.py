@@ -0,0 +1,27 @@
+from ninja import Router
+from ninja.decorators import decorate_view
+
+from api.cache import cached_response
+from api.exception import BadRequestError
+from api.schemas.search import SearchResultSchema
+from api.search import ENTITY_CODES, search
+
+router = Router()
+
+MAX_RESULTS = 100
+
+
+@router.get("/", response=list[SearchResultSchema])
+@decorate_view(cached_response("search"))
+def search_catalog(request, q: str, types: str = None, limit: int = 20):
+    entities = None
+    if types:
+        entities = [entity.strip() for entity in types.split(',') if entity.strip()]
+        unknown = set(entities) - set(ENTITY_CODES)
+        if unknown:
+            raise BadRequestError(f"Unknown types: {', '.join(sorted(unknown))}")
+    hits = search(q, entities, min(max(limit, 1), MAX_RESULTS))
+    return [
+        {"type": hit.entity, "id": hit.object_id, "name": hit.name, "score": hit.score}
+        for hit in hits
+    ]
@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'api.middleware.LogRequestsMiddleware',
+    'user_auth.ratelimit.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'api_pizza_django.urls'
@@ -141,9 +144,139 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cursor pagination of the list endpoints (api/pagination.py)
+NINJA_PAGINATION_PER_PAGE = config('PAGINATION_PER_PAGE', default=50, cast=int)
+NINJA_PAGINATION_MAX_LIMIT = config('PAGINATION_MAX_LIMIT', default=200, cast=int)
+
+# Response cache of the catalog read endpoints (api/cache.py).
+# 'api.cache.LRUBackend' keeps entries per process, 'api.cache.DjangoCacheBackend' shares them
+# through CACHES[ALIAS]. Both read the catalog version from CACHES[ALIAS]: it must be shared
+# (Redis, Memcached...) for a write to invalidate the other workers, otherwise their entries
+# are served for up to TIMEOUT seconds.
+CATALOG_CACHE = {
+    'BACKEND': config('CATALOG_CACHE_BACKEND', default='api.cache.LRUBackend'),
+    'MAX_ENTRIES': config('CATALOG_CACHE_MAX_ENTRIES', default=512, cast=int),
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+# Largest batch accepted by POST /api/pizzas/bulk and /api/ingredients/bulk (api/bulk.py).
+BULK_MAX_ITEMS = config('BULK_MAX_ITEMS', default=1000, cast=int)
+
+# Records per transaction of POST /api/import/{entity} (api/catalog_import.py).
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+
+# ETag / Last-Modified validation and 304 answers on catalog GETs (api/conditional.py).
+CONDITIONAL_REQUESTS = config('CONDITIONAL_REQUESTS', default=True, cast=bool)
+
+# Serve list/detail pizza reads from the PizzaDocument read model (api/read_model.py).
+# Run `manage.py rebuild_pizza_documents` once before turning it on.
+PIZZA_READ_MODEL = config('PIZZA_READ_MODEL', default=False, cast=bool)
+
+# Full-text search index (api/search.py). Empty: FTS5 when available, else the in-process index.
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='')
+
+# Mount the native async catalog reads under /api/async/ (api/views/catalog_async.py),
+# for ASGI deployments (uvicorn api_pizza_django.asgi:application). They do not raise the
+# throughput of CPU-bound pages, see benchmarks/results/concurrency.txt.
+ASYNC_CATALOG_VIEWS = config('ASYNC_CATALOG_VIEWS', default=False, cast=bool)
+
+# Background image processing (api/image_processing.py), run with `manage.py process_images`.
+# Derivatives are written under MEDIA_ROOT/derivatives/<name>/, bounded to the given width.
+IMAGE_PROCESSING = {
+    'WORKERS': config('IMAGE_WORKERS', default=2, cast=int),
+    'BATCH_SIZE': 20,
+    'POLL_INTERVAL': 2.0,
+    'MAX_ATTEMPTS': 3,
+    'STALE_AFTER': 600,
+    'MAX_SIZE': 800,
+    'DERIVATIVES': {
+        'thumbnail': 200,
+        'medium': 400,
+    },
+}
+
+# Responsive renditions served by /api/images/{id}/render (api/renditions.py). Requested widths
+# are rounded up to WIDTHS; AVIF is only used when Pillow can encode it. Rendered files are
+# kept under MEDIA_ROOT/CACHE_DIR and evicted least recently used first above CACHE_MAX_BYTES,
+# which bounds the whole directory: the workers share its size through a locked file.
+IMAGE_RENDITIONS = {
+    'WIDTHS': [160, 320, 480, 640, 800],
+    'FORMATS': ['jpeg', 'webp', 'avif'],
+    'QUALITY': 80,
+    'CACHE_DIR': 'renditions',
+    'CACHE_MAX_BYTES': config('RENDITIONS_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int),
+}
+
+# Request instrumentation (api/middleware.py): Server-Timing header and per-route histograms
+# of a SAMPLE_RATE fraction of the requests.
+INSTRUMENTATION = {
+    'ENABLED': config('INSTRUMENTATION_ENABLED', default=True, cast=bool),
+    'SAMPLE_RATE': config('INSTRUMENTATION_SAMPLE_RATE', default=1.0, cast=float),
+    'SERVER_TIMING': config('INSTRUMENTATION_SERVER_TIMING', default=True, cast=bool),
+}
+
+# Prometheus metrics served at /metrics (api/metrics.py). With MULTIPROCESS_DIR set, every
+# worker process writes its samples there every FLUSH_INTERVAL seconds and a scrape adds them up;
+# the directory must be shared by the workers and emptied when the service is redeployed.
+# Gauges read from the database are computed at most every FLUSH_INTERVAL seconds too.
+# Only the ALLOWED_IPS clients (REMOTE_ADDR, i.e. the proxy behind a reverse proxy) or the
+# requests sending "Authorization: Bearer <TOKEN>" may scrape /metrics.
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', default=True, cast=bool),
+    'MULTIPROCESS_DIR': config('METRICS_MULTIPROCESS_DIR', default=''),
+    'FLUSH_INTERVAL': config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float),
+    'ALLOWED_IPS': config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv()),
+    'TOKEN': config('METRICS_TOKEN', default=''),
+}
+
+# Daily quotas of user_auth/ratelimit.py: ServicePlan.max_requests_per_day, or
+# CustomUser.usage_quota for users without a plan. Counters live in the CACHE_ALIAS cache,
+# which must be shared (Redis, Memcached, file...) for the quota to span several processes.
+RATE_LIMIT = {
+    'ENABLED': config('RATE_LIMIT_ENABLED', default=True, cast=bool),
+    'ALGORITHM': config('RATE_LIMIT_ALGORITHM', default='sliding_window'),  # or 'token_bucket'
+    'PATHS': ['/api/', '/auth/'],
+    'WINDOW': 24 * 60 * 60,
+    'ANONYMOUS_LIMIT': config('RATE_LIMIT_ANONYMOUS', default=None, cast=lambda value: int(value) if value else None),
+    'CACHE_ALIAS': 'default',
+    'PLAN_CACHE_TTL': 60,
+    'FLUSH_INTERVAL': 10,  # seconds between the background writes of the request counts
+}
+
+# UserActivityLog rows are queued and written in batches by a background thread
+# (user_auth/activity_log.py). When the queue is full, the request writes its row itself.
+# The queue depth and the entry counts are published at /metrics (activity_log_*).
+ACTIVITY_LOG = {
+    'ASYNC': config('ACTIVITY_LOG_ASYNC', default=True, cast=bool),
+    'MAX_QUEUE_SIZE': 10_000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# X-API-Key authentication (user_auth/api_keys.py). Keys are resolved once per TTL and
+# cached under their SHA-256 in the CACHE_ALIAS cache, which may be per process: revoked
+# keys also go to the JWT revocation set, so every process rejects them within
+# JWT_SETTINGS['REVOCATION_REFRESH_INTERVAL'].
+API_KEY_AUTH = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 300,
+    'NEGATIVE_TTL': 30,
+}
+# Require an API key or a JWT on the catalog API.
+CATALOG_AUTH_REQUIRED = config('CATALOG_AUTH_REQUIRED', default=False, cast=bool)
+
 JWT_SETTINGS = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(days=7),
     'ALGORITHM': config('ALGORITHM'),
     'SIGNING_KEY': config('SECRET_KEY'),
+    # Revoked token ids are kept in memory (user_auth/revocation.py). Other processes see a
+    # revocation within REVOCATION_REFRESH_INTERVAL seconds.
+    'REVOCATION_REFRESH_INTERVAL': config('JWT_REVOCATION_REFRESH_INTERVAL', default=5, cast=int),
+    # Longest expected transaction: revocations committed this late are still picked up.
+    'REVOCATION_REFRESH_OVERLAP': 60,
+    'REVOCATION_REBUILD_INTERVAL': 3600,
+    'REVOCATION_BLOOM_CAPACITY': 100_000,
+    'REVOCATION_BLOOM_ERROR_RATE': 0.001,
 }
\ No newline at end of file
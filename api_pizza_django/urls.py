@@ -20,6 +20,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
 
+from api.views.metrics import metrics
+
 
 
 urlpatterns = [
@@ -27,6 +29,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/',include('user_auth.urls')),
     path('api/', include('api.urls')),
+    path('metrics', metrics, name='metrics'),
 
 ]
 
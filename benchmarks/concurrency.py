@@ -0,0 +1,80 @@
+"""
+Compares the throughput of catalog endpoints under increasing concurrency.
+
+Start the WSGI and ASGI servers side by side, then point the script at both:
+
+    python manage.py runserver 8000 --noreload
+    ASYNC_CATALOG_VIEWS=True uvicorn api_pizza_django.asgi:application --port 8001
+
+    python benchmarks/concurrency.py \\
+        http://127.0.0.1:8000/api/pizzas/ \\
+        http://127.0.0.1:8001/api/pizzas/ \\
+        http://127.0.0.1:8001/api/async/pizzas/ \\
+        --concurrency 1 8 32 64 --requests 500
+
+Set CATALOG_CACHE_MAX_ENTRIES=0 on the servers to measure the views rather than the cache.
+Recorded results are kept in benchmarks/results/concurrency.txt.
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        status = exc.code
+    except OSError:
+        status = None
+    return time.perf_counter() - started, status
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(url, concurrency, requests):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, [url] * requests))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, status in results if status == 200]
+    errors = len(results) - len(latencies)
+    if not latencies:
+        return {'rps': 0.0, 'p50': 0.0, 'p95': 0.0, 'errors': errors}
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'url':<50} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for url in args.urls:
+        for _ in range(args.warmup):
+            fetch(url)
+        for concurrency in args.concurrency:
+            result = run(url, concurrency, args.requests)
+            print(f"{url:<50} {concurrency:>5} {result['rps']:>9.1f} {result['p50']:>9.1f} "
+                  f"{result['p95']:>9.1f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Replays a weighted mix of API requests and reports latency, throughput and query
+counts per endpoint, optionally checked against a stored baseline.
+
+A scenario is a JSON lines file, one endpoint per line:
+
+    {"name": "pizzas.detail", "method": "GET", "path": "/api/pizzas/{pizza}", "weight": 5}
+
+``{pizza}``, ``{ingredient}``, ``{category}`` and ``{image}`` are replaced by random
+ids of the database; ``body`` (JSON) and ``status`` (expected, default: any status
+below 400) are optional.
+
+In-process, through the Django test client and the whole middleware stack, on a
+throwaway database seeded by ``manage.py seed_catalog``:
+
+    python benchmarks/replay.py benchmarks/scenarios/catalog.jsonl --seed --requests 2000
+
+Against a running server sharing the configured database (seeded beforehand with
+``manage.py seed_catalog``); query counts are read from its Server-Timing header:
+
+    python benchmarks/replay.py benchmarks/scenarios/catalog.jsonl \\
+        --target http://127.0.0.1:8000 --concurrency 8
+
+List endpoints are served from the catalog cache after the warmup; set
+CATALOG_CACHE_MAX_ENTRIES=0 to measure the views rather than the cache. The
+committed baselines are recorded that way, so that they catch N+1 queries the
+cache would hide.
+
+``--save-baseline FILE`` stores the results, ``--baseline FILE`` fails (exit status 1)
+when an endpoint runs more queries than in the baseline, or when its p95 latency
+grew by more than --tolerance. Latency baselines only compare runs made on the
+same machine; query counts compare anywhere, which is what the committed
+baselines are for (--ignore-latency):
+
+    CATALOG_CACHE_MAX_ENTRIES=0 python benchmarks/replay.py benchmarks/scenarios/catalog.jsonl \\
+        --seed --baseline benchmarks/baselines/catalog.json --ignore-latency
+
+Record them again (--save-baseline) in the change that alters a query count.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from concurrency import percentile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_pizza_django.settings')
+
+PLACEHOLDER = re.compile(r'\{(pizza|ingredient|category|image)\}')
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def load_scenario(path):
+    with open(path) as source:
+        endpoints = [json.loads(line) for line in source if line.strip()]
+    for endpoint in endpoints:
+        endpoint.setdefault('method', 'GET')
+        endpoint.setdefault('weight', 1)
+    return endpoints
+
+
+def load_ids():
+    from api.models.category import Category
+    from api.models.image import Image
+    from api.models.ingredients import Ingredient
+    from api.models.pizza import Pizza
+
+    return {
+        'pizza': list(Pizza.objects.filter(is_deleted=False).values_list('id', flat=True)),
+        'ingredient': list(Ingredient.objects.values_list('id', flat=True)),
+        'category': list(Category.objects.filter(is_deleted=False).values_list('id', flat=True)),
+        'image': list(Image.objects.filter(is_deleted=False).values_list('id', flat=True)),
+    }
+
+
+def build_plan(endpoints, ids, requests, warmup, rng):
+    """
+    Returns ``[(endpoint, path), ...]``: ``warmup`` requests of every endpoint, then
+    ``requests`` drawn by weight.
+    """
+
+    def fill(endpoint):
+        return PLACEHOLDER.sub(lambda match: str(rng.choice(ids[match.group(1)])), endpoint['path'])
+
+    warmups = [(endpoint, fill(endpoint)) for endpoint in endpoints for _ in range(warmup)]
+    chosen = rng.choices(endpoints, weights=[endpoint['weight'] for endpoint in endpoints], k=requests)
+    return warmups, [(endpoint, fill(endpoint)) for endpoint in chosen]
+
+
+class ClientTarget:
+    concurrent = False
+
+    def __init__(self, headers):
+        from django.test import Client
+
+        self.client = Client(**{f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()})
+
+    def send(self, endpoint, path):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        body = endpoint.get('body')
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(endpoint['method'], path, json.dumps(body) if body is not None else '',
+                                           content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return time.perf_counter() - started, response.status_code, len(queries)
+
+
+class HTTPTarget:
+    concurrent = True
+
+    def __init__(self, base_url, headers):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+
+    def send(self, endpoint, path):
+        body = endpoint.get('body')
+        request = urllib.request.Request(
+            self.base_url + path, method=endpoint['method'],
+            data=json.dumps(body).encode() if body is not None else None,
+            headers={'Content-Type': 'application/json', **self.headers})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as exc:
+            status, timing = exc.code, exc.headers.get('Server-Timing', '')
+        except OSError:
+            status, timing = None, ''
+        match = SERVER_TIMING_QUERIES.search(timing)
+        return time.perf_counter() - started, status, int(match.group(1)) if match else None
+
+
+def run(target, plan, concurrency):
+    def send(item):
+        endpoint, path = item
+        return endpoint['name'], endpoint.get('status'), target.send(endpoint, path)
+
+    started = time.perf_counter()
+    if target.concurrent and concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(send, plan))
+    else:
+        results = [send(item) for item in plan]
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    endpoints = {}
+    for name, expected, (latency, status, queries) in results:
+        entry = endpoints.setdefault(name, {'latencies': [], 'queries': [], 'errors': 0})
+        ok = status == expected if expected is not None else status is not None and status < 400
+        if not ok:
+            entry['errors'] += 1
+            continue
+        entry['latencies'].append(latency * 1000)
+        if queries is not None:
+            entry['queries'].append(queries)
+
+    report = {}
+    for name, entry in sorted(endpoints.items()):
+        latencies = entry['latencies'] or [0.0]
+        report[name] = {
+            'requests': len(entry['latencies']) + entry['errors'],
+            'errors': entry['errors'],
+            'p50': round(statistics.median(latencies), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'queries': max(entry['queries']) if entry['queries'] else None,
+        }
+    return {'elapsed': round(elapsed, 3), 'throughput': round(len(results) / elapsed, 1), 'endpoints': report}
+
+
+def print_report(summary):
+    print(f"{'endpoint':<32} {'reqs':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}")
+    for name, row in summary['endpoints'].items():
+        queries = '-' if row['queries'] is None else row['queries']
+        print(f"{name:<32} {row['requests']:>6} {row['errors']:>6} {row['p50']:>8.2f} {row['p95']:>8.2f} "
+              f"{row['p99']:>8.2f} {queries:>7}")
+    print(f"{sum(row['requests'] for row in summary['endpoints'].values())} requests in "
+          f"{summary['elapsed']:.2f}s, {summary['throughput']:.1f} req/s")
+
+
+def compare(summary, baseline, tolerance, min_delta, latency=True):
+    """
+    Returns the regressions of ``summary`` against ``baseline``, as messages.
+    """
+    regressions = []
+    for name, row in summary['endpoints'].items():
+        reference = baseline['endpoints'].get(name)
+        if reference is None:
+            continue
+        if row['errors'] > reference['errors']:
+            regressions.append(f"{name}: {row['errors']} errors, baseline {reference['errors']}")
+        if row['queries'] is not None and reference['queries'] is not None and row['queries'] > reference['queries']:
+            regressions.append(f"{name}: {row['queries']} queries, baseline {reference['queries']}")
+        limit = max(reference['p95'] * (1 + tolerance), reference['p95'] + min_delta)
+        if latency and row['p95'] > limit:
+            regressions.append(f"{name}: p95 {row['p95']:.2f}ms, baseline {reference['p95']:.2f}ms "
+                               f"(limit {limit:.2f}ms)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenario')
+    parser.add_argument('--target', default='client', help="'client' (in process) or the server's base URL.")
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per endpoint.")
+    parser.add_argument('--concurrency', type=int, default=1, help="Parallel requests, server target only.")
+    parser.add_argument('--seed', action='store_true',
+                        help="Client target: replay on a test database filled by seed_catalog.")
+    parser.add_argument('--pizzas', type=int, default=2000, help="Catalog size with --seed.")
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--header', action='append', default=[], help="'Name: value', e.g. an X-API-Key.")
+    parser.add_argument('--baseline', help="Fail on regressions against this file.")
+    parser.add_argument('--save-baseline', help="Write the results to this file.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 growth, as a fraction.")
+    parser.add_argument('--min-delta', type=float, default=2.0, help="p95 growth in ms always tolerated.")
+    parser.add_argument('--ignore-latency', action='store_true',
+                        help="Only check query counts and errors, for baselines made on another machine.")
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+    django.setup()
+    headers = dict(header.split(':', 1) for header in args.header)
+    headers = {name.strip(): value.strip() for name, value in headers.items()}
+    if args.target == 'client':
+        setup_test_environment()
+        target = ClientTarget(headers)
+    else:
+        target = HTTPTarget(args.target, headers)
+
+    databases = None
+    if args.seed:
+        databases = setup_databases(verbosity=0, interactive=False)
+        call_command('seed_catalog', pizzas=args.pizzas, verbosity=0, stdout=io.StringIO())
+    try:
+        rng = random.Random(args.random_seed)
+        warmups, plan = build_plan(load_scenario(args.scenario), load_ids(), args.requests, args.warmup, rng)
+        run(target, warmups, args.concurrency)
+        results, elapsed = run(target, plan, args.concurrency)
+    finally:
+        if databases is not None:
+            teardown_databases(databases, verbosity=0)
+
+    summary = summarize(results, elapsed)
+    # Query counts depend on the rows drawn: only runs with the same options compare.
+    summary['options'] = {'requests': args.requests, 'random_seed': args.random_seed,
+                          'pizzas': args.pizzas if args.seed else None,
+                          'catalog_cache': settings.CATALOG_CACHE['MAX_ENTRIES'] > 0}
+    print_report(summary)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as output:
+            json.dump(summary, output, indent=2)
+            output.write('\n')
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as source:
+            baseline = json.load(source)
+        if baseline.get('options') != summary['options']:
+            print(f"Warning: the baseline was made with {baseline.get('options')}, not {summary['options']}")
+        regressions = compare(summary, baseline, args.tolerance, args.min_delta, latency=not args.ignore_latency)
+        if regressions:
+            print(f"\n{len(regressions)} REGRESSIONS against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regression against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
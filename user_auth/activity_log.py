@@ -0,0 +1,158 @@
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from api.metrics import ACTIVITY_LOG_CAPACITY, ACTIVITY_LOG_ENTRIES, ACTIVITY_LOG_QUEUE
+
+from .models import UserActivityLog
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityLogWriter:
+    """
+    Buffers UserActivityLog rows in a bounded queue, written with bulk_create by a
+    background thread every ``flush_interval`` seconds or ``batch_size`` rows.
+    Nothing is dropped: when the queue is full the row is written synchronously by the
+    caller (backpressure), a failed batch is retried once row by row, and rows that
+    still fail are logged with their content. The queue is drained at exit.
+    """
+
+    def __init__(self, max_queue_size, batch_size, flush_interval, autostart=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.overflowed = 0
+        self.failed = 0
+        self.max_depth = 0
+        atexit.register(self.stop)
+
+    def log(self, user, action, ip_address=None, user_agent=None):
+        entry = UserActivityLog(user=user, action=action, ip_address=ip_address,
+                                user_agent=user_agent, timestamp=timezone.now())
+        if self.autostart:
+            self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.overflowed += 1
+            ACTIVITY_LOG_ENTRIES.inc(outcome='overflowed')
+            self._write([entry])
+            return
+        depth = self._queue.qsize()
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, depth)
+        ACTIVITY_LOG_ENTRIES.inc(outcome='enqueued')
+        ACTIVITY_LOG_QUEUE.set(depth)
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Writes everything queued so far, by batches. Returns the number of rows written.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    ACTIVITY_LOG_QUEUE.set(self._queue.qsize())
+                    return written
+                written += self._write(batch)
+
+    def _write(self, entries):
+        try:
+            UserActivityLog.objects.bulk_create(entries)
+            written = len(entries)
+        except Exception:
+            logger.exception("Bulk write of %s activity log entries failed, retrying one by one", len(entries))
+            written = 0
+            for entry in entries:
+                try:
+                    entry.save()
+                    written += 1
+                except Exception:
+                    with self._lock:
+                        self.failed += 1
+                    ACTIVITY_LOG_ENTRIES.inc(outcome='failed')
+                    logger.exception("Lost activity log entry: user=%s action=%s ip=%s at %s",
+                                     entry.user_id, entry.action, entry.ip_address, entry.timestamp)
+        with self._lock:
+            self.written += written
+        ACTIVITY_LOG_ENTRIES.inc(written, outcome='written')
+        return written
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'max_depth': self.max_depth,
+                'capacity': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'overflowed': self.overflowed,
+                'failed': self.failed,
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_activity_log_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                options = settings.ACTIVITY_LOG
+                _writer = ActivityLogWriter(
+                    max_queue_size=options['MAX_QUEUE_SIZE'],
+                    batch_size=options['BATCH_SIZE'],
+                    flush_interval=options['FLUSH_INTERVAL'],
+                )
+                ACTIVITY_LOG_CAPACITY.set(options['MAX_QUEUE_SIZE'])
+    return _writer
@@ -0,0 +1,94 @@
+import hashlib
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from api.metrics import CACHE_REQUESTS
+
+from .models import APIKey, CustomUser
+from .revocation import is_revoked, revoke
+
+
+@dataclass(frozen=True)
+class APIKeyIdentity:
+    user_id: int
+    key_id: Optional[int]  # None for CustomUser.api_key
+    expires_at: Optional[datetime]
+
+
+def _cache():
+    return caches[settings.API_KEY_AUTH['CACHE_ALIAS']]
+
+
+def cache_key(raw_key):
+    # Only a digest of the key is kept in the cache.
+    return 'apikey:' + hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+def revocation_id(raw_key):
+    # RevokedToken.jti holds 64 characters.
+    return cache_key(raw_key)[:64]
+
+
+def _load(raw_key):
+    """
+    Resolves a key from the database: an active APIKey first, then the user's own key.
+    """
+    row = (APIKey.objects.filter(key=raw_key, is_active=True, user__is_active=True)
+           .values_list('user_id', 'id', 'expires_at').first())
+    if row is not None:
+        return APIKeyIdentity(*row)
+    row = (CustomUser.objects.filter(api_key=raw_key, is_active=True)
+           .values_list('id', 'api_key_expires_at').first())
+    if row is not None:
+        return APIKeyIdentity(row[0], None, row[1])
+    return None
+
+
+def lookup(raw_key):
+    """
+    Returns the identity of a valid, unexpired key, or None. Results, unknown keys
+    included, are cached under the key's SHA-256 for API_KEY_AUTH['TTL'] seconds
+    (NEGATIVE_TTL for unknown keys); expiration and revocation are still checked on
+    every call, in memory.
+    """
+    try:
+        uuid.UUID(raw_key)
+    except (TypeError, ValueError):
+        return None
+
+    options = settings.API_KEY_AUTH
+    key = cache_key(raw_key)
+    entry = _cache().get(key)
+    CACHE_REQUESTS.inc(cache='api_keys', result='miss' if entry is None else 'hit')
+    if entry is None:
+        identity = _load(raw_key)
+        entry = identity or False
+        _cache().set(key, entry, options['TTL'] if identity else options['NEGATIVE_TTL'])
+    if not entry or (entry.expires_at is not None and entry.expires_at <= timezone.now()):
+        return None
+    if is_revoked(revocation_id(raw_key)):
+        return None
+    return entry
+
+
+def invalidate(raw_key):
+    _cache().delete(cache_key(str(raw_key)))
+
+
+def revoke_key(api_key):
+    """
+    Deactivates an APIKey. Saving it evicts the key from the cache (signals.py), which
+    may be per process, so the key is also added to the revocation set, which the
+    other processes reload within JWT_SETTINGS['REVOCATION_REFRESH_INTERVAL']. It is
+    kept there for twice the cache TTL, longer than any entry cached before the
+    deactivation was committed.
+    """
+    api_key.is_active = False
+    api_key.save(update_fields=['is_active'])
+    revoke(revocation_id(str(api_key.key)), timezone.now() + timedelta(seconds=2 * settings.API_KEY_AUTH['TTL']))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_auth', '0004_alter_customuser_api_key_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=64, unique=True)),
+                ('revoked_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='refreshtoken',
+            name='jti',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
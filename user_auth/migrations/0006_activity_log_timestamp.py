@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 14:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_auth', '0005_token_revocation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivitylog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
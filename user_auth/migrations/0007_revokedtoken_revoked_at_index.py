@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_auth', '0006_activity_log_timestamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='revokedtoken',
+            name='revoked_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
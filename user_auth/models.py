@@ -66,6 +66,7 @@ class CustomUser(AbstractUser):
 
 class RefreshToken(models.Model):
     token = models.CharField(max_length=255, unique=True)
+    jti = models.CharField(max_length=64, unique=True, null=True, blank=True)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     revoked_at = models.DateTimeField(null=True, blank=True)
@@ -75,6 +76,19 @@ class RefreshToken(models.Model):
         return self.token
 
 
+class RevokedToken(models.Model):
+    """
+    Revoked JWT ids and API keys (api_keys.revocation_id), loaded incrementally (by
+    increasing id, and again for the recent ones) into the in-memory revocation set.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
 class UserActivityLog(models.Model):
     ACTION_CHOICES = [
         ('login', 'Login'),
@@ -84,7 +98,8 @@ class UserActivityLog(models.Model):
     ]
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens: rows are written later, in batches (activity_log.py).
+    timestamp = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.CharField(max_length=255, null=True, blank=True)
 
@@ -0,0 +1,265 @@
+import logging
+import math
+import threading
+import time
+
+import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Case, DateTimeField, F, IntegerField, Value, When
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .api_keys import lookup
+from .models import CustomUser
+from .revocation import is_revoked
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindow:
+    """
+    Sliding window counter: the count of the current fixed window plus the previous
+    window's, weighted by how much of it still overlaps the sliding window. Counters
+    are incremented with the cache's atomic ``incr``.
+    """
+
+    def __init__(self, cache, window):
+        self.cache = cache
+        self.window = window
+
+    def hit(self, key, limit, now):
+        index, offset = divmod(now, self.window)
+        current_key = f'ratelimit:{key}:{int(index)}'
+        previous = self.cache.get(f'ratelimit:{key}:{int(index) - 1}', 0)
+        self.cache.add(current_key, 0, self.window * 2)
+        current = self.cache.incr(current_key)
+        weight = 1 - offset / self.window
+        used = previous * weight + current
+        if used > limit:
+            # Undo the hit so that rejected requests do not consume the quota.
+            self.cache.decr(current_key)
+            # The estimate drops below the limit once enough of the previous window has slid out.
+            retry_after = self.window - offset if not previous else min(
+                self.window - offset, (used - limit) / previous * self.window)
+            return False, 0, max(1, math.ceil(retry_after))
+        return True, int(limit - used), math.ceil(self.window - offset)
+
+
+class TokenBucket:
+    """
+    Token bucket of ``limit`` tokens refilled evenly over the window, which allows
+    bursts up to the full quota. Read and written back without a lock, so concurrent
+    requests of the same client may occasionally both take the last token.
+    """
+
+    def __init__(self, cache, window):
+        self.cache = cache
+        self.window = window
+
+    def hit(self, key, limit, now):
+        cache_key = f'ratelimit:bucket:{key}'
+        rate = limit / self.window
+        tokens, updated_at = self.cache.get(cache_key, (limit, now))
+        tokens = min(limit, tokens + (now - updated_at) * rate)
+        if tokens < 1:
+            self.cache.set(cache_key, (tokens, now), self.window)
+            return False, 0, max(1, math.ceil((1 - tokens) / rate))
+        tokens -= 1
+        self.cache.set(cache_key, (tokens, now), self.window)
+        return True, int(tokens), math.ceil((limit - tokens) / rate)
+
+
+ALGORITHMS = {
+    'sliding_window': SlidingWindow,
+    'token_bucket': TokenBucket,
+}
+
+
+class PlanLimits:
+    """
+    Per-process cache of each user's daily quota, so that the limiter only reads the
+    user and its plan once every ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._limits = {}
+
+    def get(self, user_id, now):
+        entry = self._limits.get(user_id)
+        if entry is None or entry[1] < now:
+            row = (CustomUser.objects.filter(id=user_id)
+                   .values_list('service_plan__max_requests_per_day', 'usage_quota').first())
+            limit = None if row is None else (row[0] if row[0] is not None else row[1])
+            entry = (limit, now + self.ttl)
+            self._limits[user_id] = entry
+        return entry[0]
+
+
+class UsageRecorder:
+    """
+    Counts requests per user in memory and writes them to CustomUser in one UPDATE per
+    flush, every ``interval`` seconds from a background thread, instead of one row
+    write per request. Counts recorded since the last flush are lost if the process
+    dies.
+    """
+
+    def __init__(self, interval, autostart=True):
+        self.interval = interval
+        self.autostart = autostart
+        self._counts = {}
+        self._last_requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def record(self, user_id):
+        if self.autostart:
+            self._ensure_started()
+        with self._lock:
+            self._counts[user_id] = self._counts.get(user_id, 0) + 1
+            self._last_requests[user_id] = timezone.now()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name='usage-recorder', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.wait(self.interval):
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Flushing the request counts failed")
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            last_requests, self._last_requests = self._last_requests, {}
+        if not counts:
+            return 0
+        increment = Case(*(When(id=user_id, then=Value(count)) for user_id, count in counts.items()),
+                         default=Value(0), output_field=IntegerField())
+        last_request_time = Case(*(When(id=user_id, then=Value(last)) for user_id, last in last_requests.items()),
+                                 default=F('last_request_time'), output_field=DateTimeField())
+        return CustomUser.objects.filter(id__in=counts).update(
+            request_count=F('request_count') + increment,
+            last_request_time=last_request_time,
+        )
+
+
+def identify(request):
+    """
+    Returns ``(key, user_id)`` of the client: the user of a valid API key, bearer token
+    or session, ``(None, None)`` for anonymous requests. Revoked tokens are anonymous,
+    as for JWTAuth.
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        identity = lookup(api_key)
+        if identity is not None:
+            return f'user:{identity.user_id}', identity.user_id
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        try:
+            payload = jwt.decode(header[7:], settings.JWT_SETTINGS['SIGNING_KEY'],
+                                 algorithms=[settings.JWT_SETTINGS['ALGORITHM']])
+            if not is_revoked(payload.get('jti'), payload.get('sid')):
+                return f"user:{payload['user_id']}", payload['user_id']
+        except (jwt.InvalidTokenError, KeyError):
+            pass
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}', user.pk
+    return None, None
+
+
+class RateLimitMiddleware:
+    """
+    Enforces ServicePlan.max_requests_per_day (CustomUser.usage_quota without a plan)
+    on the paths listed in settings.RATE_LIMIT, and RATE_LIMIT['ANONYMOUS_LIMIT'] per
+    address for anonymous clients.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = settings.RATE_LIMIT
+        self.enabled = options['ENABLED']
+        self.paths = tuple(options['PATHS'])
+        self.window = options['WINDOW']
+        self.anonymous_limit = options['ANONYMOUS_LIMIT']
+        self.algorithm = ALGORITHMS[options['ALGORITHM']](caches[options['CACHE_ALIAS']], self.window)
+        self.limits = PlanLimits(options['PLAN_CACHE_TTL'])
+        self.usage = UsageRecorder(options['FLUSH_INTERVAL'])
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled or not request.path.startswith(self.paths):
+            return self.get_response(request)
+
+        rejection, headers = self.admit(request)
+        response = rejection or self.get_response(request)
+        return self.add_headers(response, headers)
+
+    async def __acall__(self, request):
+        if not self.enabled or not request.path.startswith(self.paths):
+            return await self.get_response(request)
+
+        # The plan lookup and the counters hit the database and the cache.
+        rejection, headers = await sync_to_async(self.admit)(request)
+        response = rejection or await self.get_response(request)
+        return self.add_headers(response, headers)
+
+    def admit(self, request):
+        """
+        Counts the request against its quota. Returns the 429 response to send instead
+        of the view's, if any, and the X-RateLimit-* headers (None when unlimited).
+        """
+        now = time.time()
+        key, user_id = identify(request)
+        limit = None if user_id is None else self.limits.get(user_id, now)
+        if limit is None:
+            # Anonymous, or a token of a user that no longer exists.
+            key, user_id, limit = f"ip:{request.META.get('REMOTE_ADDR')}", None, self.anonymous_limit
+        if limit is None:
+            return None, None
+
+        allowed, remaining, reset = self.algorithm.hit(key, limit, now)
+        headers = {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(reset),
+        }
+        if not allowed:
+            response = JsonResponse({"detail": "Rate limit exceeded"}, status=429)
+            response['Retry-After'] = str(reset)
+            return response, headers
+        if user_id is not None:
+            self.usage.record(user_id)
+        return None, headers
+
+    @staticmethod
+    def add_headers(response, headers):
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
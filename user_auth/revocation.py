@@ -0,0 +1,132 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: no false negatives, false positives at
+    about ``error_rate`` once ``capacity`` items have been added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationSet:
+    """
+    In-memory copy of the RevokedToken table. Lookups never query the database: the
+    set is refreshed with the rows added since the last refresh at most once every
+    ``refresh_interval`` seconds, which bounds how long another process can keep
+    accepting a revoked token. Rows revoked within ``refresh_overlap`` seconds of the
+    last refresh are read again, for the transactions committed after a row with a
+    higher id. The Bloom filter answers for the vast majority of tokens, which are not
+    revoked, and the exact set rules out its false positives.
+    """
+
+    def __init__(self, capacity, error_rate, refresh_interval, rebuild_interval, refresh_overlap=60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.refresh_overlap = timedelta(seconds=refresh_overlap)
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.revoked = {}
+        self.last_id = 0
+        self.loaded_until = None
+        self.refreshed_at = None
+        self.rebuilt_at = time.monotonic()
+
+    def _add(self, jti, expires_at):
+        self.bloom.add(jti)
+        self.revoked[jti] = expires_at
+
+    def refresh(self):
+        """
+        Loads the revocations added since the last refresh. Expired entries cannot be
+        removed from the Bloom filter, so the whole set is reloaded every
+        ``rebuild_interval`` seconds instead.
+        """
+        with self._lock:
+            if time.monotonic() - self.rebuilt_at > self.rebuild_interval:
+                self._reset()
+            now = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gt=now)
+            if self.loaded_until is not None:
+                rows = rows.filter(Q(id__gt=self.last_id) | Q(revoked_at__gte=self.loaded_until - self.refresh_overlap))
+            for row_id, jti, expires_at in rows.order_by('id').values_list('id', 'jti', 'expires_at'):
+                self._add(jti, expires_at)
+                self.last_id = max(self.last_id, row_id)
+            self.loaded_until = now
+            self.refreshed_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at > self.refresh_interval:
+            self.refresh()
+        if jti not in self.bloom:
+            return False
+        expires_at = self.revoked.get(jti)
+        return expires_at is not None and expires_at > timezone.now()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._add(jti, expires_at)
+
+
+_revocation_set = None
+
+
+def get_revocation_set():
+    global _revocation_set
+    if _revocation_set is None:
+        options = settings.JWT_SETTINGS
+        _revocation_set = RevocationSet(
+            capacity=options['REVOCATION_BLOOM_CAPACITY'],
+            error_rate=options['REVOCATION_BLOOM_ERROR_RATE'],
+            refresh_interval=options['REVOCATION_REFRESH_INTERVAL'],
+            rebuild_interval=options['REVOCATION_REBUILD_INTERVAL'],
+            refresh_overlap=options['REVOCATION_REFRESH_OVERLAP'],
+        )
+    return _revocation_set
+
+
+def is_revoked(*jtis):
+    revocations = get_revocation_set()
+    return any(jti is not None and revocations.is_revoked(jti) for jti in jtis)
+
+
+def revoke(jti, expires_at):
+    """
+    Records the revocation of a token until it expires. It applies at once in this
+    process, and in the others at their next refresh.
+    """
+    RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+    transaction.on_commit(lambda: get_revocation_set().add(jti, expires_at))
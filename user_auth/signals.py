@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .api_keys import invalidate
+from .models import APIKey, CustomUser
+
+
+@receiver(post_save, sender=APIKey)
+@receiver(post_delete, sender=APIKey)
+def invalidate_api_key(sender, instance, **kwargs):
+    invalidate(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_api_key(sender, instance, **kwargs):
+    # Covers deactivated users; their APIKey rows expire from the cache after API_KEY_AUTH['TTL'].
+    invalidate(instance.api_key)
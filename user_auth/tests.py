@@ -1,3 +1,289 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from ninja import NinjaAPI, Router
+from ninja.decorators import decorate_view
+from ninja.errors import HttpError
+from ninja.testing import TestAsyncClient, TestClient
+
+from api.cache import cached_response
+from api.conditional import conditional_response, pizzas_state
+from api.metrics import ACTIVITY_LOG_ENTRIES, ACTIVITY_LOG_QUEUE, get_registry
+
+from .activity_log import ActivityLogWriter
+from .api_keys import cache_key, revoke_key
+from .models import APIKey, CustomUser, RevokedToken, ServicePlan, UserActivityLog
+from .ratelimit import RateLimitMiddleware, TokenBucket, UsageRecorder, identify
+from .revocation import BloomFilter, get_revocation_set
+from .security import APIKeyAuth, AsyncAPIKeyAuth, AsyncJWTAuth, JWTAuth
+from .views import create_access_token, create_refresh_token, revoke_refresh_token
+
+
+# A catalog read behind CATALOG_AUTH_REQUIRED, which the shared test API is built without.
+protected_router = Router()
+protected_async_router = Router()
+
+
+@protected_router.get("/", response=list[str])
+@decorate_view(conditional_response("auth-test:sync", pizzas_state))
+@decorate_view(cached_response("auth-test:sync"))
+def protected_list(request):
+    return ['Margherita']
+
+
+@protected_async_router.get("/", response=list[str])
+@decorate_view(conditional_response("auth-test:async", pizzas_state))
+@decorate_view(cached_response("auth-test:async"))
+async def protected_async_list(request):
+    return ['Margherita']
+
+
+protected_api = NinjaAPI(auth=[APIKeyAuth(), JWTAuth()], urls_namespace='auth-test')
+protected_api.add_router("/", protected_router)
+protected_async_api = NinjaAPI(auth=[AsyncAPIKeyAuth(), AsyncJWTAuth()], urls_namespace='auth-test-async')
+protected_async_api.add_router("/", protected_async_router)
+protected_client = TestClient(protected_api)
+protected_async_client = TestAsyncClient(protected_async_api)
+
+
+class BloomFilterTest(TestCase):
+    def test_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f'token-{index}' for index in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+        false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TokenRevocationTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='revocation', email='revocation@example.com')
+        self.revocations = get_revocation_set()
+        self.revocations._reset()
+        self.auth = JWTAuth()
+
+    def decode(self, token):
+        return jwt.decode(token, settings.JWT_SETTINGS['SIGNING_KEY'], algorithms=[settings.JWT_SETTINGS['ALGORITHM']])
+
+    def test_authentication_does_not_query_the_database(self):
+        token = create_access_token(self.user.id, 'session')
+        self.revocations.refresh()
+
+        with self.assertNumQueries(0):
+            payload = self.auth.authenticate(None, token)
+        self.assertEqual(payload['user_id'], self.user.id)
+
+    def test_revoked_session_rejects_its_access_tokens(self):
+        refresh_token = create_refresh_token(self.user)
+        access_token = create_access_token(self.user.id, refresh_token.jti)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_refresh_token(refresh_token)
+
+        with self.assertRaises(HttpError) as error:
+            self.auth.authenticate(None, access_token)
+        self.assertEqual(error.exception.status_code, 401)
+
+    def test_revocations_from_other_processes_are_loaded_incrementally(self):
+        token = create_access_token(self.user.id)
+        self.revocations.refresh()
+        RevokedToken.objects.create(jti=self.decode(token)['jti'], expires_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertFalse(self.revocations.is_revoked(self.decode(token)['jti']))
+        self.revocations.refreshed_at -= settings.JWT_SETTINGS['REVOCATION_REFRESH_INTERVAL'] + 1
+        self.assertTrue(self.revocations.is_revoked(self.decode(token)['jti']))
+        with self.assertRaises(HttpError):
+            self.auth.authenticate(None, token)
+
+    def test_rows_committed_out_of_id_order_are_loaded(self):
+        expires_at = timezone.now() + timedelta(minutes=5)
+        later = RevokedToken.objects.create(id=10, jti='later', expires_at=expires_at)
+        self.revocations.refresh()
+        # Inserted before `later`, but committed after the refresh.
+        RevokedToken.objects.create(id=9, jti='earlier', expires_at=expires_at)
+
+        self.revocations.refresh()
+        self.assertTrue(self.revocations.is_revoked('earlier'))
+        self.assertEqual(self.revocations.last_id, later.id)
+
+
+@override_settings(RATE_LIMIT={**settings.RATE_LIMIT, 'ENABLED': True, 'ALGORITHM': 'sliding_window'})
+class RateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        plan = ServicePlan.objects.create(name='tiny', max_requests_per_day=3)
+        self.user = CustomUser.objects.create(username='ratelimited', email='ratelimited@example.com',
+                                              service_plan=plan)
+        self.middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        self.middleware.usage.autostart = False
+        self.factory = RequestFactory()
+
+    def get(self):
+        token = create_access_token(self.user.id)
+        return self.middleware(self.factory.get('/api/pizzas/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    def test_plan_quota_is_enforced(self):
+        responses = [self.get() for _ in range(4)]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200, 429])
+        self.assertEqual(responses[0]['X-RateLimit-Limit'], '3')
+        self.assertEqual(responses[2]['X-RateLimit-Remaining'], '0')
+        self.assertGreaterEqual(int(responses[3]['Retry-After']), 1)
+
+    def test_usage_is_flushed_in_one_update(self):
+        for _ in range(3):
+            self.get()
+
+        with self.assertNumQueries(1):
+            self.middleware.usage.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.request_count, 3)
+        self.assertIsNotNone(self.user.last_request_time)
+
+    def test_usage_is_flushed_by_a_background_thread(self):
+        recorder = UsageRecorder(interval=0.01)
+        flushed = threading.Event()
+        with mock.patch.object(recorder, 'flush', side_effect=flushed.set):
+            recorder.record(self.user.id)
+            self.assertTrue(flushed.wait(5))
+            recorder.stop()
+        self.assertFalse(recorder._thread.is_alive())
+
+    def test_revoked_tokens_count_as_anonymous(self):
+        token = create_access_token(self.user.id, 'revoked-session')
+        revocations = get_revocation_set()
+        revocations._reset()
+        revocations.add('revoked-session', timezone.now() + timedelta(hours=1))
+
+        request = self.factory.get('/api/pizzas/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(identify(request), (None, None))
+        self.assertNotIn('X-RateLimit-Limit', self.middleware(request))
+
+    def test_token_bucket_refills_over_the_window(self):
+        bucket = TokenBucket(cache, window=10)
+
+        self.assertTrue(all(bucket.hit('client', 2, 100.0)[0] for _ in range(2)))
+        self.assertEqual(bucket.hit('client', 2, 100.0), (False, 0, 5))
+        self.assertTrue(bucket.hit('client', 2, 105.0)[0])
+
+
+class ActivityLogWriterTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='activity', email='activity@example.com')
+
+    def test_entries_are_written_in_batches(self):
+        writer = ActivityLogWriter(max_queue_size=100, batch_size=10, flush_interval=1, autostart=False)
+        for _ in range(25):
+            writer.log(self.user, 'login', ip_address='127.0.0.1')
+
+        self.assertEqual(UserActivityLog.objects.count(), 0)
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 25)
+        self.assertEqual(UserActivityLog.objects.filter(user=self.user, action='login').count(), 25)
+        self.assertEqual(writer.stats()['written'], 25)
+
+    def test_overflow_is_written_synchronously(self):
+        writer = ActivityLogWriter(max_queue_size=2, batch_size=10, flush_interval=1, autostart=False)
+        for _ in range(5):
+            writer.log(self.user, 'logout')
+
+        self.assertEqual(UserActivityLog.objects.count(), 3)
+        self.assertEqual(writer.stats()['overflowed'], 3)
+        writer.flush()
+        self.assertEqual(UserActivityLog.objects.count(), 5)
+
+    def test_counts_are_published_as_metrics(self):
+        before = ACTIVITY_LOG_ENTRIES.collect()
+        writer = ActivityLogWriter(max_queue_size=2, batch_size=10, flush_interval=1, autostart=False)
+        for _ in range(3):
+            writer.log(self.user, 'login')
+        self.assertEqual(ACTIVITY_LOG_QUEUE.collect(), {(): 2})
+        writer.flush()
+
+        after = ACTIVITY_LOG_ENTRIES.collect()
+        delta = {outcome: after.get((outcome,), 0) - before.get((outcome,), 0)
+                 for outcome in ('enqueued', 'overflowed', 'written', 'failed')}
+        self.assertEqual(delta, {'enqueued': 2, 'overflowed': 1, 'written': 3, 'failed': 0})
+        self.assertEqual(ACTIVITY_LOG_QUEUE.collect(), {(): 0})
+        self.assertIn('activity_log_entries_total{outcome="written"}', get_registry().expose())
+
+
+class APIKeyAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='machine', email='machine@example.com')
+        self.api_key = APIKey.objects.create(user=self.user)
+        self.auth = APIKeyAuth()
+        self.request = RequestFactory().get('/api/pizzas/')
+
+    def test_valid_keys_are_served_from_the_cache(self):
+        self.assertEqual(self.auth.authenticate(self.request, str(self.api_key.key)).user_id, self.user.id)
+
+        with self.assertNumQueries(0):
+            identity = self.auth.authenticate(self.request, str(self.api_key.key))
+        self.assertEqual(identity.key_id, self.api_key.id)
+        self.assertEqual(self.request.user.username, 'machine')
+
+    def test_revoked_keys_are_evicted(self):
+        self.auth.authenticate(self.request, str(self.api_key.key))
+        self.api_key.is_active = False
+        self.api_key.save()
+
+        self.assertIsNone(self.auth.authenticate(self.request, str(self.api_key.key)))
+
+    def test_revoked_keys_are_rejected_by_other_processes(self):
+        revocations = get_revocation_set()
+        revocations._reset()
+        revocations.refresh()
+        self.auth.authenticate(self.request, str(self.api_key.key))
+        stale = cache.get(cache_key(str(self.api_key.key)))
+
+        revoke_key(self.api_key)
+        # Another process still holds the key in its own cache until its next refresh.
+        cache.set(cache_key(str(self.api_key.key)), stale)
+        revocations.refreshed_at -= settings.JWT_SETTINGS['REVOCATION_REFRESH_INTERVAL'] + 1
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.auth.authenticate(self.request, str(self.api_key.key)))
+
+    def test_expired_and_unknown_keys_are_rejected(self):
+        self.api_key.expires_at = timezone.now() - timedelta(seconds=1)
+        self.api_key.save()
+
+        self.assertIsNone(self.auth.authenticate(self.request, str(self.api_key.key)))
+        self.assertIsNone(self.auth.authenticate(self.request, 'not-a-key'))
+        self.assertEqual(self.auth.authenticate(self.request, str(self.user.api_key)).key_id, None)
+
+
+class CachedResponseAuthTest(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='machine', email='machine@example.com')
+        self.key = str(APIKey.objects.create(user=user).key)
+
+    def test_cache_hits_and_304_are_authenticated(self):
+        client = protected_client
+        response = client.get('/', headers={'X-API-Key': self.key})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/', headers={'X-API-Key': self.key})['X-Cache'], 'HIT')
+
+        response = client.get('/')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(response.has_header('X-Cache'))
+        response = client.get('/', META={'HTTP_IF_NONE_MATCH': response.get('ETag', '*')})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_async_cache_hits_are_authenticated(self):
+        client = protected_async_client
+        response = await client.get('/', headers={'X-API-Key': self.key})
+        self.assertEqual(response.status_code, 200)
+        response = await client.get('/')
+        self.assertEqual(response.status_code, 401)
@@ -1,11 +1,17 @@
 import jwt
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.contrib.auth.hashers import make_password
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
+from django.utils import timezone
 from ninja import Router
 from ninja.errors import HttpError
+from api.metrics import AUTH_FAILURES
 from .models import CustomUser, RefreshToken, APIKey, UserActivityLog, ServicePlan, UserSession, UserNotification
+from .activity_log import get_activity_log_writer
+from .api_keys import revoke_key
+from .revocation import revoke
 from .schemas import UserSchema, UserCreateSchema, TokenSchema, RefreshTokenSchema, APIKeySchema, UserActivityLogSchema, \
     UserSessionSchema, UserNotificationSchema, ServicePlanSchema
 
@@ -13,31 +19,48 @@ router = Router()
 
 
 def log_user_activity(user, action, request):
-    UserActivityLog.objects.create(
+    entry = dict(
         user=user,
         action=action,
         ip_address=request.META.get('REMOTE_ADDR'),
         user_agent=request.META.get('HTTP_USER_AGENT'),
     )
+    if settings.ACTIVITY_LOG['ASYNC']:
+        # Écrit par lots en arrière-plan (activity_log.py).
+        get_activity_log_writer().log(**entry)
+    else:
+        UserActivityLog.objects.create(**entry)
 
 
-def create_access_token(user_id: int):
+def create_access_token(user_id: int, session_id: str = None):
     payload = {
         'user_id': user_id,
+        'jti': uuid.uuid4().hex,
+        'sid': session_id,  # jti du refresh token dont il est issu
         'exp': datetime.utcnow() + settings.JWT_SETTINGS['ACCESS_TOKEN_LIFETIME'],
         'iat': datetime.utcnow(),
     }
-    return jwt.encode(payload, settings.JWT_SETTINGS['SECRET_KEY'])
+    return jwt.encode(payload, settings.JWT_SETTINGS['SIGNING_KEY'], algorithm=settings.JWT_SETTINGS['ALGORITHM'])
 
 
 def create_refresh_token(user):
+    jti = uuid.uuid4().hex
+    expires_at = datetime.now(dt_timezone.utc) + settings.JWT_SETTINGS['REFRESH_TOKEN_LIFETIME']
     token = jwt.encode({
         'user_id': user.id,
-        'exp': datetime.utcnow() + settings.JWT_SETTINGS['REFRESH_TOKEN_LIFETIME'],
+        'jti': jti,
+        'exp': expires_at,
         'iat': datetime.utcnow(),
-    }, settings.JWT_SETTINGS['SECRET_KEY'], algorithm=settings.JWT_SETTINGS['ALGORITHM'])
-    RefreshToken.objects.create(user=user, token=token)
-    return token
+    }, settings.JWT_SETTINGS['SIGNING_KEY'], algorithm=settings.JWT_SETTINGS['ALGORITHM'])
+    return RefreshToken.objects.create(user=user, token=token, jti=jti, expires_at=expires_at)
+
+
+def revoke_refresh_token(refresh_token_obj):
+    refresh_token_obj.revoked_at = timezone.now()
+    refresh_token_obj.save(update_fields=['revoked_at'])
+    if refresh_token_obj.jti:
+        # Révoque aussi les access tokens émis avec ce refresh token.
+        revoke(refresh_token_obj.jti, refresh_token_obj.expires_at)
 
 
 @router.post("/", response=UserSchema)
@@ -61,13 +84,14 @@ def register(request, data: UserCreateSchema):
 def login(request, data: UserSessionSchema):
     user = authenticate(username=data.username, password=data.password)
     if not user:
+        AUTH_FAILURES.inc(scheme='password', reason='invalid_credentials')
         raise HttpError(401, "Invalid credentials")
 
-    access_token = create_access_token(user.id)
     refresh_token = create_refresh_token(user)
+    access_token = create_access_token(user.id, refresh_token.jti)
     log_user_activity(user, 'login', request)
 
-    return {"access_token": access_token, "refresh_token": refresh_token}
+    return {"access_token": access_token, "refresh_token": refresh_token.token}
 
 
 @router.post("/refresh", response=TokenSchema)
@@ -75,22 +99,24 @@ def token_refresh(request, data: RefreshTokenSchema):
     try:
         payload = jwt.decode(data.refresh_token, settings.JWT_SETTINGS['SIGNING_KEY'],
                              algorithms=[settings.JWT_SETTINGS['ALGORITHM']])
-        refresh_token_obj = RefreshToken.objects.filter(token=data.refresh_token, revoked=False).first()
+        refresh_token_obj = RefreshToken.objects.filter(token=data.refresh_token, revoked_at__isnull=True).first()
         if not refresh_token_obj or payload['user_id'] != refresh_token_obj.user_id:
+            AUTH_FAILURES.inc(scheme='refresh_token', reason='revoked')
             raise HttpError(401, "Invalid refresh token")
 
-        refresh_token_obj.revoked = True
-        refresh_token_obj.save()
+        revoke_refresh_token(refresh_token_obj)
 
         new_refresh_token = create_refresh_token(refresh_token_obj.user)
 
-        access_token = create_access_token(payload['user_id'])
+        access_token = create_access_token(payload['user_id'], new_refresh_token.jti)
         log_user_activity(refresh_token_obj.user, 'token_refresh', request)
 
-        return {"access_token": access_token, "refresh_token": new_refresh_token}
+        return {"access_token": access_token, "refresh_token": new_refresh_token.token}
     except jwt.ExpiredSignatureError:
+        AUTH_FAILURES.inc(scheme='refresh_token', reason='expired')
         raise HttpError(401, "Refresh token has expired")
     except jwt.InvalidTokenError:
+        AUTH_FAILURES.inc(scheme='refresh_token', reason='invalid')
         raise HttpError(401, "Invalid token")
 
 
@@ -98,8 +124,7 @@ def token_refresh(request, data: RefreshTokenSchema):
 def logout(request, data: RefreshTokenSchema):
     try:
         refresh_token_obj = RefreshToken.objects.get(token=data.refresh_token)
-        refresh_token_obj.revoked = True
-        refresh_token_obj.save()
+        revoke_refresh_token(refresh_token_obj)
         log_user_activity(refresh_token_obj.user, 'logout', request)
         return {"detail": "Successfully logged out"}
     except RefreshToken.DoesNotExist:
@@ -128,8 +153,7 @@ def revoke_api_key(request, key_id: int):
     api_key = APIKey.objects.filter(id=key_id, user=request.user).first()
     if not api_key:
         raise HttpError(404, "API key not found")
-    api_key.is_active = False
-    api_key.save()
+    revoke_key(api_key)
     log_user_activity(request.user, 'api_key_revoke', request)
     return {"detail": "API key revoked"}
 